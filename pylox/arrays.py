@@ -0,0 +1,197 @@
+import math
+import operator
+from array import array
+
+from pylox.budget import allocate
+from pylox.error import LoxRuntimeError
+from pylox.native import native
+from pylox.values import stringify
+
+
+# shortest array worth handing to numpy; below this its per-call overhead
+# costs more than the python builtins
+NUMPY_MIN = 256
+
+# numpy when installed, imported the first time an array is long enough to
+# use it: importing it takes longer than starting pylox
+numpy = None
+_numpy_tried = False
+
+
+class LoxArray:
+    """
+    A fixed-size array of numbers, stored unboxed in a contiguous array('d')
+    buffer. Elements read back as plain floats, so the engines' number fast
+    paths apply to them. The bulk natives below run over whole buffers in
+    C: python builtins, or numpy (when installed) on long arrays, through
+    zero-copy views of the same buffers. Both give the same results.
+
+    Apart from array() itself, the natives working on arrays are named
+    array<Operation> (arrayGet, arraySum, ...), so scripts keep names like
+    `get`, `add` and `len` for their own functions and variables.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: array):
+        self.values = values
+
+    def __str__(self) -> str:
+        return "[" + ", ".join(stringify(value) for value in self.values) + "]"
+
+
+def _values(value: object) -> array:
+    if type(value) is not LoxArray:
+        raise LoxRuntimeError(None, "Expected an array.")
+    return value.values
+
+
+def _integer(value: object, message: str) -> int:
+    if type(value) is not float or not value.is_integer():
+        raise LoxRuntimeError(None, message)
+    return int(value)
+
+
+def _index(values: array, index: object) -> int:
+    i = _integer(index, "Index must be an integer.")
+    if not 0 <= i < len(values):
+        raise LoxRuntimeError(None, "Index out of range.")
+    return i
+
+
+def _pair(a: object, b: object) -> tuple[array, array]:
+    left, right = _values(a), _values(b)
+    if len(left) != len(right):
+        raise LoxRuntimeError(None, "Arrays must have the same length.")
+    return left, right
+
+
+def _uses_numpy(length: int) -> bool:
+    # whether to run arrays of this length on numpy
+    global numpy, _numpy_tried
+    if length < NUMPY_MIN:
+        return False
+    if not _numpy_tried:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        _numpy_tried = True
+    return numpy is not None
+
+
+def _zeros(n: int) -> array:
+    return array("d", bytes(8 * n))
+
+
+def _view(values: array):
+    return numpy.frombuffer(values, dtype=numpy.float64)
+
+
+def _fsum(values: array) -> float:
+    # exactly rounded, so the result does not depend on the order or the
+    # library the terms were produced by
+    try:
+        return math.fsum(values)
+    except (OverflowError, ValueError):
+        # infinities (or an overflowing intermediate): the plain sum gives
+        # the inf or nan lox arithmetic would
+        return float(sum(values))
+
+
+@native("array", 1)
+def array_(size: object) -> LoxArray:
+    n = _integer(size, "Array size must be a non-negative integer.")
+    if n < 0:
+        raise LoxRuntimeError(None, "Array size must be a non-negative integer.")
+    allocate(8 * n)
+    try:
+        return LoxArray(_zeros(n))
+    except (OverflowError, MemoryError):
+        raise LoxRuntimeError(None, "Array too large.")
+
+
+@native("arrayGet", 2)
+def get(a: object, index: object) -> float:
+    values = _values(a)
+    return values[_index(values, index)]
+
+
+@native("arraySet", 3)
+def set_(a: object, index: object, value: object) -> float:
+    values = _values(a)
+    i = _index(values, index)
+    if type(value) is not float:
+        raise LoxRuntimeError(None, "Array elements must be numbers.")
+    values[i] = value
+    return value
+
+
+@native("arrayLen", 1, pure=True)
+def len_(a: object) -> float:
+    return float(len(_values(a)))
+
+
+@native("arraySum", 1)
+def sum_(a: object) -> float:
+    return _fsum(_values(a))
+
+
+@native("arrayScale", 2)
+def scale(a: object, factor: object) -> LoxArray:
+    values = _values(a)
+    if type(factor) is not float:
+        raise LoxRuntimeError(None, "Operands must be numbers.")
+    allocate(8 * len(values))
+    if _uses_numpy(len(values)):
+        result = _zeros(len(values))
+        numpy.multiply(_view(values), factor, out=_view(result))
+        return LoxArray(result)
+    return LoxArray(array("d", map(factor.__mul__, values)))
+
+
+@native("arrayAdd", 2)
+def add(a: object, b: object) -> LoxArray:
+    left, right = _pair(a, b)
+    allocate(8 * len(left))
+    if _uses_numpy(len(left)):
+        result = _zeros(len(left))
+        numpy.add(_view(left), _view(right), out=_view(result))
+        return LoxArray(result)
+    return LoxArray(array("d", map(operator.add, left, right)))
+
+
+@native("arrayDot", 2)
+def dot(a: object, b: object) -> float:
+    left, right = _pair(a, b)
+    if _uses_numpy(len(left)):
+        return _fsum(_view(left) * _view(right))
+    return _fsum(array("d", map(operator.mul, left, right)))
+
+
+@native("arraySort", 1)
+def sort(a: object) -> LoxArray:
+    # a sorted copy; nans go last, as numpy puts them
+    values = _values(a)
+    allocate(8 * len(values))
+    if _uses_numpy(len(values)):
+        result = array("d", values)
+        _view(result).sort(kind="stable")
+        return LoxArray(result)
+    if all(map(operator.eq, values, values)):
+        return LoxArray(array("d", sorted(values)))
+    numbers = sorted(value for value in values if value == value)
+    return LoxArray(array("d", numbers + [math.nan] * (len(values) - len(numbers))))
+
+
+@native("arraySlice", 3)
+def slice_(a: object, start: object, end: object) -> LoxArray:
+    values = _values(a)
+    i = _integer(start, "Index must be an integer.")
+    j = _integer(end, "Index must be an integer.")
+    if not 0 <= i <= j <= len(values):
+        raise LoxRuntimeError(None, "Slice out of range.")
+    allocate(8 * (j - i))
+    return LoxArray(values[i:j])
+
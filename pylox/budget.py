@@ -0,0 +1,268 @@
+import math
+import os
+import sys
+import time
+from contextvars import ContextVar
+
+from pylox.error import LoxRuntimeError
+
+
+# steps between two checks of the clock and of memory use
+CHECK_INTERVAL = 4096
+# loop iterations compiled code counts in a local before charging them
+BATCH = 64
+# bytes from which a string or array being made is charged to the memory
+# budget right away (see allocate())
+LARGE = 1 << 16
+# Python frames a lox call takes at the least (compiled code calling
+# compiled code), which bounds how deep calls can go under Python's
+# recursion limit
+FRAMES_PER_CALL = 3
+
+
+class BudgetExceeded(LoxRuntimeError):
+    """
+    Raised when a script runs past a limit of its Budget: "steps", "time",
+    "depth" or "memory". Reported like any runtime error, with the line of
+    the loop or call the script was at.
+    """
+
+    def __init__(self, token, limit: str, error_msg: str):
+        super().__init__(token, error_msg)
+        self.limit = limit
+
+
+class Budget:
+    """
+    Limits on one run of a script (Interpreter.interpret()), for running
+    untrusted code in-process: a step count, a timeout in seconds, a call
+    depth and a memory budget in bytes, each unlimited when None.
+
+    Nothing is checked per node. A step is a loop iteration or a call, and
+    the interpreters (the compiled tier included) call step() at loop
+    back-edges and enter() when a call starts, which costs a decrement and
+    a compare; the clock and memory use are only read every CHECK_INTERVAL
+    steps. Compiled loops count their iterations themselves and charge them
+    BATCH at a time, so they may run that many steps past the step limit.
+    Memory use is approximate: it is how much the resident size of
+    the whole process grew since the run started, so scripts running
+    concurrently in one process are charged for each other's. Long strings
+    and arrays are charged just before they are made (see allocate()), so a
+    value doubling in a loop is stopped before it takes the process's
+    memory rather than at the next check.
+
+    A call depth needs room on Python's stack: one deeper than the recursion
+    limit allows is refused. Calls running out of that room before reaching
+    the depth limit (tree-walked calls take more frames than compiled ones)
+    fail the same way as reaching it; see overflow().
+
+    The python engine runs scripts without an Interpreter, so without
+    budgets.
+    """
+
+    __slots__ = (
+        "max_steps",
+        "timeout",
+        "max_depth",
+        "max_memory",
+        "exceeded",
+        "depth",
+        "_steps",
+        "_interval",
+        "_left",
+        "_deadline",
+        "_baseline",
+    )
+
+    def __init__(
+        self,
+        max_steps: int = None,
+        timeout: float = None,
+        max_depth: int = None,
+        max_memory: int = None,
+    ):
+        self.max_steps = math.inf if max_steps is None else max_steps
+        self.timeout = timeout
+        self.max_depth = math.inf if max_depth is None else max_depth
+        reachable = sys.getrecursionlimit() // FRAMES_PER_CALL
+        if max_depth is not None and max_depth > reachable:
+            raise ValueError(
+                f"Call depth limit {max_depth} is deeper than the recursion limit allows (at most {reachable})."
+            )
+        self.max_memory = max_memory
+        if max_memory is not None:
+            # fail here rather than on the first check
+            _resident()
+
+        # the limit the last run stopped at, if any
+        self.exceeded: BudgetExceeded = None
+        # calls in progress
+        self.depth = 0
+        self.start()
+
+    def start(self) -> None:
+        """
+        Starts a run: the steps, the clock and memory use count from here.
+        """
+
+        self.exceeded = None
+        self.depth = 0
+        self._steps = 0
+        self._interval = 0
+        # steps left until the next check
+        self._left = 0
+        self._deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._baseline = None if self.max_memory is None else _resident()
+        self._schedule()
+
+    @property
+    def steps(self) -> int:
+        """
+        Steps taken so far in this run.
+        """
+
+        return self._steps + self._interval - self._left
+
+    def step(self, token) -> None:
+        """
+        A loop back-edge, at the loop's token.
+        """
+
+        self._left -= 1
+        if self._left <= 0:
+            self._check(token)
+
+    def charge(self, token, steps: int) -> None:
+        """
+        Back-edges compiled code counted itself, BATCH at a time.
+        """
+
+        self._left -= steps
+        if self._left <= 0:
+            self._check(token)
+
+    def defer(self, steps: int) -> None:
+        """
+        Back-edges counted but not checked, for the next check to see: what
+        compiled code counted when its loop ends, which may be on the way
+        out of another error.
+        """
+
+        self._left -= steps
+
+    def enter(self, token) -> None:
+        """
+        A call starting, at the token of its call site (None if whoever
+        catches the error fills it in). The caller lowers depth again when
+        the call returns, unless this raised.
+        """
+
+        self._left -= 1
+        self.depth += 1
+        if self._left <= 0 or self.depth > self.max_depth:
+            self.depth -= 1
+            if self.depth >= self.max_depth:
+                self._exceed(token, "depth", "Call depth limit exceeded.")
+            self._check(token)
+            self.depth += 1
+
+    def allocate(self, token, size: int) -> None:
+        """
+        A value of about size bytes about to be made, which fails the
+        memory limit if the process would grow past it.
+        """
+
+        if self._baseline is not None and _resident() - self._baseline + size > self.max_memory:
+            self._exceed(token, "memory", "Memory limit exceeded.")
+
+    def _check(self, token) -> None:
+        self._count()
+        if self._steps > self.max_steps:
+            self._exceed(token, "steps", "Step limit exceeded.")
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self._exceed(token, "time", "Time limit exceeded.")
+        if self._baseline is not None and _resident() - self._baseline > self.max_memory:
+            self._exceed(token, "memory", "Memory limit exceeded.")
+        self._schedule()
+
+    def _schedule(self) -> None:
+        # the next check comes after CHECK_INTERVAL steps, or exactly at the
+        # step past the step limit if that is sooner
+        self._interval = min(CHECK_INTERVAL, self.max_steps + 1 - self._steps)
+        self._left = self._interval
+
+    def _count(self) -> None:
+        # moves the steps of the current interval into the total
+        self._steps += self._interval - self._left
+        self._interval = self._left = 0
+
+    def _exceed(self, token, limit: str, message: str) -> None:
+        # with no steps left, every later step checks (and fails) again
+        # until the next run starts
+        self._count()
+        self.exceeded = BudgetExceeded(token, limit, message)
+        raise self.exceeded
+
+
+# the budget of the script running in this context (see set_running()), where
+# code making values without an interpreter at hand can find it
+_running: ContextVar[Budget] = ContextVar("pylox_budget", default=None)
+
+
+def set_running(budget: Budget):
+    """
+    Makes budget (None for none) the one allocate() charges in the current
+    context, until the returned token is passed to reset_running(). The
+    interpreters do this around every run.
+    """
+
+    return _running.set(budget)
+
+
+def reset_running(token) -> None:
+    _running.reset(token)
+
+
+def allocate(size: int) -> None:
+    """
+    Charges a value of size bytes about to be made to the memory budget of
+    the script running in this context, if it has one; values under LARGE
+    bytes are left to the regular checks. The error has no token, for the
+    caller to fill in.
+    """
+
+    if size >= LARGE:
+        budget = _running.get()
+        if budget is not None:
+            budget.allocate(None, size)
+
+
+def overflow(budget: Budget, token) -> BudgetExceeded:
+    """
+    The error for a call Python's stack had no room left for (a
+    RecursionError), reported as reaching the call depth limit whether or
+    not there is a budget (which may be None).
+    """
+
+    exceeded = BudgetExceeded(token, "depth", "Call depth limit exceeded.")
+    if budget is not None:
+        budget._count()
+        budget.exceeded = exceeded
+    return exceeded
+
+
+def _resident() -> int:
+    # resident size of this process, in bytes; its peak where the current
+    # one cannot be read
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        raise ValueError("Memory budgets are not supported on this platform.")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,83 @@
+import os
+import socket
+import struct
+import sys
+
+
+# wire format: every message is a one-byte kind followed by a 4-byte length.
+# the client sends a single SOURCE message; the server answers with any number
+# of STDOUT/STDERR chunks and finishes with an EXIT message whose length field
+# carries the exit code.
+SOURCE = b"s"
+STDOUT = b"o"
+STDERR = b"e"
+EXIT = b"x"
+
+_HEADER = struct.Struct("!cI")
+
+# exit code when no server is running (EX_UNAVAILABLE, next to the 65 and 70
+# scripts exit with)
+NO_SERVER = 69
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"pylox-{os.getuid()}.sock")
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("pylox server closed the connection.")
+        buf += chunk
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, kind: bytes, payload: bytes = b"", length: int = None) -> None:
+    if length is None:
+        length = len(payload)
+    sock.sendall(_HEADER.pack(kind, length) + payload)
+
+
+def recv_frame(sock: socket.socket) -> tuple[bytes, int, bytes]:
+    kind, length = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if kind == EXIT:
+        return kind, length, b""
+    return kind, length, _recv_exactly(sock, length)
+
+
+def run_remote(path: str, socket_path: str = None) -> int:
+    """
+    Submits a script to a running server, relays its output and returns the
+    script's exit code.
+    """
+
+    if not os.path.exists(path):
+        raise FileNotFoundError("lox script not found!")
+
+    with open(path, "rb") as f:
+        source = f.read()
+
+    socket_path = socket_path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            print(f"No pylox server is listening on {socket_path} (start one with `pylox serve`).", file=sys.stderr)
+            return NO_SERVER
+        send_frame(sock, SOURCE, source)
+        while True:
+            kind, length, payload = recv_frame(sock)
+            if kind == STDOUT:
+                sys.stdout.buffer.write(payload)
+                sys.stdout.flush()
+            elif kind == STDERR:
+                sys.stderr.buffer.write(payload)
+                sys.stderr.flush()
+            elif kind == EXIT:
+                return length
+    finally:
+        sock.close()
@@ -0,0 +1,258 @@
+import ast
+import asyncio
+import inspect
+import math
+
+from pylox import error
+from pylox.expr import Call, Get, Stmt, Super
+from pylox.budget import Budget, overflow, reset_running, set_running
+from pylox.callable import LoxCallable
+from pylox.error import LoxRuntimeError, report_runtime_error
+from pylox.function import LoxFunction
+from pylox.interpreter import Interpreter, _first_line
+from pylox.lox_class import LoxClass, LoxInstance, cache_get
+from pylox.native import NativeFunction
+from pylox.return_exc import ReturnException
+from pylox.tiering import Tiering
+from pylox.token import Token
+from pylox.token_type import TokenType
+
+
+# statements a script runs between yields to the event loop, by default
+QUANTUM = 1000
+
+# the methods of Interpreter whose calls run lox code, which the coroutine
+# versions of its methods await
+_AWAITED = frozenset({"_evaluate", "_execute", "_execute_block"})
+
+
+class _Await(ast.NodeTransformer):
+    # awaits every self.<method>() call to a method in _AWAITED
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        function = node.func
+        if (
+            type(function) is ast.Attribute
+            and type(function.value) is ast.Name
+            and function.value.id == "self"
+            and function.attr in _AWAITED
+        ):
+            return ast.copy_location(ast.Await(node), node)
+        return node
+
+
+def _coroutines(cls: type, skip: frozenset) -> type:
+    """
+    A mixin with the visit methods and _execute_block() of cls, other than
+    those in skip, as coroutines: compiled from cls's own source, with the
+    calls that run lox code awaited, so the two stay the same code. They
+    keep the lines of that source, for tracebacks.
+    """
+
+    module = inspect.getmodule(cls)
+    tree = ast.parse(inspect.getsource(module))
+    (definition,) = (node for node in tree.body if type(node) is ast.ClassDef and node.name == cls.__name__)
+    functions = []
+    for node in definition.body:
+        if type(node) is not ast.FunctionDef or node.name in skip:
+            continue
+        if not node.name.startswith("visit_") and node.name != "_execute_block":
+            continue
+        coroutine = ast.AsyncFunctionDef(**{field: getattr(node, field) for field in node._fields})
+        functions.append(_Await().visit(ast.copy_location(coroutine, node)))
+
+    code = compile(ast.fix_missing_locations(ast.Module(functions, [])), inspect.getsourcefile(module), "exec")
+    # run against a copy of the module's globals, so the functions see the
+    # same names without being added to the module
+    namespace = dict(vars(module))
+    exec(code, namespace)
+    methods = {function.name: namespace[function.name] for function in functions}
+    return type("_" + cls.__name__ + "Coroutines", (), methods)
+
+
+# Interpreter's visitors as coroutines, except for calls: awaiting lox
+# functions and async natives is written out in AsyncInterpreter
+_InterpreterCoroutines = _coroutines(Interpreter, frozenset({"visit_call_expr"}))
+
+
+class AsyncInterpreter(_InterpreterCoroutines, Interpreter):
+    """
+    The tree-walker as coroutines, so that many scripts can share one
+    asyncio event loop. Every visit method is async (all but
+    visit_call_expr() are Interpreter's own, see _coroutines()), and the
+    interpreter yields to the loop once every `quantum` statements; a loop's body or a
+    function's body is at least a statement, so no loop or recursion runs
+    past that without yielding. Scripts sharing a loop thus take turns.
+
+    Natives that are `async def` functions (pylox.native) are awaited,
+    which only suspends their own script.
+
+    Tiering is off: compiled code could neither yield nor await natives.
+    Neither can pmap and parallelFor run here, which call lox functions from
+    a native.
+    """
+
+    cooperative = True
+
+    def __init__(self, quantum: int = QUANTUM, stdout=None, budget: Budget = None):
+        super().__init__(stdout, budget)
+        self.tiering = Tiering(math.inf, math.inf)
+        self.quantum = quantum
+        # statements left before the next yield
+        self.steps = quantum
+
+    async def interpret(self, statements: list[Stmt]) -> bool:
+        """
+        Runs the statements, returning False if they raised a runtime error.
+        """
+
+        if self.budget is not None:
+            self.budget.start()
+        running = set_running(self.budget)
+        try:
+            for statement in statements:
+                await self._execute(statement)
+        except LoxRuntimeError as e:
+            if e.token is None:
+                e.token = Token(TokenType.EOF, "", None, _first_line(statement))
+            report_runtime_error(e)
+            return False
+        except RecursionError:
+            line = _first_line(statement)
+            report_runtime_error(overflow(self.budget, Token(TokenType.EOF, "", None, line)))
+            return False
+        finally:
+            reset_running(running)
+        return True
+
+    async def visit_call_expr(self, expr: Call) -> object:
+        this = None
+        if type(expr.callee) is Get:
+            get = expr.callee
+            this = await self._evaluate(get.object)
+            if type(this) is not LoxInstance:
+                raise LoxRuntimeError(get.name, "Only instances have properties.")
+            if this.shape is not get.shape:
+                cache_get(get, this.shape)
+            if get.slot is None:
+                callee = get.method
+            else:
+                callee = this.fields[get.slot]
+                this = None
+        elif type(expr.callee) is Super:
+            callee, this = self._super_method(expr.callee)
+        else:
+            callee = await self._evaluate(expr.callee)
+        arguments: list[object] = []
+        for argument in expr.arguments:
+            arguments.append(await self._evaluate(argument))
+
+        if type(callee) is NativeFunction:
+            if len(arguments) != callee.arg_count:
+                raise LoxRuntimeError(expr.paren, f"Expected {callee.arg_count} arguments but got {len(arguments)}.")
+            try:
+                if callee.coroutine is not None:
+                    return await callee.coroutine(*arguments)
+                return callee.function(*arguments)
+            except LoxRuntimeError as e:
+                if e.token is None:
+                    e.token = expr.paren
+                raise
+
+        if not isinstance(callee, LoxCallable):
+            raise LoxRuntimeError(expr.paren, "Can only call functions and classes.")
+
+        if len(arguments) != callee.arity():
+            raise LoxRuntimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+
+        if self.on_call is not None:
+            self.on_call(expr, callee)
+        if type(callee) is LoxFunction:
+            value = await self._call(callee, this, arguments, expr.paren)
+            if callee.is_initializer:
+                # called on an instance, or bound to one
+                return this if this is not None else callee.closure.get_at(0, "this")
+            return value
+        if type(callee) is LoxClass:
+            instance = LoxInstance(callee.shape)
+            initializer = callee.methods.get("init")
+            if initializer is not None:
+                await self._call(initializer, instance, arguments, expr.paren)
+            return instance
+        try:
+            return callee.call(self, arguments)
+        except LoxRuntimeError as e:
+            if e.token is None:
+                e.token = expr.paren
+            raise
+
+    def _execute(self, stmt: Stmt):
+        # returns the statement's coroutine, saving one of its own per
+        # statement except when it is time to yield
+        self.steps -= 1
+        if self.steps > 0:
+            return stmt.accept(self)
+        return self._yield(stmt)
+
+    async def _yield(self, stmt: Stmt) -> None:
+        self.steps = self.quantum
+        await asyncio.sleep(0)
+        await stmt.accept(self)
+
+    async def _call(self, function: LoxFunction, instance: LoxInstance, arguments: list[object], paren: Token) -> object:
+        # LoxFunction.call(), awaiting the body; a fresh environment each
+        # time, since a suspended call may still be using the last one
+        budget = self.budget
+        if budget is not None:
+            budget.enter(paren)
+        environment = function.closure.capture()
+        if instance is not None:
+            environment.push({"this": instance})
+        frames = function.declaration.frames
+        frame = frames.acquire()
+        environment.push(frame)
+        for param, value in zip(function.declaration.params, arguments):
+            frame[param.lexeme] = value
+
+        enclosing = self.environment
+        self.environment = environment
+        try:
+            await self._execute_block(function.declaration.body, new_scope=False)
+        except ReturnException as e:
+            return e.value
+        except RecursionError:
+            raise overflow(budget, paren)
+        finally:
+            self.environment = enclosing
+            if budget is not None:
+                budget.depth -= 1
+            if frames.pooled:
+                frames.clear(frame)
+                frames.free.append(frame)
+        return None
+
+
+async def run(
+    script: str,
+    interpreter: AsyncInterpreter = None,
+    inline: bool = False,
+    optimize: bool = False,
+) -> bool:
+    """
+    pylox.lox.run() on the event loop: runs a script on an AsyncInterpreter
+    (a new one unless given), returning False if it had a compile or
+    runtime error.
+    """
+
+    from pylox.lox import prepare
+
+    if interpreter is None:
+        interpreter = AsyncInterpreter()
+    # a task shares the error state of the context that created it until
+    # it makes its own
+    error.reset(error.current().stderr)
+    statements = prepare(script, interpreter, inline, optimize)
+    if statements is None:
+        return False
+    return await interpreter.interpret(statements)
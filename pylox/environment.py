@@ -1,15 +1,78 @@
+from pylox.expr import Stmt, Block, Class, Function, If, While, Var
 from pylox.token import Token
 from pylox.error import LoxRuntimeError
 
 
+# marks a global slot that was interned but never defined
+_UNDEFINED = object()
+
+
+class Globals:
+    """
+    Global variables. Names are interned into slots when the resolver sees
+    them, so global reads and writes are list indexing; the name -> slot map
+    is only consulted for definitions, natives and REPL additions. Undefined
+    globals still fail lazily, when the slot is read or assigned.
+    """
+
+    def __init__(self):
+        self.slots: dict[str, int] = {}
+        self.values: list[object] = []
+        # set while slots/values are shared with a snapshot; the next write
+        # takes private copies first (copy-on-write)
+        self.shared = False
+
+    def slot(self, name: str) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            self._own()
+            slot = self.slots[name] = len(self.values)
+            self.values.append(_UNDEFINED)
+        return slot
+
+    def define(self, name: str, value: object) -> None:
+        slot = self.slot(name)
+        self._own()
+        self.values[slot] = value
+
+    def get(self, slot: int, name: Token) -> object:
+        value = self.values[slot]
+        if value is _UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+        return value
+
+    def assign(self, slot: int, name: Token, value: object) -> None:
+        if self.values[slot] is _UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+        if self.shared:
+            self._own()
+        self.values[slot] = value
+
+    def snapshot(self) -> tuple[dict[str, int], list[object]]:
+        self.shared = True
+        return self.slots, self.values
+
+    def restore(self, slots: dict[str, int], values: list[object]) -> None:
+        self.slots = slots
+        self.values = values
+        self.shared = True
+
+    def _own(self) -> None:
+        if self.shared:
+            self.slots = dict(self.slots)
+            self.values = list(self.values)
+            self.shared = False
+
+
 class Environment:
     """
-    Variable binding environment. Implements lexical scoping through enclosing blocks.
+    Local variable binding environment. Implements lexical scoping through
+    enclosing blocks; globals live in a separate slot table (see Globals).
     """
 
     def __init__(self):
-        self.blocks: list[dict[str, object]] = [{}]
-        self.innermost = 0
+        self.blocks: list[dict[str, object]] = []
+        self.innermost = -1
 
     def in_block(self):
         self.blocks.append({})
@@ -19,40 +82,92 @@ class Environment:
         self.blocks.pop()
         self.innermost -= 1
 
+    def push(self, frame: dict[str, object]) -> None:
+        self.blocks.append(frame)
+        self.innermost += 1
+
     @property
     def n_blocks(self):
         return self.innermost + 1
 
-    @property
-    def globals(self):
-        return self.blocks[0]
+    def capture(self) -> "Environment":
+        # new scope chain sharing the current blocks, used for closures
+        captured = Environment()
+        captured.blocks = list(self.blocks)
+        captured.innermost = self.innermost
+        return captured
 
     def define(self, name: str, value: object):
         inner_env = self.blocks[self.innermost]
         inner_env[name] = value
 
-    def get(self, name: Token) -> object:
-        env_idx = self.innermost
-        while env_idx >= 0:
-            env = self.blocks[env_idx]
-            if name.lexeme in env:
-                return env[name.lexeme]
-            env_idx -= 1
-        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}.")
-
     def get_at(self, distance: int, name: str) -> object:
         return self.blocks[len(self.blocks) - 1 - distance].get(name)
 
-    def assign(self, name: Token, value: object):
-        # search envs for innermost definition of name, and update var in that env
-        env_idx = self.innermost
-        while env_idx >= 0:
-            env = self.blocks[env_idx]
-            if name.lexeme in env:
-                env[name.lexeme] = value
-                return
-            env_idx -= 1
-        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
-
     def assign_at(self, distance: int, name: Token, value: object) -> None:
         self.blocks[len(self.blocks) - 1 - distance][name.lexeme] = value
+
+
+def _declares_function(statements: list[Stmt]) -> bool:
+    for statement in statements:
+        if isinstance(statement, (Function, Class)):
+            return True
+        if isinstance(statement, Block) and _declares_function(statement.statements):
+            return True
+        if isinstance(statement, If):
+            branches = [statement.then_branch]
+            if statement.else_branch is not None:
+                branches.append(statement.else_branch)
+            if _declares_function(branches):
+                return True
+        if isinstance(statement, While) and _declares_function([statement.loop_body]):
+            return True
+    return False
+
+
+class Frames:
+    """
+    Free-list of the frames (blocks) of a call's scope: a function's params
+    and body, or an inlined call's params. Frames start out holding the
+    scope's names, so binding them never grows the dict, and the frames of
+    finished calls are cleared back to that and reused. Block frames are
+    left to in_block(), since CPython's own dict free-list already recycles
+    those more cheaply than interpreted code could.
+
+    Scopes a closure may capture are not pooled, since the closure keeps
+    using their frames, unless they have no names: nothing is ever stored
+    in those frames, so sharing them is harmless.
+
+    Declarations, and so their Frames, are shared by every thread running
+    the same tree. Frames are only ever taken from the free-list with a
+    single list.pop(), which is atomic, so no two calls get the same frame.
+    """
+
+    def __init__(self, names: list[str], pooled: bool):
+        self.empty = dict.fromkeys(names)
+        self.pooled = pooled or not names
+        self.free: list[dict[str, object]] = []
+
+    @classmethod
+    def of(cls, statements: list[Stmt], params: list[Token] = ()) -> "Frames":
+        # the scope's names are its params and the declarations directly in
+        # it, as the Resolver counts them; closures can only come from
+        # function (or class) declarations somewhere inside it
+        names = [param.lexeme for param in params]
+        for statement in statements:
+            if isinstance(statement, (Var, Function, Class)):
+                names.append(statement.name.lexeme)
+        return cls(names, not _declares_function(statements))
+
+    def acquire(self) -> dict[str, object]:
+        if self.free:
+            try:
+                return self.free.pop()
+            except IndexError:
+                # another thread took the last one
+                pass
+        return self.empty.copy()
+
+    def clear(self, frame: dict[str, object]) -> None:
+        # drops the values (so they can be freed) but keeps the keys
+        frame.update(self.empty)
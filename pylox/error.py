@@ -1,8 +1,48 @@
 import sys
+from contextvars import ContextVar
 
 
-had_error: bool = False
-had_runtime_error: bool = False
+class Errors:
+    """
+    Error state of a run: whether it had compile or runtime errors, and the
+    stream diagnostics go to (sys.stderr when None). The current one is
+    per context, so every thread and asyncio task sees its own and scripts
+    running concurrently cannot set each other's flags; see current() and
+    reset().
+    """
+
+    def __init__(self, stderr=None):
+        self.had_error = False
+        self.had_runtime_error = False
+        self.stderr = stderr
+
+
+_errors: ContextVar[Errors] = ContextVar("pylox_errors")
+
+
+def current() -> Errors:
+    """
+    The error state of the current context, made on first use.
+    """
+
+    errors = _errors.get(None)
+    if errors is None:
+        errors = reset()
+    return errors
+
+
+def reset(stderr=None) -> Errors:
+    """
+    Starts fresh error state for the current context, e.g. to send a
+    script's diagnostics to stderr. The run() entry points start each script
+    on fresh flags of their own, keeping the stream set here. asyncio tasks
+    start out sharing the state of the context that created them.
+    """
+
+    errors = Errors(stderr)
+    _errors.set(errors)
+    return errors
+
 
 # basic error handlers
 def error(line: int, message: str) -> None:
@@ -10,9 +50,9 @@ def error(line: int, message: str) -> None:
 
 
 def report(line: int, where: str, message: str) -> None:
-    global had_error # ugh, globals!
-    print(f"[line {line}] Error {where}: {message}", file=sys.stderr)
-    had_error = True
+    errors = current()
+    print(f"[line {line}] Error {where}: {message}", file=errors.stderr or sys.stderr)
+    errors.had_error = True
 
 
 class LoxRuntimeError(Exception):
@@ -23,6 +63,6 @@ class LoxRuntimeError(Exception):
 
 
 def report_runtime_error(error):
-    global had_runtime_error
-    print(f"[line {error.token.line}] {error.error_msg}", file=sys.stderr)
-    had_runtime_error = True
+    errors = current()
+    print(f"[line {error.token.line}] {error.error_msg}", file=errors.stderr or sys.stderr)
+    errors.had_runtime_error = True
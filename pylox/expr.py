@@ -1,5 +1,6 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
-from typing import Optional
 
 from pylox.token import Token
 
@@ -38,6 +39,26 @@ class ExprVisitor(ABC):
     def visit_variable_expr(self, expr):
         pass
 
+    @abstractmethod
+    def visit_inlined_expr(self, expr):
+        pass
+
+    @abstractmethod
+    def visit_get_expr(self, expr):
+        pass
+
+    @abstractmethod
+    def visit_set_expr(self, expr):
+        pass
+
+    @abstractmethod
+    def visit_this_expr(self, expr):
+        pass
+
+    @abstractmethod
+    def visit_super_expr(self, expr):
+        pass
+
 
 class StmtVisitor(ABC):
     @abstractmethod
@@ -72,6 +93,10 @@ class StmtVisitor(ABC):
     def visit_var_stmt(self, stmt):
         pass
 
+    @abstractmethod
+    def visit_class_stmt(self, stmt):
+        pass
+
 
 # expressions
 class Expr(ABC):
@@ -119,6 +144,8 @@ class Unary(Expr):
     ):
         self.operator = operator
         self.right = right
+        # NUMBER when pylox.inference proved the operand is one
+        self.proven = None
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visit_unary_expr(self)
@@ -147,6 +174,12 @@ class Binary(Expr):
         self.left = left
         self.operator = operator
         self.right = right
+        # NUMBER or STRING when pylox.inference proved both operands are
+        # that type, so the engines can skip checking them
+        self.proven = None
+        # NUMBER when a recorded profile only ever saw numbers here, so the
+        # tree-walker tries the fast path first (see pylox.profiling)
+        self.speculated = None
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visit_binary_expr(self)
@@ -162,6 +195,10 @@ class Call(Expr):
         self.callee = callee
         self.paren = paren
         self.arguments = arguments
+        # the declaration of the only function a recorded profile saw called
+        # here, which the tree-walker calls without further checks (see
+        # pylox.profiling)
+        self.target = None
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visit_call_expr(self)
@@ -175,6 +212,89 @@ class Variable(Expr):
         return visitor.visit_variable_expr(self)
 
 
+class Inlined(Expr):
+    """
+    A call whose callee's body was inlined (see pylox.inliner): binds the
+    arguments to the params in a new scope, then evaluates the body. name is
+    the callee at the call site, function the callee's declaration and depth
+    how many scopes out from the call site it was declared (None when it is
+    a global), so a hot call site can still run the callee's compiled code.
+    """
+
+    def __init__(
+        self,
+        name: Token,
+        params: list[Token],
+        arguments: list[Expr],
+        body: Expr,
+        function,
+        depth: int = None,
+    ):
+        self.name = name
+        self.params = params
+        self.arguments = arguments
+        self.body = body
+        self.function = function
+        self.depth = depth
+        # tiering state, like LoxFunction's
+        self.calls = 0
+        self.tiered = False
+        self.compiled = None
+        # like Function.frames, for the params
+        self.frames = None
+
+    def accept(self, visitor: ExprVisitor):
+        return visitor.visit_inlined_expr(self)
+
+
+class Get(Expr):
+    def __init__(self, object: Expr, name: Token):
+        self.object = object
+        self.name = name
+        # inline cache: the shape of the last instance read here, and where
+        # the property was found for it (a field slot, or a method when slot
+        # is None)
+        self.shape = None
+        self.slot = None
+        self.method = None
+
+    def accept(self, visitor: ExprVisitor):
+        return visitor.visit_get_expr(self)
+
+
+class Set(Expr):
+    def __init__(self, object: Expr, name: Token, value: Expr):
+        self.object = object
+        self.name = name
+        self.value = value
+        # inline cache: the shape of the last instance written here, its
+        # slot for the field, and the shape it moves to when the field is
+        # new to it (None when the field already exists)
+        self.shape = None
+        self.slot = None
+        self.transition = None
+
+    def accept(self, visitor: ExprVisitor):
+        return visitor.visit_set_expr(self)
+
+
+class This(Expr):
+    def __init__(self, keyword: Token):
+        self.keyword = keyword
+
+    def accept(self, visitor: ExprVisitor):
+        return visitor.visit_this_expr(self)
+
+
+class Super(Expr):
+    def __init__(self, keyword: Token, method: Token):
+        self.keyword = keyword
+        self.method = method
+
+    def accept(self, visitor: ExprVisitor):
+        return visitor.visit_super_expr(self)
+
+
 # statements
 class Stmt(ABC):
     @abstractmethod
@@ -208,6 +328,9 @@ class Function(Stmt):
         self.name = name
         self.params = params
         self.body = body
+        # the free-list of frames for its params and body
+        # (pylox.environment.Frames), set up by its first LoxFunction
+        self.frames = None
 
     def accept(self, visitor: StmtVisitor):
         return visitor.visit_function_stmt(self)
@@ -218,7 +341,7 @@ class If(Stmt):
         self,
         condition: Expr,
         then_branch: Stmt,
-        else_branch: Optional[Stmt],
+        else_branch: Stmt | None,
     ):
         self.condition = condition
         self.then_branch = then_branch
@@ -231,9 +354,12 @@ class If(Stmt):
 class While(Stmt):
     def __init__(
         self,
+        keyword: Token,
         condition: Expr,
         loop_body: Stmt,
     ):
+        # `while` or `for`, for errors raised at the loop itself
+        self.keyword = keyword
         self.condition = condition
         self.loop_body = loop_body
 
@@ -265,3 +391,18 @@ class Var(Stmt):
 
     def accept(self, visitor: StmtVisitor):
         return visitor.visit_var_stmt(self)
+
+
+class Class(Stmt):
+    def __init__(
+        self,
+        name: Token,
+        superclass: Variable | None,
+        methods: list[Function],
+    ):
+        self.name = name
+        self.superclass = superclass
+        self.methods = methods
+
+    def accept(self, visitor: StmtVisitor):
+        return visitor.visit_class_stmt(self)
@@ -1,52 +1,126 @@
-from copy import deepcopy
-
+from pylox.budget import overflow
 from pylox.callable import LoxCallable
-from pylox.environment import Environment
+from pylox.environment import Environment, Frames
 from pylox.return_exc import ReturnException
 
 
 class LoxFunction(LoxCallable):
-    def __init__(self, declaration, closure: Environment):
+    def __init__(self, declaration, closure: Environment, is_initializer: bool = False):
         self.declaration = declaration
-        # create a deepcopy of environment
-        self.closure = Environment()
-        self.closure.blocks.pop()
-        for block in closure.blocks:
-            self.closure.blocks.append(deepcopy(block))
-        self.closure.innermost = closure.innermost
-
-    def call(self, interpreter, arguments: list[object]) -> object:
-        closure = self._replicate_env(self.closure)
-        closure.in_block()
-        for arg, val in zip(self.declaration.params, arguments):
-            closure.define(arg.lexeme, val)
-        # shadow interpreter environment
-        original_env = interpreter.environment
-        interpreter.environment = closure
-
-        value: object = None
-        try:
-            interpreter._execute_block(self.declaration.body, new_scope=False)
-        except ReturnException as e:
-            value = e.value
-        finally:
-            # restore original environment
-            interpreter.environment = original_env
-            closure.out_block()
+        # closures capture the enclosing blocks by reference
+        self.closure = closure.capture()
+        # a class's init(), which always returns the instance
+        self.is_initializer = is_initializer
+
+        # tiering (see pylox.tiering): calls and loop back-edges so far, and
+        # the compiled body once the function got hot
+        self.calls = 0
+        self.loops = 0
+        self.tiered = False
+        self.compiled = None
+
+        if declaration.frames is None:
+            declaration.frames = Frames.of(declaration.body, declaration.params)
+        # environments of finished calls, ready for the next one (only when
+        # no closure can capture them; see Frames). A function can be shared
+        # by threads (see Session.fork), so the pool is only ever taken from
+        # with a single list.pop(), which is atomic: no two calls get the
+        # same environment
+        self.environments: list[Environment] = []
+
+    def call(self, interpreter, arguments: list[object], instance=None) -> object:
+        """
+        Calls the function. Given an instance, calls it as a method on that
+        instance without binding it first: the block holding `this` goes
+        straight into the call's environment, pooled like any other. Only
+        done with a class's own (unbound) methods, whose environments then
+        always have that block.
+        """
+
+        budget = interpreter.budget
+        if budget is not None:
+            # the call site fills in the token
+            budget.enter(None)
+        if self.compiled is None and not self.tiered:
+            self.calls += 1
+            tiering = interpreter.tiering
+            if (
+                self.calls >= tiering.call_threshold
+                or self.loops >= tiering.loop_threshold
+                or self.declaration in tiering.hot
+            ):
+                self.tiered = True
+                self.compiled = tiering.promote(self.declaration, interpreter, self.calls, self.loops)
 
+        if self.compiled is not None:
+            blocks = self.closure.blocks
+            if instance is not None:
+                blocks = [*blocks, {"this": instance}]
+            try:
+                value = self.compiled(interpreter, blocks, *arguments)
+            except RecursionError:
+                # out of Python's stack; the call site fills in the token
+                raise overflow(budget, None)
+            finally:
+                if budget is not None:
+                    budget.depth -= 1
+        else:
+            # tree-walk the body in a pooled environment
+            frames = self.declaration.frames
+            environment: Environment = None
+            if self.environments:
+                try:
+                    environment = self.environments.pop()
+                except IndexError:
+                    # another thread took the last one
+                    pass
+            if environment is None:
+                environment = self.closure.capture()
+                if instance is not None:
+                    environment.push({"this": instance})
+                environment.push(frames.acquire())
+            elif instance is not None:
+                environment.blocks[-2]["this"] = instance
+            frame = environment.blocks[-1]
+            for arg, val in zip(self.declaration.params, arguments):
+                frame[arg.lexeme] = val
+            # shadow interpreter environment
+            original_env = interpreter.environment
+            original_function = interpreter.function
+            interpreter.environment = environment
+            interpreter.function = self
+
+            value: object = None
+            try:
+                interpreter._execute_block(self.declaration.body, new_scope=False)
+            except ReturnException as e:
+                value = e.value
+            except RecursionError:
+                raise overflow(budget, None)
+            finally:
+                # restore original environment
+                interpreter.environment = original_env
+                interpreter.function = original_function
+                if budget is not None:
+                    budget.depth -= 1
+                if frames.pooled:
+                    frames.clear(frame)
+                    if instance is not None:
+                        environment.blocks[-2]["this"] = None
+                    self.environments.append(environment)
+
+        if self.is_initializer:
+            return self.closure.get_at(0, "this") if instance is None else instance
         return value
 
+    def bind(self, instance) -> "LoxFunction":
+        # a method as a value: its closure gets a block holding `this`
+        environment = self.closure.capture()
+        environment.push({"this": instance})
+        return LoxFunction(self.declaration, environment, self.is_initializer)
+
     def arity(self) -> int:
         return len(self.declaration.params)
 
     def __str__(self) -> str:
         return f"<fn {self.declaration.name.lexeme}>"
-
-    def _replicate_env(self, environment: Environment) -> Environment:
-        replication: Environment = Environment()
-        replication.blocks.pop()
-        for block in environment.blocks:
-            replication.blocks.append(deepcopy(block))
-        replication.innermost = environment.innermost
-
-        return replication
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections.abc import Iterator
+
+from pylox import error
+from pylox.expr import Expr, Stmt
+from pylox.parser import Parser
+from pylox.resolver import Resolver
+from pylox.scanner import Scanner
+from pylox.token import Token
+
+
+# the only lexemes that matter when looking for top-level boundaries. strings
+# and comments are matched whole so braces inside them are skipped.
+_BOUNDARY_RE = re.compile(r'"[^"]*"?|//[^\n]*|[{}();]')
+_ELSE_RE = re.compile(r"(?:\s|//[^\n]*)*else\b")
+
+
+def declaration_bounds(source: str, pos: int = 0) -> Iterator[int]:
+    """
+    Yields the end offsets of the top-level declarations in source, starting
+    from pos. A declaration ends at a `;` or `}` that brings the brace/paren
+    depth back to zero, unless an `else` follows. The last offset yielded is
+    always len(source).
+    """
+
+    depth = 0
+    for m in _BOUNDARY_RE.finditer(source, pos):
+        c = m.group()
+        if c == "(" or c == "{":
+            depth += 1
+            continue
+        if c == ")" or c == "}":
+            depth = max(depth - 1, 0)
+            if c == ")":
+                continue
+        elif c != ";":
+            # string or comment
+            continue
+
+        if depth == 0 and not _ELSE_RE.match(source, m.end()):
+            pos = m.end()
+            yield pos
+
+    if pos < len(source):
+        yield len(source)
+
+
+class Chunk:
+    """
+    One top-level declaration of a document, along with its tokens, AST,
+    resolved local depths and the global names it references. Chunks tile
+    the document: a chunk runs from the end of the previous declaration to
+    the end of its own.
+    """
+
+    def __init__(self, start: int, end: int, line: int):
+        self.start = start
+        self.end = end
+        self.line = line
+        self.tokens: list[Token] = []
+        self.statements: list[Stmt] = []
+        self.locals_: dict[Expr, int] = {}
+        self.globals_: dict[Expr, str] = {}
+        self.had_error = False
+
+    # resolver callbacks, same signatures as on Interpreter
+    def resolve(self, expr: Expr, depth: int) -> None:
+        self.locals_[expr] = depth
+
+    def resolve_global(self, expr: Expr, name: Token) -> None:
+        self.globals_[expr] = name.lexeme
+
+    def shift(self, offset: int, lines: int) -> None:
+        self.start += offset
+        self.end += offset
+        if lines:
+            self.line += lines
+            # tokens are shared with the AST, so this also fixes up the line
+            # numbers used in runtime errors
+            for token in self.tokens:
+                token.line += lines
+
+
+class Document:
+    """
+    Incrementally compiled lox source. Edits only re-scan, re-parse and
+    re-resolve the top-level declarations they touch; everything else is
+    reused. Since top-level names are globals, which the resolver leaves
+    late-bound, resolving one top-level declaration never depends on another.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.chunks: list[Chunk] = self._compile_from(0, 1, stop_at=None)[0]
+
+    @property
+    def statements(self) -> list[Stmt]:
+        return [stmt for chunk in self.chunks for stmt in chunk.statements]
+
+    @property
+    def locals_(self) -> dict[Expr, int]:
+        merged: dict[Expr, int] = {}
+        for chunk in self.chunks:
+            merged.update(chunk.locals_)
+        return merged
+
+    @property
+    def had_error(self) -> bool:
+        return any(chunk.had_error for chunk in self.chunks)
+
+    def edit(self, start: int, end: int, text: str) -> list[Chunk]:
+        """
+        Replaces source[start:end] with text and recompiles the affected
+        declarations. Returns the chunks that were rebuilt.
+        """
+
+        offset = len(text) - (end - start)
+        lines = text.count("\n") - self.source.count("\n", start, end)
+        self.source = self.source[:start] + text + self.source[end:]
+
+        # the declaration before the edit is rebuilt too, an inserted `else`
+        # or a deleted `;` can move its boundary
+        starts = [chunk.start for chunk in self.chunks]
+        first = max(bisect_right(starts, start) - 2, 0)
+
+        # old chunks starting at or after the end of the edit can be reused
+        # as soon as re-splitting lands on one of their (shifted) boundaries
+        reusable = {
+            chunk.start + offset: idx
+            for idx, chunk in enumerate(self.chunks)
+            if chunk.start >= end and idx > first
+        }
+        if first < len(self.chunks):
+            chunk_start, chunk_line = self.chunks[first].start, self.chunks[first].line
+        else:
+            chunk_start, chunk_line = 0, 1
+
+        rebuilt, resume = self._compile_from(chunk_start, chunk_line, reusable)
+        tail = self.chunks[resume:] if resume is not None else []
+        for chunk in tail:
+            chunk.shift(offset, lines)
+        self.chunks = self.chunks[:first] + rebuilt + tail
+        return rebuilt
+
+    def _compile_from(
+        self,
+        pos: int,
+        line: int,
+        stop_at: dict[int, int] | None,
+    ) -> tuple[list[Chunk], int | None]:
+        chunks: list[Chunk] = []
+        for bound in declaration_bounds(self.source, pos):
+            chunk = Chunk(pos, bound, line)
+            self._compile_chunk(chunk)
+            chunks.append(chunk)
+            line += self.source.count("\n", pos, bound)
+            pos = bound
+            if stop_at is not None and pos in stop_at:
+                return chunks, stop_at[pos]
+        return chunks, None
+
+    def _compile_chunk(self, chunk: Chunk) -> None:
+        errors = error.current()
+        had_error = errors.had_error
+        errors.had_error = False
+
+        scanner = Scanner(self.source[chunk.start:chunk.end])
+        scanner.line = chunk.line
+        chunk.tokens = scanner.scan_tokens()
+        statements = Parser(chunk.tokens, Resolver(chunk)).parse()
+
+        chunk.had_error = errors.had_error
+        chunk.statements = statements if not chunk.had_error else []
+        errors.had_error = had_error or chunk.had_error
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.token import Token
+from pylox.token_type import TokenType
+from pylox.values import NUMBER, STRING
+
+
+# what a value may be, as a bitmask of the types it could have at runtime
+_NUMBER = 1
+_STRING = 2
+_BOOLEAN = 4
+_NIL = 8
+_FUNCTION = 16
+_ANY = 31
+
+_COMPARISONS = (
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+)
+
+
+def _literal(value: object) -> int:
+    if type(value) is float:
+        return _NUMBER
+    if type(value) is str:
+        return _STRING
+    if type(value) is bool:
+        return _BOOLEAN
+    if value is None:
+        return _NIL
+    return _ANY
+
+
+def _only(mask: int, kind: int) -> bool:
+    return mask != 0 and mask & ~kind == 0
+
+
+def _pure(expr: Expr) -> bool:
+    # cannot change any variable while it is evaluated
+    if isinstance(expr, (Assign, Call, Inlined)):
+        return False
+    if isinstance(expr, (Binary, Logical)):
+        return _pure(expr.left) and _pure(expr.right)
+    if isinstance(expr, Unary):
+        return _pure(expr.right)
+    if isinstance(expr, Grouping):
+        return _pure(expr.expr)
+    if isinstance(expr, Get):
+        return _pure(expr.object)
+    if isinstance(expr, Set):
+        return _pure(expr.object) and _pure(expr.value)
+    return True
+
+
+def _join(left: dict | None, right: dict | None) -> dict | None:
+    # None is the state after a return, which joins as nothing; a variable
+    # missing from a state may be anything
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return {key: mask | right[key] for key, mask in left.items() if key in right}
+
+
+class _Decl:
+    """
+    A local variable. Locals a closure captures can change during any call,
+    like globals do.
+    """
+
+    def __init__(self, owner: Function | None):
+        self.owner = owner
+        self.captured = False
+
+
+class TypeInference(ExprVisitor, StmtVisitor):
+    """
+    Flow-sensitive type inference over a resolved program. Abstractly
+    interprets every function body once, tracking which types each variable
+    may hold at each point: literals and operators produce known types,
+    branches join, loops iterate to a fixpoint, and an operator that did not
+    raise proves its operands (so after `n < 2`, n is a number). Calls may
+    change globals and captured locals, which then may hold anything again.
+
+    Binary and Unary nodes whose operands are always numbers (or, for `+`,
+    always strings) get `proven` set to NUMBER or STRING (pylox.values), and
+    the engines skip their runtime checks there. Every other node keeps
+    them, so errors are raised exactly as before.
+    """
+
+    def __init__(self, target):
+        self.locals_ = target.locals_
+        self.scopes: list[dict[str, _Decl]] = []
+        self.function: Function | None = None
+        # types of the variables at the current point, None if unreachable
+        self.state: dict | None = {}
+        self._decls: dict[Token, _Decl] = {}
+        # operand types seen at each checked operator
+        self._seen: dict[Expr, int] = {}
+        self._done: set[Function] = set()
+
+    def infer(self, statements: list[Stmt]) -> None:
+        try:
+            # the first pass only finds the captured locals
+            for _ in range(2):
+                self.scopes = []
+                self.function = None
+                self.state = {}
+                self._seen = {}
+                self._done = set()
+                self._statements(statements)
+        except RecursionError:
+            return
+
+        for expr, mask in self._seen.items():
+            if _only(mask, _NUMBER):
+                expr.proven = NUMBER
+            elif _only(mask, _STRING) and expr.operator.type == TokenType.PLUS:
+                expr.proven = STRING
+            else:
+                expr.proven = None
+
+    # statements
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.scopes.append({})
+        self._statements(stmt.statements)
+        self.scopes.pop()
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        self._infer(stmt.expression)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self._assign(self._declare(stmt.name), _FUNCTION)
+        self._function(stmt)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        self._infer(stmt.condition)
+        before = self.state
+        self.state = dict(before)
+        stmt.then_branch.accept(self)
+        after = self.state
+        self.state = dict(before)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+        self.state = _join(after, self.state)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        entry = self.state
+        while True:
+            self.state = dict(entry)
+            self._infer(stmt.condition)
+            # the loop is left right after the condition
+            exit_ = self.state
+            self.state = dict(exit_)
+            stmt.loop_body.accept(self)
+            joined = _join(entry, self.state)
+            if joined == entry:
+                break
+            entry = joined
+        self.state = exit_
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        self._infer(stmt.expression)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            self._infer(stmt.value)
+        self.state = None
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        mask = _NIL if stmt.initializer is None else self._infer(stmt.initializer)
+        self._assign(self._declare(stmt.name), mask)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        self._assign(self._declare(stmt.name), _FUNCTION)
+        if stmt.superclass is not None:
+            self._infer(stmt.superclass)
+            self.scopes.append({"super": _Decl(self.function)})
+        # `this` is bound per call, so it is never known
+        self.scopes.append({"this": _Decl(None)})
+        for method in stmt.methods:
+            self._function(method)
+        self.scopes.pop()
+        if stmt.superclass is not None:
+            self.scopes.pop()
+
+    # expressions
+    def visit_literal_expr(self, expr: Literal) -> int:
+        return _literal(expr.value)
+
+    def visit_logical_expr(self, expr: Logical) -> int:
+        left = self._infer(expr.left)
+        before = self.state
+        self.state = dict(before)
+        right = self._infer(expr.right)
+        self.state = _join(before, self.state)
+        return left | right
+
+    def visit_grouping_expr(self, expr: Grouping) -> int:
+        return self._infer(expr.expr)
+
+    def visit_unary_expr(self, expr: Unary) -> int:
+        right = self._infer(expr.right)
+        if expr.operator.type == TokenType.BANG:
+            return _BOOLEAN
+        self._seen[expr] = self._seen.get(expr, 0) | right
+        self._refine(expr.right, _NUMBER)
+        return _NUMBER
+
+    def visit_assign_expr(self, expr: Assign) -> int:
+        mask = self._infer(expr.value)
+        self._assign(self._key(expr, expr.name), mask)
+        return mask
+
+    def visit_binary_expr(self, expr: Binary) -> int:
+        left = self._infer(expr.left)
+        right = self._infer(expr.right)
+        operator = expr.operator.type
+        if operator in (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL):
+            return _BOOLEAN
+
+        self._seen[expr] = self._seen.get(expr, 0) | left | right
+        if operator == TokenType.PLUS:
+            # `+` only succeeds on two numbers or two strings
+            if _only(left, _NUMBER) or _only(right, _NUMBER):
+                result = _NUMBER
+            elif _only(left, _STRING) or _only(right, _STRING):
+                result = _STRING
+            else:
+                result = _NUMBER | _STRING
+        else:
+            result = _NUMBER
+
+        # the right operand is read last; the left one still holds the value
+        # it had unless evaluating the right operand could change it
+        if _pure(expr.right):
+            self._refine(expr.left, result)
+        self._refine(expr.right, result)
+        return _BOOLEAN if operator in _COMPARISONS else result
+
+    def visit_call_expr(self, expr: Call) -> int:
+        self._infer(expr.callee)
+        for argument in expr.arguments:
+            self._infer(argument)
+        # the callee may assign any global or captured local
+        self.state = {
+            key: mask
+            for key, mask in self.state.items()
+            if isinstance(key, _Decl) and not key.captured
+        }
+        return _ANY
+
+    def visit_variable_expr(self, expr: Variable) -> int:
+        key = self._key(expr, expr.name)
+        return self.state.get(key, _ANY)
+
+    def visit_inlined_expr(self, expr: Inlined) -> int:
+        arguments = [self._infer(argument) for argument in expr.arguments]
+        # an inlined body is an expression, so nothing can capture its params
+        self.scopes.append({})
+        for param, mask in zip(expr.params, arguments):
+            decl = _Decl(self.function)
+            self.scopes[-1][param.lexeme] = decl
+            self.state[decl] = mask
+        result = self._infer(expr.body)
+        self.scopes.pop()
+        return result
+
+    def visit_get_expr(self, expr: Get) -> int:
+        self._infer(expr.object)
+        return _ANY
+
+    def visit_set_expr(self, expr: Set) -> int:
+        self._infer(expr.object)
+        return self._infer(expr.value)
+
+    def visit_this_expr(self, expr: This) -> int:
+        return _ANY
+
+    def visit_super_expr(self, expr: Super) -> int:
+        return _FUNCTION
+
+    # helpers
+    def _function(self, stmt: Function) -> None:
+        if stmt in self._done:
+            return
+        self._done.add(stmt)
+
+        # the body runs later, when nothing is known about its params or
+        # about the variables it closes over
+        outer = self.state, self.function
+        self.state, self.function = {}, stmt
+        self.scopes.append({})
+        for param in stmt.params:
+            self._declare(param)
+        self._statements(stmt.body)
+        self.scopes.pop()
+        self.state, self.function = outer
+
+    def _statements(self, statements: list[Stmt]) -> None:
+        for statement in statements:
+            if self.state is None:
+                # unreachable after a return
+                return
+            statement.accept(self)
+
+    def _infer(self, expr: Expr) -> int:
+        return expr.accept(self)
+
+    def _declare(self, name: Token) -> object:
+        if not self.scopes:
+            return name.lexeme
+        decl = self._decls.get(name)
+        if decl is None:
+            decl = self._decls[name] = _Decl(self.function)
+        self.scopes[-1][name.lexeme] = decl
+        return decl
+
+    def _key(self, expr: Expr, name: Token) -> object:
+        # globals are keyed by name, locals by their declaration
+        depth = self.locals_.get(expr)
+        if depth is None:
+            return name.lexeme
+        if depth >= len(self.scopes):
+            return None
+        decl = self.scopes[-1 - depth][name.lexeme]
+        if decl.owner is not self.function:
+            decl.captured = True
+        return decl
+
+    def _assign(self, key: object, mask: int) -> None:
+        if key is not None:
+            self.state[key] = mask
+
+    def _refine(self, expr: Expr, mask: int) -> None:
+        while isinstance(expr, Grouping):
+            expr = expr.expr
+        if isinstance(expr, Variable):
+            key = self._key(expr, expr.name)
+            if key is not None:
+                self.state[key] = self.state.get(key, _ANY) & mask
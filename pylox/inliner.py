@@ -0,0 +1,483 @@
+from __future__ import annotations
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.token import Token
+
+
+# largest function body, in expression nodes, that gets inlined
+INLINE_BUDGET = 16
+
+
+def _children(expr: Expr) -> list[Expr]:
+    if isinstance(expr, (Binary, Logical)):
+        return [expr.left, expr.right]
+    if isinstance(expr, Unary):
+        return [expr.right]
+    if isinstance(expr, Grouping):
+        return [expr.expr]
+    if isinstance(expr, Assign):
+        return [expr.value]
+    if isinstance(expr, Call):
+        return [expr.callee, *expr.arguments]
+    if isinstance(expr, Inlined):
+        return [*expr.arguments, expr.body]
+    if isinstance(expr, Get):
+        return [expr.object]
+    if isinstance(expr, Set):
+        return [expr.object, expr.value]
+    return []
+
+
+def _size(expr: Expr) -> int:
+    return 1 + sum(_size(child) for child in _children(expr))
+
+
+def _returned(stmt: Function) -> Expr | None:
+    # the expression of a `fun f(...) { return expr; }` helper
+    if len(stmt.body) == 1 and isinstance(stmt.body[0], Return):
+        return stmt.body[0].value
+    return None
+
+
+class _Survey(ExprVisitor, StmtVisitor):
+    """
+    First pass of the inliner: finds the helpers that can be inlined and the
+    call sites to inline them at.
+
+    A helper is a function whose body is a single `return expr;` within the
+    budget. It qualifies if it is only ever called directly: never assigned,
+    redeclared, passed around or called from its own body. Global helpers
+    are only inlined at call sites after their declaration, so calling one
+    before it is defined still fails at runtime.
+    """
+
+    def __init__(self, locals_: dict[Expr, int], budget: int):
+        self.locals_ = locals_
+        self.budget = budget
+        self.eligible: dict[Function, bool] = {}
+        self.sites: dict[Call, Function] = {}
+        self.scopes: list[dict[str, Function | None]] = []
+        self.globals_: dict[str, Function] = {}
+        self.functions: list[Function] = []
+        # position in the walk, to order call sites after declarations
+        self.position = 0
+        self.declared_at: dict[Function, int] = {}
+        self.calls: list[tuple[Call, Function, int]] = []
+
+    def survey(self, statements: list[Stmt]) -> None:
+        counts: dict[str, int] = {}
+        for statement in statements:
+            if isinstance(statement, (Function, Var, Class)):
+                counts[statement.name.lexeme] = counts.get(statement.name.lexeme, 0) + 1
+        for statement in statements:
+            if isinstance(statement, Function) and counts[statement.name.lexeme] == 1:
+                self.globals_[statement.name.lexeme] = statement
+
+        for statement in statements:
+            statement.accept(self)
+
+        for call, function, position in self.calls:
+            if self.eligible.get(function) and position > self.declared_at[function]:
+                self.sites[call] = function
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.scopes.append({})
+        for statement in stmt.statements:
+            statement.accept(self)
+        self.scopes.pop()
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression.accept(self)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self._declare(stmt.name, stmt)
+        self.position += 1
+        self.declared_at[stmt] = self.position
+        returned = _returned(stmt)
+        if returned is not None and _size(returned) <= self.budget:
+            self.eligible[stmt] = True
+
+        self._function(stmt)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        stmt.expression.accept(self)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            stmt.value.accept(self)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        self._declare(stmt.name, None)
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        stmt.condition.accept(self)
+        stmt.loop_body.accept(self)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        self._declare(stmt.name, None)
+        if stmt.superclass is not None:
+            stmt.superclass.accept(self)
+            self.scopes.append({"super": None})
+        # methods are never helpers, as they are not called by name
+        self.scopes.append({"this": None})
+        for method in stmt.methods:
+            self._function(method)
+        self.scopes.pop()
+        if stmt.superclass is not None:
+            self.scopes.pop()
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        expr.value.accept(self)
+        self._escape(self._lookup(expr, expr.name))
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_call_expr(self, expr: Call) -> None:
+        function = None
+        if isinstance(expr.callee, Variable):
+            function = self._lookup(expr.callee, expr.callee.name)
+        if function is None:
+            expr.callee.accept(self)
+        elif function in self.functions:
+            # recursive
+            self._escape(function)
+        elif len(expr.arguments) == len(function.params):
+            self.position += 1
+            self.calls.append((expr, function, self.position))
+        # calls with the wrong arity are left alone to fail at runtime
+
+        for argument in expr.arguments:
+            argument.accept(self)
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        expr.expr.accept(self)
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        pass
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        expr.right.accept(self)
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        # any use other than a direct call lets the function escape
+        self._escape(self._lookup(expr, expr.name))
+
+    def visit_inlined_expr(self, expr: Inlined) -> None:
+        for argument in expr.arguments:
+            argument.accept(self)
+        self.scopes.append({})
+        for param in expr.params:
+            self._declare(param, None)
+        expr.body.accept(self)
+        self.scopes.pop()
+
+    def visit_get_expr(self, expr: Get) -> None:
+        expr.object.accept(self)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        expr.object.accept(self)
+        expr.value.accept(self)
+
+    def visit_this_expr(self, expr: This) -> None:
+        pass
+
+    def visit_super_expr(self, expr: Super) -> None:
+        pass
+
+    def _function(self, stmt: Function) -> None:
+        self.functions.append(stmt)
+        self.scopes.append({})
+        for param in stmt.params:
+            self._declare(param, None)
+        for statement in stmt.body:
+            statement.accept(self)
+        self.scopes.pop()
+        self.functions.pop()
+
+    def _declare(self, name: Token, function: Function | None) -> None:
+        if not self.scopes:
+            return
+        scope = self.scopes[-1]
+        # redeclaring a helper's name in its scope disqualifies it
+        self._escape(scope.get(name.lexeme))
+        scope[name.lexeme] = function
+
+    def _lookup(self, expr: Expr, name: Token) -> Function | None:
+        depth = self.locals_.get(expr)
+        if depth is None:
+            return self.globals_.get(name.lexeme)
+        return self.scopes[-1 - depth].get(name.lexeme)
+
+    def _escape(self, function: Function | None) -> None:
+        if function is not None:
+            self.eligible[function] = False
+
+
+class _Clone(ExprVisitor):
+    """
+    Copies a helper's returned expression for one call site, resolving the
+    copies for their new position. The body's own locals keep their
+    distance; locals of the helper's enclosing scopes are `shift` scopes
+    further away at the call site.
+    """
+
+    def __init__(self, target, shift: int):
+        self.target = target
+        self.shift = shift
+        # inlined scopes entered within the copied expression
+        self.level = 0
+
+    def clone(self, expr: Expr) -> Expr:
+        return expr.accept(self)
+
+    def visit_assign_expr(self, expr: Assign) -> Expr:
+        copy = Assign(expr.name, self.clone(expr.value))
+        self._resolve(expr, copy)
+        return copy
+
+    def visit_binary_expr(self, expr: Binary) -> Expr:
+        return Binary(self.clone(expr.left), expr.operator, self.clone(expr.right))
+
+    def visit_call_expr(self, expr: Call) -> Expr:
+        return Call(self.clone(expr.callee), expr.paren, [self.clone(argument) for argument in expr.arguments])
+
+    def visit_grouping_expr(self, expr: Grouping) -> Expr:
+        return Grouping(self.clone(expr.expr))
+
+    def visit_literal_expr(self, expr: Literal) -> Expr:
+        return expr
+
+    def visit_logical_expr(self, expr: Logical) -> Expr:
+        return Logical(self.clone(expr.left), expr.operator, self.clone(expr.right))
+
+    def visit_unary_expr(self, expr: Unary) -> Expr:
+        return Unary(expr.operator, self.clone(expr.right))
+
+    def visit_variable_expr(self, expr: Variable) -> Expr:
+        copy = Variable(expr.name)
+        self._resolve(expr, copy)
+        return copy
+
+    def visit_inlined_expr(self, expr: Inlined) -> Expr:
+        arguments = [self.clone(argument) for argument in expr.arguments]
+        self.level += 1
+        body = self.clone(expr.body)
+        self.level -= 1
+        depth = expr.depth
+        if depth is not None and depth > self.level:
+            depth += self.shift
+        return Inlined(
+            expr.name,
+            [_copy_token(param) for param in expr.params],
+            arguments,
+            body,
+            expr.function,
+            depth,
+        )
+
+    def visit_get_expr(self, expr: Get) -> Expr:
+        return Get(self.clone(expr.object), expr.name)
+
+    def visit_set_expr(self, expr: Set) -> Expr:
+        return Set(self.clone(expr.object), expr.name, self.clone(expr.value))
+
+    def visit_this_expr(self, expr: This) -> Expr:
+        copy = This(expr.keyword)
+        self._resolve(expr, copy)
+        return copy
+
+    def visit_super_expr(self, expr: Super) -> Expr:
+        copy = Super(expr.keyword, expr.method)
+        self._resolve(expr, copy)
+        return copy
+
+    def _resolve(self, original: Expr, copy: Expr) -> None:
+        depth = self.target.locals_.get(original)
+        if depth is None:
+            self.target.resolve_global(copy, original.name)
+        elif depth <= self.level:
+            self.target.resolve(copy, depth)
+        else:
+            self.target.resolve(copy, depth + self.shift)
+
+
+def _copy_token(token: Token) -> Token:
+    # each inlined scope gets its own param tokens, as the transpiler keys
+    # declarations by token
+    return Token(token.type, token.lexeme, token.literal, token.line)
+
+
+class Inliner(ExprVisitor, StmtVisitor):
+    """
+    AST pass that inlines small helper functions at their call sites (see
+    _Survey for which), saving the tree-walker a full call per use. Call
+    sites become Inlined nodes that bind the arguments to the params in a
+    scope of their own, so no renaming is needed.
+
+    Runs on a resolved program; the copies are resolved into `target`, the
+    interpreter (or transpiler) the program was resolved for. Helpers whose
+    bodies contain calls to other helpers get those inlined first, as long
+    as the result stays within the budget.
+    """
+
+    def __init__(self, target, budget: int = INLINE_BUDGET):
+        self.target = target
+        self.budget = budget
+
+    def inline(self, statements: list[Stmt]) -> None:
+        survey = _Survey(self.target.locals_, self.budget)
+        survey.survey(statements)
+        self.sites = survey.sites
+        self.eligible = survey.eligible
+        # returned expressions of helpers, once rewritten themselves
+        self.bodies: dict[Function, Expr] = {}
+
+        for statement in statements:
+            statement.accept(self)
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        for statement in stmt.statements:
+            statement.accept(self)
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression = self._rewrite(stmt.expression)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        for statement in stmt.body:
+            statement.accept(self)
+        if self.eligible.get(stmt):
+            returned = _returned(stmt)
+            if _size(returned) <= self.budget:
+                self.bodies[stmt] = returned
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        stmt.condition = self._rewrite(stmt.condition)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        stmt.expression = self._rewrite(stmt.expression)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            stmt.value = self._rewrite(stmt.value)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        if stmt.initializer is not None:
+            stmt.initializer = self._rewrite(stmt.initializer)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        stmt.condition = self._rewrite(stmt.condition)
+        stmt.loop_body.accept(self)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        for method in stmt.methods:
+            method.accept(self)
+
+    def visit_assign_expr(self, expr: Assign) -> Expr:
+        expr.value = self._rewrite(expr.value)
+        return expr
+
+    def visit_binary_expr(self, expr: Binary) -> Expr:
+        expr.left = self._rewrite(expr.left)
+        expr.right = self._rewrite(expr.right)
+        return expr
+
+    def visit_call_expr(self, expr: Call) -> Expr:
+        expr.callee = self._rewrite(expr.callee)
+        expr.arguments = [self._rewrite(argument) for argument in expr.arguments]
+
+        function = self.sites.get(expr)
+        if function is None or function not in self.bodies:
+            return expr
+
+        # locals the helper closes over are as far from the call site as
+        # the helper itself
+        depth = self.target.locals_.get(expr.callee)
+        body = _Clone(self.target, depth or 0).clone(self.bodies[function])
+        params = [_copy_token(param) for param in function.params]
+        return Inlined(expr.callee.name, params, expr.arguments, body, function, depth)
+
+    def visit_grouping_expr(self, expr: Grouping) -> Expr:
+        expr.expr = self._rewrite(expr.expr)
+        return expr
+
+    def visit_literal_expr(self, expr: Literal) -> Expr:
+        return expr
+
+    def visit_logical_expr(self, expr: Logical) -> Expr:
+        expr.left = self._rewrite(expr.left)
+        expr.right = self._rewrite(expr.right)
+        return expr
+
+    def visit_unary_expr(self, expr: Unary) -> Expr:
+        expr.right = self._rewrite(expr.right)
+        return expr
+
+    def visit_variable_expr(self, expr: Variable) -> Expr:
+        return expr
+
+    def visit_inlined_expr(self, expr: Inlined) -> Expr:
+        expr.arguments = [self._rewrite(argument) for argument in expr.arguments]
+        expr.body = self._rewrite(expr.body)
+        return expr
+
+    def visit_get_expr(self, expr: Get) -> Expr:
+        expr.object = self._rewrite(expr.object)
+        return expr
+
+    def visit_set_expr(self, expr: Set) -> Expr:
+        expr.object = self._rewrite(expr.object)
+        expr.value = self._rewrite(expr.value)
+        return expr
+
+    def visit_this_expr(self, expr: This) -> Expr:
+        return expr
+
+    def visit_super_expr(self, expr: Super) -> Expr:
+        return expr
+
+    def _rewrite(self, expr: Expr) -> Expr:
+        return expr.accept(self)
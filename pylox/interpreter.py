@@ -1,30 +1,115 @@
-from pylox.expr import *
-from pylox.environment import Environment
+import operator
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.budget import Budget, overflow, reset_running, set_running
+from pylox.environment import Environment, Frames, Globals
 from pylox.callable import LoxCallable
 from pylox.function import LoxFunction
+from pylox.lox_class import LoxClass, LoxInstance, cache_get, cache_set
 from pylox.error import LoxRuntimeError, report_runtime_error
 from pylox.return_exc import ReturnException
+from pylox.token import Token
 from pylox.token_type import TokenType
-from pylox.native import Clock
+from pylox.native import NativeFunction, natives
+from pylox.rope import Rope, concat
+from pylox.tiering import Tiering
+from pylox.values import NUMBER, STRING, divide, stringify
+
+
+# operators on operands pylox.inference proved are numbers, by lexeme (which
+# hashes faster than the TokenType enum)
+_NUMBER_OPERATORS = {
+    "-": operator.sub,
+    "+": operator.add,
+    "*": operator.mul,
+    "/": divide,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
 
 
 class Interpreter(ExprVisitor, StmtVisitor):
-    environment: Environment = Environment()
-    locals_: dict[Expr, int] = {}
+    # whether lox calls are coroutines to await (pylox.cooperative), which
+    # natives calling back into lox code cannot make
+    cooperative = False
+    # called with each call site and the callable it is about to call, when
+    # recording a profile (see pylox.profiling); None otherwise
+    on_call = None
+
+    def __init__(self, stdout=None, budget: Budget = None):
+        self.environment: Environment = Environment()
+        self.globals: Globals = Globals()
+        self.locals_: dict[Expr, int] = {}
+        self.global_slots: dict[Expr, int] = {}
+        self.tiering = Tiering()
+        # the LoxFunction being tree-walked, whose loops count as back-edges
+        self.function: LoxFunction = None
+        # where print statements write (sys.stdout when None), so that
+        # interpreters running side by side keep their output apart
+        self.stdout = stdout
+        # limits on each run (see pylox.budget), set before the first; None
+        # for none
+        self.budget = budget
 
-    def interpret(self, statements: list[Stmt]) -> None:
         # add in natives
-        self.environment.globals["clock"] = Clock()
+        for name, native in natives().items():
+            self.globals.define(name, native)
 
+    def interpret(self, statements: list[Stmt]) -> None:
+        if self.budget is not None:
+            self.budget.start()
+        running = set_running(self.budget)
         try:
             for statement in statements:
                 self._execute(statement)
-        except RuntimeError as e:
+        except LoxRuntimeError as e:
+            if e.token is None:
+                # a long string printed past the memory budget, say
+                e.token = Token(TokenType.EOF, "", None, _first_line(statement))
             report_runtime_error(e)
+        except RecursionError:
+            # blocks nested too deeply for Python's stack, outside of any
+            # call (calls report it at their call site)
+            line = _first_line(statement)
+            report_runtime_error(overflow(self.budget, Token(TokenType.EOF, "", None, line)))
+        finally:
+            reset_running(running)
 
     def resolve(self, expr: Expr, depth: int):
         self.locals_[expr] = depth
 
+    def resolve_global(self, expr: Expr, name: Token):
+        self.global_slots[expr] = self.globals.slot(name.lexeme)
+
     def visit_literal_expr(self, expr: Literal) -> object:
         return expr.value
 
@@ -35,7 +120,7 @@ class Interpreter(ExprVisitor, StmtVisitor):
         if self._is_truthy(left) and (expr.operator.type == TokenType.OR):
             return left
         elif (not self._is_truthy(left)) and (expr.operator.type == TokenType.AND):
-            return False
+            return left
         else:
             return self._evaluate(expr.right)
 
@@ -45,8 +130,11 @@ class Interpreter(ExprVisitor, StmtVisitor):
     def visit_unary_expr(self, expr: Unary) -> object:
         right: object = self._evaluate(expr.right)
 
+        if expr.proven is NUMBER:
+            return -right
         if expr.operator.type == TokenType.MINUS:
-            return -float(right)
+            self._check_number_operand(expr.operator, right)
+            return -right
         elif expr.operator.type == TokenType.BANG:
             return not self._is_truthy(right)
         
@@ -59,12 +147,11 @@ class Interpreter(ExprVisitor, StmtVisitor):
     def visit_assign_expr(self, expr: Assign) -> object:
         value: object = self._evaluate(expr.value)
         
-        # distance: int = self.locals_.get(expr)
-        # if distance is not None:
-        #     self.environment.assign_at(distance, expr.name, value)
-        # else:
-        #     self.environment.globals[expr.name.lexeme] = value
-        self.environment.assign(expr.name, value)
+        distance: int = self.locals_.get(expr)
+        if distance is not None:
+            self.environment.assign_at(distance, expr.name, value)
+        else:
+            self.globals.assign(self.global_slots[expr], expr.name, value)
 
         return value
 
@@ -72,20 +159,28 @@ class Interpreter(ExprVisitor, StmtVisitor):
         left: object = self._evaluate(expr.left)
         right: object = self._evaluate(expr.right)
 
+        # proven operands need no checks (see pylox.inference)
+        if expr.proven is NUMBER:
+            return _NUMBER_OPERATORS[expr.operator.lexeme](left, right)
+        if expr.proven is STRING:
+            return self._concat(expr.operator, left, right)
+        if expr.speculated is NUMBER and type(left) is float and type(right) is float:
+            return _NUMBER_OPERATORS[expr.operator.lexeme](left, right)
+
         if expr.operator.type == TokenType.MINUS:
-            self._check_number_operand(expr.operator, right)
+            self._check_number_operands(expr.operator, left, right)
             return float(left) - float(right)
         elif expr.operator.type == TokenType.PLUS:
             # for numbers, this is addition
             if isinstance(left, float) and isinstance(right, float):
                 return float(left) + float(right)
-            # for strings, concatenate
-            if isinstance(left, str) and isinstance(right, str):
-                return left + right
+            # for strings, concatenate (long results become ropes)
+            if isinstance(left, (str, Rope)) and isinstance(right, (str, Rope)):
+                return self._concat(expr.operator, left, right)
             raise LoxRuntimeError(expr.operator, "Operands must be two numbers or two strings.")
         elif expr.operator.type == TokenType.SLASH:
             self._check_number_operands(expr.operator, left, right)
-            return float(left) / float(right)
+            return divide(left, right)
         elif expr.operator.type == TokenType.STAR:
             self._check_number_operands(expr.operator, left, right)
             return float(left) * float(right)
@@ -110,18 +205,148 @@ class Interpreter(ExprVisitor, StmtVisitor):
         return None
 
     def visit_call_expr(self, expr: Call) -> object:
-        callee = self._evaluate(expr.callee)
+        # `obj.method(...)` and `super.method(...)` call the method on the
+        # instance directly, without allocating a bound method for it
+        this = None
+        if type(expr.callee) is Get:
+            get = expr.callee
+            this = self._evaluate(get.object)
+            if type(this) is not LoxInstance:
+                raise LoxRuntimeError(get.name, "Only instances have properties.")
+            if this.shape is not get.shape:
+                cache_get(get, this.shape)
+            if get.slot is None:
+                callee = get.method
+            else:
+                # a field holding something callable
+                callee = this.fields[get.slot]
+                this = None
+        elif type(expr.callee) is Super:
+            callee, this = self._super_method(expr.callee)
+        else:
+            callee = self._evaluate(expr.callee)
         arguments: list[object] = []
         for argument in expr.arguments:
             arguments.append(self._evaluate(argument))
 
+        if type(callee) is NativeFunction:
+            # natives are called straight through, without the ABC check
+            if len(arguments) != callee.arg_count:
+                raise LoxRuntimeError(expr.paren, f"Expected {callee.arg_count} arguments but got {len(arguments)}.")
+            try:
+                return callee.function(*arguments)
+            except LoxRuntimeError as e:
+                # natives have no token of their own
+                if e.token is None:
+                    e.token = expr.paren
+                raise
+
+        if expr.target is not None and type(callee) is LoxFunction and callee.declaration is expr.target:
+            # the function a recorded profile saw called here, whose arity
+            # matched the call site's when the profile was applied
+            try:
+                return callee.call(self, arguments)
+            except LoxRuntimeError as e:
+                if e.token is None:
+                    e.token = expr.paren
+                raise
+
         if not isinstance(callee, LoxCallable):
             raise LoxRuntimeError(expr.paren, "Can only call functions and classes.")
 
         if len(arguments) != callee.arity():
             raise LoxRuntimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
 
-        return callee.call(self, arguments)
+        if self.on_call is not None:
+            self.on_call(expr, callee)
+        try:
+            if this is not None:
+                return callee.call(self, arguments, this)
+            return callee.call(self, arguments)
+        except LoxRuntimeError as e:
+            # natives taking the interpreter come this way too, as do budget
+            # errors raised as a call starts
+            if e.token is None:
+                e.token = expr.paren
+            raise
+
+    def visit_get_expr(self, expr: Get) -> object:
+        instance = self._evaluate(expr.object)
+        if type(instance) is not LoxInstance:
+            raise LoxRuntimeError(expr.name, "Only instances have properties.")
+        if instance.shape is not expr.shape:
+            cache_get(expr, instance.shape)
+        if expr.slot is not None:
+            return instance.fields[expr.slot]
+        return expr.method.bind(instance)
+
+    def visit_set_expr(self, expr: Set) -> object:
+        instance = self._evaluate(expr.object)
+        if type(instance) is not LoxInstance:
+            raise LoxRuntimeError(expr.name, "Only instances have fields.")
+        value: object = self._evaluate(expr.value)
+
+        if instance.shape is not expr.shape:
+            cache_set(expr, instance.shape)
+        if expr.transition is None:
+            instance.fields[expr.slot] = value
+        else:
+            instance.shape = expr.transition
+            instance.fields.append(value)
+        return value
+
+    def visit_this_expr(self, expr: This) -> object:
+        # always a local, so this skips the global fallback
+        blocks = self.environment.blocks
+        return blocks[len(blocks) - 1 - self.locals_[expr]]["this"]
+
+    def visit_super_expr(self, expr: Super) -> object:
+        method, instance = self._super_method(expr)
+        return method.bind(instance)
+
+    def visit_inlined_expr(self, expr: Inlined) -> object:
+        arguments = [self._evaluate(argument) for argument in expr.arguments]
+
+        if expr.compiled is None and not expr.tiered:
+            expr.calls += 1
+            if expr.calls >= self.tiering.call_threshold or expr.function in self.tiering.hot:
+                expr.tiered = True
+                expr.compiled = self.tiering.promote(expr.function, self, expr.calls)
+        if expr.compiled is not None:
+            # a hot call site runs the callee's compiled code instead, with
+            # the callee's closure cut out of the current environment
+            blocks = self.environment.blocks
+            closure = [] if expr.depth is None else blocks[: len(blocks) - expr.depth]
+            return expr.compiled(self, closure, *arguments)
+
+        frames = expr.frames
+        if frames is None:
+            frames = expr.frames = Frames.of([], expr.params)
+        # Frames.acquire() and clear(), inlined
+        free = frames.free
+        frame = None
+        if free:
+            try:
+                frame = free.pop()
+            except IndexError:
+                # another thread took the last one
+                pass
+        if frame is None:
+            frame = frames.empty.copy()
+        for param, value in zip(expr.params, arguments):
+            frame[param.lexeme] = value
+        environment = self.environment
+        environment.blocks.append(frame)
+        environment.innermost += 1
+        try:
+            return self._evaluate(expr.body)
+        finally:
+            environment.blocks.pop()
+            environment.innermost -= 1
+            # an inlined body is an expression, so nothing can capture this
+            # frame
+            frame.update(frames.empty)
+            free.append(frame)
 
     def visit_block_stmt(self, stmt: Block) -> None:
         self._execute_block(stmt.statements)
@@ -133,21 +358,44 @@ class Interpreter(ExprVisitor, StmtVisitor):
             self._execute(stmt.else_branch)
 
     def visit_while_stmt(self, stmt: While) -> None:
+        function = self.function
+        budget = self.budget
         while self._is_truthy(self._evaluate(stmt.condition)):
             self._execute(stmt.loop_body)
+            if function is not None:
+                function.loops += 1
+            if budget is not None:
+                budget.step(stmt.keyword)
 
     def visit_expression_stmt(self, stmt: Expression) -> None:
         self._evaluate(stmt.expression)
 
     def visit_function_stmt(self, stmt: Function) -> None:
         function: LoxFunction = LoxFunction(stmt, self.environment)
-        self.environment.define(stmt.name.lexeme, function)
-        # slight-of-hand to avoid rewriting the environment class
-        function.closure.define(stmt.name.lexeme, function)
+        # the closure shares the enclosing block, so this also makes the
+        # function visible to itself for recursion
+        self._define(stmt.name, function)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        superclass: LoxClass = None
+        if stmt.superclass is not None:
+            superclass = self._evaluate(stmt.superclass)
+            if not isinstance(superclass, LoxClass):
+                raise LoxRuntimeError(stmt.superclass.name, "Superclass must be a class.")
+
+        environment = self.environment
+        if superclass is not None:
+            environment = environment.capture()
+            environment.push({"super": superclass})
+        methods: dict[str, LoxFunction] = {}
+        for method in stmt.methods:
+            methods[method.name.lexeme] = LoxFunction(method, environment, method.name.lexeme == "init")
+
+        self._define(stmt.name, LoxClass(stmt.name.lexeme, superclass, methods))
 
     def visit_print_stmt(self, stmt: Print) -> None:
         value: object = self._evaluate(stmt.expression)
-        print(self._stringify(value))
+        print(self._stringify(value), file=self.stdout)
 
     def visit_return_stmt(self, stmt: Return) -> None:
         value: object = None
@@ -162,7 +410,17 @@ class Interpreter(ExprVisitor, StmtVisitor):
         if not stmt.initializer is None:
             value = self._evaluate(stmt.initializer)
         
-        self.environment.define(stmt.name.lexeme, value)
+        self._define(stmt.name, value)
+
+    def _super_method(self, expr: Super) -> tuple[LoxFunction, LoxInstance]:
+        distance: int = self.locals_[expr]
+        superclass: LoxClass = self.environment.get_at(distance, "super")
+        # `this` is bound in the scope just inside the one binding `super`
+        instance: LoxInstance = self.environment.get_at(distance - 1, "this")
+        method = superclass.find_method(expr.method.lexeme)
+        if method is None:
+            raise LoxRuntimeError(expr.method, f"Undefined property '{expr.method.lexeme}'.")
+        return method, instance
 
     def _execute(self, stmt: Stmt) -> None:
         stmt.accept(self)
@@ -182,14 +440,18 @@ class Interpreter(ExprVisitor, StmtVisitor):
         # self-reflection
         return expr.accept(self)
 
+    def _define(self, name: Token, value: object) -> None:
+        if self.environment.innermost < 0:
+            # top level
+            self.globals.define(name.lexeme, value)
+        else:
+            self.environment.define(name.lexeme, value)
+
     def _lookup_variable(self, name: Token, expr: Expr) -> object:
-        # dist: int = self.locals_.get(expr)
-        # if dist is not None:
-        #     return self.environment.get_at(dist, name.lexeme)
-        # else:
-        #     print("what?", expr, self.locals_)
-        #     return self.environment.globals[name.lexeme]
-        return self.environment.get(name)
+        dist: int = self.locals_.get(expr)
+        if dist is not None:
+            return self.environment.get_at(dist, name.lexeme)
+        return self.globals.get(self.global_slots[expr], name)
 
     def _is_truthy(self, obj: object) -> bool:
         # ruby semantics: false and nil are falsey, everything else is truthy!
@@ -203,15 +465,16 @@ class Interpreter(ExprVisitor, StmtVisitor):
         return x == y
 
     def _stringify(self, value: object) -> str:
-        if value is None:
-            return "nil"
-        if isinstance(value, float):
-            text: str = str(value)
-            if text.endswith(".0"):
-                text = str(int(float(text)))
-            return text
-        return str(value)
+        return stringify(value)
         
+    def _concat(self, operator: Token, left: object, right: object) -> object:
+        try:
+            return concat(left, right)
+        except LoxRuntimeError as e:
+            # a memory budget refusing the result
+            e.token = operator
+            raise
+
     def _check_number_operand(self, operator: Token, operand: object) -> None:
         if isinstance(operand, float):
             return
@@ -221,3 +484,21 @@ class Interpreter(ExprVisitor, StmtVisitor):
         if isinstance(left, float) and isinstance(right, float):
             return
         raise LoxRuntimeError(operator, "Operands must be numbers.")
+
+
+def _first_line(node: Stmt) -> int:
+    # the line of the first token in a statement, which has none of its own
+    # (nor may its parts: `print 1;` has no token left after parsing)
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if type(node) is Token:
+            return node.line
+        if isinstance(node, (Expr, Stmt)):
+            children = list(vars(node).values())
+        elif type(node) is list:
+            children = node
+        else:
+            continue
+        nodes.extend(reversed(children))
+    return 1
@@ -0,0 +1,658 @@
+from __future__ import annotations
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.token import Token
+from pylox.token_type import TokenType
+
+
+# A mid-level IR for the optimizer (see pylox.optimizer). Code is in
+# three-address form: every instruction computes at most one value into a
+# Temp, a name assigned exactly once, from operands that are Consts, Temps
+# or register Locals. Instructions sit in basic blocks (plain lists) that
+# nest inside structured control flow -- scopes, ifs and loops -- so the
+# optimized IR lifts straight back into a lox AST that every engine runs.
+
+
+class Unsupported(Exception):
+    """
+    Raised for programs the IR cannot represent; they run unoptimized.
+    """
+
+
+# operands
+
+class Const:
+    def __init__(self, value: object):
+        self.value = value
+
+
+class Temp:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class Local:
+    """
+    A local variable. Locals no closure captures are registers: nothing but
+    their own function can read or write them, so the IR uses them directly
+    as operands and the optimizer is free to rename, forward and drop them.
+    Captured locals live in memory, like globals, and go through LoadOp and
+    StoreOp.
+    """
+
+    def __init__(self, name: Token):
+        self.name = name
+        # the Unit declaring it
+        self.unit: Unit = None
+        self.captured = False
+        self.param = False
+        # declared by `fun`: its name shows when printed, so it is kept
+        self.function = False
+
+    @property
+    def register(self) -> bool:
+        return not self.captured
+
+
+class Global:
+    def __init__(self, name: str):
+        self.name = name
+
+
+# instructions
+
+class Instr:
+    """
+    An instruction. args are its operands in evaluation order; dest is the
+    Temp it computes, if any, and token the token runtime errors report.
+    """
+
+    dest: Temp | None = None
+    args: list
+    token: Token
+
+
+class MoveOp(Instr):
+    # reads a register local before a later operand assigns it
+    def __init__(self, dest: Temp, source: Local):
+        self.dest = dest
+        self.args = [source]
+        self.token = source.name
+
+
+class LoadOp(Instr):
+    def __init__(self, dest: Temp, var: Local | Global, name: Token):
+        self.dest = dest
+        self.var = var
+        self.args = []
+        self.token = name
+
+
+class StoreOp(Instr):
+    # dest is the assigned value, as for an assignment expression
+    def __init__(self, dest: Temp, var: Local | Global, name: Token, value):
+        self.dest = dest
+        self.var = var
+        self.args = [value]
+        self.token = name
+
+
+class DeclareOp(Instr):
+    def __init__(self, var: Local | Global, name: Token, value):
+        self.var = var
+        self.args = [value]
+        self.token = name
+
+
+class UnaryOp(Instr):
+    def __init__(self, dest: Temp, operator: Token, right):
+        self.dest = dest
+        self.args = [right]
+        self.token = operator
+
+
+class BinaryOp(Instr):
+    def __init__(self, dest: Temp, operator: Token, left, right):
+        self.dest = dest
+        self.args = [left, right]
+        self.token = operator
+
+
+class CallOp(Instr):
+    def __init__(self, dest: Temp, paren: Token, callee, arguments: list):
+        self.dest = dest
+        self.args = [callee, *arguments]
+        self.token = paren
+
+
+class LogicalOp(Instr):
+    # right is only run when left does not decide the result; it is a block
+    # of its own computing value
+    def __init__(self, dest: Temp, operator: Token, left, right: list, value):
+        self.dest = dest
+        self.args = [left]
+        self.right = right
+        self.value = value
+        self.token = operator
+
+
+class PrintOp(Instr):
+    def __init__(self, keyword: Token, value):
+        self.args = [value]
+        self.token = keyword
+
+
+class ReturnOp(Instr):
+    def __init__(self, keyword: Token, value):
+        self.args = [value]
+        self.token = keyword
+
+
+# control flow
+
+class ScopeNode:
+    def __init__(self, body: list):
+        self.body = body
+
+
+class IfNode:
+    def __init__(self, condition, then_branch: list, else_branch: list | None):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
+
+
+class LoopNode:
+    # header computes condition before every iteration
+    def __init__(self, keyword: Token, header: list, condition, body: list):
+        self.keyword = keyword
+        self.header = header
+        self.condition = condition
+        self.body = body
+
+
+class Unit:
+    """
+    A function body, or the top level of a program.
+    """
+
+    def __init__(self, body: list):
+        self.body = body
+
+
+class FunctionNode(Unit):
+    def __init__(self, var: Local | Global, name: Token, params: list[Local], body: list):
+        super().__init__(body)
+        self.var = var
+        self.name = name
+        self.params = params
+
+
+def _children(expr: Expr) -> list[Expr]:
+    if isinstance(expr, (Binary, Logical)):
+        return [expr.left, expr.right]
+    if isinstance(expr, Unary):
+        return [expr.right]
+    if isinstance(expr, Grouping):
+        return [expr.expr]
+    if isinstance(expr, Assign):
+        return [expr.value]
+    if isinstance(expr, Call):
+        return [expr.callee, *expr.arguments]
+    return []
+
+
+class Lowering(ExprVisitor, StmtVisitor):
+    """
+    Lowers a resolved program into the IR. Which locals are captured is only
+    known once the whole program has been seen, so lowering walks it twice.
+    """
+
+    def __init__(self, locals_: dict[Expr, int]):
+        self.locals_ = locals_
+        self._locals: dict[Token, Local] = {}
+        self._globals: dict[str, Global] = {}
+
+    def lower(self, statements: list[Stmt]) -> Unit:
+        self._lower(statements)
+        return self._lower(statements)
+
+    def _lower(self, statements: list[Stmt]) -> Unit:
+        self.temps = 0
+        self.scopes: list[dict[str, Local]] = []
+        self.unit = Unit([])
+        self.units: list[Unit] = [self.unit]
+        self.region = self.unit.body
+        for statement in statements:
+            statement.accept(self)
+        return self.unit
+
+    # statements
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        node = ScopeNode([])
+        self.region.append(node)
+        enclosing, self.region = self.region, node.body
+        self.scopes.append({})
+        for statement in stmt.statements:
+            statement.accept(self)
+        self.scopes.pop()
+        self.region = enclosing
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression.accept(self)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        var = self._declare(stmt.name)
+        if isinstance(var, Local):
+            var.function = True
+
+        node = FunctionNode(var, stmt.name, [], [])
+        self.units.append(node)
+        enclosing = self.unit, self.region
+        self.unit, self.region = node, node.body
+        self.scopes.append({})
+        for param in stmt.params:
+            local = self._declare(param)
+            local.param = True
+            node.params.append(local)
+        for statement in stmt.body:
+            statement.accept(self)
+        self.scopes.pop()
+        self.unit, self.region = enclosing
+        self.region.append(node)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        condition = stmt.condition.accept(self)
+        then_branch = self._branch(stmt.then_branch)
+        else_branch = None
+        if stmt.else_branch is not None:
+            else_branch = self._branch(stmt.else_branch)
+        self.region.append(IfNode(condition, then_branch, else_branch))
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        value = stmt.expression.accept(self)
+        self.region.append(PrintOp(None, value))
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        value = Const(None) if stmt.value is None else stmt.value.accept(self)
+        self.region.append(ReturnOp(stmt.keyword, value))
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        # declared first, as the resolver does: the initializer may assign it
+        var = self._declare(stmt.name)
+        if stmt.initializer is None:
+            self.region.append(DeclareOp(var, stmt.name, Const(None)))
+        elif isinstance(var, Local) and self._assigns(stmt.initializer, var):
+            # the variable has to exist before the initializer runs then
+            self.region.append(DeclareOp(var, stmt.name, Const(None)))
+            value = stmt.initializer.accept(self)
+            self.region.append(StoreOp(self._temp(), var, stmt.name, value))
+        else:
+            value = stmt.initializer.accept(self)
+            self.region.append(DeclareOp(var, stmt.name, value))
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        raise Unsupported("class")
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        enclosing, self.region = self.region, []
+        condition = stmt.condition.accept(self)
+        header, self.region = self.region, enclosing
+        self.region.append(LoopNode(stmt.keyword, header, condition, self._branch(stmt.loop_body)))
+
+    # expressions, lowered to the operand holding their value
+
+    def visit_assign_expr(self, expr: Assign):
+        value = expr.value.accept(self)
+        var = self._lookup(expr, expr.name)
+        return self._emit(StoreOp(self._temp(), var, expr.name, value))
+
+    def visit_binary_expr(self, expr: Binary):
+        left = self._operand(expr.left, [expr.right])
+        right = expr.right.accept(self)
+        return self._emit(BinaryOp(self._temp(), expr.operator, left, right))
+
+    def visit_call_expr(self, expr: Call):
+        callee = self._operand(expr.callee, expr.arguments)
+        arguments = [
+            self._operand(argument, expr.arguments[i + 1:])
+            for i, argument in enumerate(expr.arguments)
+        ]
+        return self._emit(CallOp(self._temp(), expr.paren, callee, arguments))
+
+    def visit_grouping_expr(self, expr: Grouping):
+        return expr.expr.accept(self)
+
+    def visit_literal_expr(self, expr: Literal):
+        return Const(expr.value)
+
+    def visit_logical_expr(self, expr: Logical):
+        left = expr.left.accept(self)
+        enclosing, self.region = self.region, []
+        value = expr.right.accept(self)
+        right, self.region = self.region, enclosing
+        return self._emit(LogicalOp(self._temp(), expr.operator, left, right, value))
+
+    def visit_unary_expr(self, expr: Unary):
+        right = expr.right.accept(self)
+        return self._emit(UnaryOp(self._temp(), expr.operator, right))
+
+    def visit_variable_expr(self, expr: Variable):
+        var = self._lookup(expr, expr.name)
+        if isinstance(var, Local) and var.register:
+            return var
+        return self._emit(LoadOp(self._temp(), var, expr.name))
+
+    def visit_inlined_expr(self, expr: Inlined):
+        # the optimizer runs before the inliner
+        raise Unsupported("inlined call")
+
+    def visit_get_expr(self, expr: Get):
+        raise Unsupported("property access")
+
+    def visit_set_expr(self, expr: Set):
+        raise Unsupported("property access")
+
+    def visit_this_expr(self, expr: This):
+        raise Unsupported("class")
+
+    def visit_super_expr(self, expr: Super):
+        raise Unsupported("class")
+
+    # helpers
+
+    def _branch(self, stmt: Stmt) -> list:
+        enclosing, self.region = self.region, []
+        stmt.accept(self)
+        branch, self.region = self.region, enclosing
+        return branch
+
+    def _operand(self, expr: Expr, later: list[Expr]):
+        # register locals are read when the instruction using them runs, so
+        # one a later operand assigns has to be read right away
+        value = expr.accept(self)
+        if isinstance(value, Local) and any(self._assigns(other, value) for other in later):
+            value = self._emit(MoveOp(self._temp(), value))
+        return value
+
+    def _assigns(self, expr: Expr, local: Local) -> bool:
+        if isinstance(expr, Assign) and self._lookup(expr, expr.name) is local:
+            return True
+        return any(self._assigns(child, local) for child in _children(expr))
+
+    def _emit(self, instr: Instr) -> Temp:
+        self.region.append(instr)
+        return instr.dest
+
+    def _temp(self) -> Temp:
+        self.temps += 1
+        return Temp(self.temps)
+
+    def _declare(self, name: Token) -> Local | Global:
+        if not self.scopes:
+            return self._global(name.lexeme)
+
+        scope = self.scopes[-1]
+        # redeclaring a name in the same scope reuses the variable, as the
+        # environment does
+        local = scope.get(name.lexeme)
+        if local is None:
+            local = self._locals.get(name)
+            if local is None:
+                local = Local(name)
+        self._locals[name] = local
+        local.unit = self.unit
+        scope[name.lexeme] = local
+        return local
+
+    def _lookup(self, expr: Expr, name: Token) -> Local | Global:
+        depth = self.locals_.get(expr)
+        if depth is None:
+            return self._global(name.lexeme)
+        local = self.scopes[-1 - depth][name.lexeme]
+        if local.unit is not self.unit:
+            local.captured = True
+        return local
+
+    def _global(self, name: str) -> Global:
+        if name not in self._globals:
+            self._globals[name] = Global(name)
+        return self._globals[name]
+
+
+class Lifting:
+    """
+    Lifts the IR back into a lox AST. Temps used once, in the block that
+    computes them, fold back into the expression using them; the rest (the
+    results of common subexpressions, hoisted invariants) become locals
+    named `_t<n>`. Register locals are renamed `<name>_<n>`, since copy
+    propagation may have moved their uses under a shadowing declaration.
+    Neither can clash with lox identifiers, which have no underscores.
+    """
+
+    def __init__(self):
+        self._names: dict[Local, Token] = {}
+
+    def lift(self, unit: Unit) -> list[Stmt]:
+        self._uses: dict[Temp, int] = {}
+        self._home: dict[Temp, list] = {}
+        self._user: dict[Temp, list] = {}
+        self._lines: dict[Temp, int] = {}
+        # variables declared so far
+        self._seen: set = set()
+        self._count(unit.body)
+        return self._statements(unit.body)
+
+    def _count(self, region: list) -> None:
+        for node in region:
+            if isinstance(node, Instr):
+                for arg in node.args:
+                    self._use(arg, region)
+                if node.dest is not None:
+                    self._home[node.dest] = region
+                    self._lines[node.dest] = node.token.line
+                if isinstance(node, LogicalOp):
+                    self._count(node.right)
+                    self._use(node.value, node.right)
+            elif isinstance(node, IfNode):
+                self._use(node.condition, region)
+                self._count(node.then_branch)
+                if node.else_branch is not None:
+                    self._count(node.else_branch)
+            elif isinstance(node, LoopNode):
+                self._count(node.header)
+                self._use(node.condition, node.header)
+                self._count(node.body)
+            else:
+                self._count(node.body)
+
+    def _use(self, operand, region: list) -> None:
+        if isinstance(operand, Temp):
+            self._uses[operand] = self._uses.get(operand, 0) + 1
+            self._user[operand] = region
+
+    def _foldable(self, temp: Temp) -> bool:
+        return self._uses.get(temp) == 1 and self._user[temp] is self._home[temp]
+
+    # statements
+
+    def _statements(self, region: list) -> list[Stmt]:
+        statements: list[Stmt] = []
+        # expressions of foldable temps not used yet, in evaluation order
+        pending: list[tuple[Temp, Expr]] = []
+        for node in region:
+            if isinstance(node, Instr):
+                self._instr(node, statements, pending)
+            elif isinstance(node, IfNode):
+                [condition] = self._args([node.condition], statements, pending)
+                self._flush(statements, pending)
+                else_branch = None
+                if node.else_branch is not None:
+                    else_branch = self._branch(node.else_branch)
+                statements.append(If(condition, self._branch(node.then_branch), else_branch))
+            elif isinstance(node, LoopNode):
+                self._flush(statements, pending)
+                condition = self._expression(node.header, node.condition)
+                statements.append(While(node.keyword, condition, self._branch(node.body)))
+            elif isinstance(node, FunctionNode):
+                self._flush(statements, pending)
+                params = [self._token(param) for param in node.params]
+                self._seen.update(node.params)
+                statements.append(Function(node.name, params, self._statements(node.body)))
+            else:
+                self._flush(statements, pending)
+                statements.append(Block(self._statements(node.body)))
+        self._flush(statements, pending)
+        return statements
+
+    def _branch(self, region: list) -> Stmt:
+        statements = self._statements(region)
+        if len(statements) == 1 and not isinstance(statements[0], (Var, Function)):
+            return statements[0]
+        return Block(statements)
+
+    def _expression(self, region: list, value) -> Expr:
+        statements: list[Stmt] = []
+        pending: list[tuple[Temp, Expr]] = []
+        for node in region:
+            if not isinstance(node, Instr):
+                raise Unsupported("control flow in an expression")
+            self._instr(node, statements, pending)
+        [expr] = self._args([value], statements, pending)
+        if statements or pending:
+            raise Unsupported("expression needs statements")
+        return expr
+
+    def _instr(self, instr: Instr, statements: list[Stmt], pending: list) -> None:
+        args = self._args(instr.args, statements, pending)
+
+        if isinstance(instr, PrintOp):
+            self._flush(statements, pending)
+            statements.append(Print(args[0]))
+            return
+        if isinstance(instr, ReturnOp):
+            self._flush(statements, pending)
+            value = None if self._is_nil(instr.args[0]) else args[0]
+            statements.append(Return(instr.token, value))
+            return
+        if isinstance(instr, DeclareOp):
+            self._flush(statements, pending)
+            name = self._declared(instr.var, instr.token)
+            if instr.var in self._seen:
+                # redeclaring a variable in its own scope just assigns it,
+                # and copies may have made the value read it
+                statements.append(Expression(Assign(name, args[0])))
+                return
+            self._seen.add(instr.var)
+            value = None if self._is_nil(instr.args[0]) else args[0]
+            statements.append(Var(name, value))
+            return
+
+        if isinstance(instr, MoveOp):
+            expr = Variable(self._token(instr.args[0]))
+        elif isinstance(instr, LoadOp):
+            expr = Variable(self._name(instr.var, instr.token))
+        elif isinstance(instr, StoreOp):
+            expr = Assign(self._name(instr.var, instr.token), args[0])
+        elif isinstance(instr, UnaryOp):
+            expr = Unary(instr.token, args[0])
+        elif isinstance(instr, BinaryOp):
+            expr = Binary(args[0], instr.token, args[1])
+        elif isinstance(instr, CallOp):
+            expr = Call(args[0], instr.token, args[1:])
+        else:
+            expr = Logical(args[0], instr.token, self._expression(instr.right, instr.value))
+
+        if not self._uses.get(instr.dest):
+            self._flush(statements, pending)
+            statements.append(Expression(expr))
+        elif self._foldable(instr.dest):
+            pending.append((instr.dest, expr))
+        else:
+            self._flush(statements, pending)
+            statements.append(Var(self._temp(instr.dest), expr))
+
+    def _args(self, operands: list, statements: list[Stmt], pending: list) -> list[Expr]:
+        waiting = [
+            operand for operand in operands
+            if any(temp is operand for temp, _ in pending)
+        ]
+        # folding keeps evaluation order only when the operands are exactly
+        # the latest pending expressions
+        if waiting and [temp for temp, _ in pending[-len(waiting):]] != waiting:
+            self._flush(statements, pending)
+            waiting = []
+        folded = {}
+        for _ in waiting:
+            temp, expr = pending.pop()
+            folded[temp] = expr
+        return [folded[operand] if operand in folded else self._operand(operand) for operand in operands]
+
+    def _flush(self, statements: list[Stmt], pending: list) -> None:
+        for temp, expr in pending:
+            statements.append(Var(self._temp(temp), expr))
+        pending.clear()
+
+    def _operand(self, operand) -> Expr:
+        if isinstance(operand, Const):
+            return Literal(operand.value)
+        if isinstance(operand, Temp):
+            return Variable(self._temp(operand))
+        return Variable(self._token(operand))
+
+    @staticmethod
+    def _is_nil(operand) -> bool:
+        return isinstance(operand, Const) and operand.value is None
+
+    # names
+
+    def _name(self, var: Local | Global, token: Token) -> Token:
+        # globals keep the token of the reference, whose line errors report
+        return token if isinstance(var, Global) else self._token(var)
+
+    def _declared(self, var: Local | Global, token: Token) -> Token:
+        # every declaration gets a token of its own, even when it redeclares
+        # a variable: the transpiler tells declarations apart by token
+        if isinstance(var, Global) or var.captured or var.function:
+            return token
+        return Token(TokenType.IDENTIFIER, self._token(var).lexeme, None, token.line)
+
+    def _token(self, local: Local) -> Token:
+        if local.captured or local.function:
+            return local.name
+        if local not in self._names:
+            name = local.name
+            lexeme = f"{name.lexeme}_{len(self._names) + 1}"
+            self._names[local] = Token(TokenType.IDENTIFIER, lexeme, None, name.line)
+        return self._names[local]
+
+    def _temp(self, temp: Temp) -> Token:
+        return Token(TokenType.IDENTIFIER, f"_t{temp.id}", None, self._lines.get(temp, 0))
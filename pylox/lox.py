@@ -1,12 +1,16 @@
 import os
 import sys
-import argparse
 
-from pylox.scanner import Scanner
-from pylox.parser import Parser
-from pylox.interpreter import Interpreter
-from pylox.resolver import Resolver
-from pylox.error import *
+# the rest of the pipeline (and argparse) is imported lazily, so the common
+# `pylox script.lox` path only loads what it actually runs
+from pylox import error
+
+
+SUBCOMMANDS = ("serve", "run")
+
+# "tree" walks the AST; "python" transpiles to python bytecode (see
+# pylox.transpiler)
+ENGINES = ("tree", "python")
 
 
 def main() -> None:
@@ -14,41 +18,154 @@ def main() -> None:
     Main entrypoint for pylox interpreter.
     """
 
+    argv = sys.argv[1:]
+
+    # fast paths that skip building an argument parser
+    if len(argv) == 0:
+        return run_prompt()
+    if len(argv) == 1 and not argv[0].startswith("-") and argv[0] not in SUBCOMMANDS:
+        return run_file(argv[0])
+    if len(argv) == 3 and argv[:2] == ["run", "--server"]:
+        from pylox.client import run_remote
+        sys.exit(run_remote(argv[2]))
+
+    if argv[0] in SUBCOMMANDS:
+        return _main_subcommand(argv[0], argv[1:])
+
+    import argparse
+
     parser = argparse.ArgumentParser(
-        usage="pylox [SCRIPT]",
+        usage="pylox [--engine ENGINE] [SCRIPT] | pylox serve | pylox run [--server] SCRIPT",
         description="Interpreter for the lox programming language."
     )
     parser.add_argument(
         "-v", "--version", action="version",
         version="0.1.0",
     )
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="tree",
+        help="execution engine for scripts",
+    )
+    parser.add_argument(
+        "--trace-tiers", action="store_true",
+        help="log functions promoted to compiled code by the tree engine",
+    )
+    parser.add_argument(
+        "--inline", action=argparse.BooleanOptionalAction, default=None,
+        help="inline small helper functions (default: on for the tree engine)",
+    )
+    parser.add_argument(
+        "--optimize", action=argparse.BooleanOptionalAction, default=True,
+        help="run the IR optimizer (pylox.optimizer) and type inference (pylox.inference) over scripts",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="record a runtime profile of the script on its first run and optimize later runs with it (tree engine)",
+    )
+    parser.add_argument(
+        "--plugins", action="store_true",
+        help="load natives from installed plugins (the pylox.natives entry point group)",
+    )
+    parser.add_argument(
+        "--parallel-parse", action="store_true",
+        help="scan and parse huge scripts in pieces on all cores (pylox.parallel_parse)",
+    )
     parser.add_argument("script", nargs='*')
     args = parser.parse_args()
+
+    if args.plugins:
+        from pylox.native import load_plugins
+        load_plugins()
     
     if len(args.script) > 1:
         raise ValueError("Usage: pylox [script]")
     elif len(args.script) == 1:
-        run_file(args.script[0])
+        run_file(
+            args.script[0], args.engine, args.trace_tiers, args.inline, args.optimize, args.profile, args.parallel_parse
+        )
     else:
         run_prompt()
 
 
-def run_file(path: str) -> None:
+def _main_subcommand(command: str, argv: list[str]) -> None:
     """
-    Reads lox script and runs it.
+    Handles the `serve` and `run` subcommands.
     """
 
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=f"pylox {command}")
+    parser.add_argument(
+        "--socket", default=None,
+        help="path of the server's unix socket",
+    )
+    if command == "serve":
+        args = parser.parse_args(argv)
+        from pylox.server import serve
+        serve(args.socket)
+        return
+
+    parser.add_argument(
+        "--server", action="store_true",
+        help="submit the script to a running `pylox serve` instance",
+    )
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="tree",
+        help="execution engine for scripts run locally",
+    )
+    parser.add_argument("script")
+    args = parser.parse_args(argv)
+    if args.server:
+        from pylox.client import run_remote
+        sys.exit(run_remote(args.script, args.socket))
+    run_file(args.script, args.engine)
+
+
+def run_file(
+    path: str,
+    engine: str = "tree",
+    trace_tiers: bool = False,
+    inline: bool = None,
+    optimize: bool = True,
+    profile: bool = False,
+    parallel: bool = False,
+) -> None:
+    """
+    Reads lox script and runs it. profile runs the tree engine with
+    profile-guided optimization (see pylox.profiling), and parallel parses
+    the script in pieces on worker processes (see pylox.parallel_parse).
+    """
+
+    if inline is None:
+        # python calls are cheap enough that inlining into generated code
+        # only makes it bigger; the tree engine saves a whole LoxFunction call
+        inline = engine == "tree"
+
     if not os.path.exists(path):
         raise FileNotFoundError("lox script not found!")
     
     with open(path, "r") as f:
         script = f.read()
-    run(script)
+    if engine == "python":
+        from pylox import transpiler
+        transpiler.run(script, path, inline, optimize, parallel)
+    elif trace_tiers or profile:
+        if profile:
+            from pylox.profiling import profiled_interpreter
+            interpreter = profiled_interpreter(path, script, inline, optimize)
+        else:
+            from pylox.interpreter import Interpreter
+            interpreter = Interpreter()
+        interpreter.tiering.trace = trace_tiers
+        run(script, interpreter, inline, optimize, parallel)
+    else:
+        run(script, inline=inline, optimize=optimize, parallel=parallel)
 
-    if had_error:
+    errors = error.current()
+    if errors.had_error:
         sys.exit(65)
 
-    if had_runtime_error:
+    if errors.had_runtime_error:
         sys.exit(70)
 
 
@@ -57,34 +174,109 @@ def run_prompt() -> None:
     Open interactive REPL.
     """
 
-    global had_error
+    from pylox.session import Session
 
+    session = Session()
     while True:
         try:
             print("> ", end="")
             line = input()
             if line == "":
                 continue
-            run(line)
-            had_error = False
+            session.run(line)
         except EOFError:
             break
 
 
-def run(script: str) -> None:
-    global had_error
+def run(
+    script: str,
+    interpreter=None,
+    inline: bool = False,
+    optimize: bool = False,
+    parallel: bool = False,
+) -> None:
+    """
+    Runs a script through the whole pipeline. Passing an interpreter keeps
+    its globals around for the next call (see pylox.session). inline runs
+    the inliner, which is only safe for whole programs: it assumes no later
+    code redefines the functions it inlines. optimize runs the IR optimizer
+    first, and type inference last so the engines can skip operand checks.
+    parallel scans and parses huge scripts on worker processes.
+    """
+
+    if interpreter is None:
+        from pylox.interpreter import Interpreter
+        interpreter = Interpreter()
+
+    # each run gets its own error flags, or an error left over from the last
+    # script a pooled thread ran would stop every later one from running
+    error.reset(error.current().stderr)
+    statements = prepare(script, interpreter, inline, optimize, parallel)
+    if statements is not None:
+        interpreter.interpret(statements)
+
+
+def prepare(script: str, interpreter, inline: bool = False, optimize: bool = False, parallel: bool = False):
+    """
+    The front half of run(): scans, parses and resolves a script for an
+    interpreter and runs the requested passes over it, unless it has no
+    loops or functions. Returns the statements, or None if the script had
+    compile errors.
+    """
+
+    if parallel:
+        from pylox.parallel_parse import parse
+        statements = parse(script, interpreter)
+    else:
+        from pylox.scanner import Scanner
+        from pylox.parser import Parser
+        from pylox.resolver import Resolver
+
+        scanner = Scanner(script)
+        tokens = scanner.scan_tokens()
+
+        # resolve while parsing, saving a second walk over the tree
+        parser = Parser(tokens, Resolver(interpreter))
+        statements = parser.parse()
+    if error.current().had_error:
+        return None
 
-    scanner = Scanner(script)
-    tokens = scanner.scan_tokens()
+    if not _repeats(statements):
+        # straight-line code: the passes (and importing them) would cost
+        # more than running each statement once saves
+        inline = optimize = False
+    if optimize:
+        from pylox.optimizer import Optimizer
+        Optimizer(interpreter).optimize(statements)
+    if inline:
+        from pylox.inliner import Inliner
+        Inliner(interpreter).inline(statements)
+    if optimize:
+        from pylox.inference import TypeInference
+        TypeInference(interpreter).infer(statements)
+    return statements
 
-    parser = Parser(tokens)
-    statements = parser.parse()
-    interpreter = Interpreter()
 
-    resolver = Resolver(interpreter)
-    resolver.resolve(statements)
+def _repeats(statements: list) -> bool:
+    # whether any statement may run more than once: a loop (`for` loops
+    # are parsed into whiles), or a function or class whose code may be
+    # called any number of times. Only statements can hold those, so
+    # expressions are not walked
+    from pylox.expr import Block, Class, Function, If, While
 
-    interpreter.interpret(statements)
+    pending = list(statements)
+    while pending:
+        statement = pending.pop()
+        kind = type(statement)
+        if kind is While or kind is Function or kind is Class:
+            return True
+        if kind is Block:
+            pending.extend(statement.statements)
+        elif kind is If:
+            pending.append(statement.then_branch)
+            if statement.else_branch is not None:
+                pending.append(statement.else_branch)
+    return False
 
 
 if __name__ == "__main__":
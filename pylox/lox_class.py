@@ -0,0 +1,107 @@
+from pylox.callable import LoxCallable
+from pylox.error import LoxRuntimeError
+from pylox.function import LoxFunction
+
+
+class Shape:
+    """
+    The layout of an instance's fields: which slot of its field list holds
+    each name. Instances of a class that got the same fields in the same
+    order share one shape, so a shape seen before at a property access
+    tells where the property is without looking up its name (see Get and
+    Set). Adding a field moves an instance to the next shape along a
+    transition, which is made once and then shared too.
+
+    Each class has its own root shape, so a shape also determines the class
+    and with it the methods.
+    """
+
+    __slots__ = ("klass", "slots", "transitions")
+
+    def __init__(self, klass: "LoxClass", slots: dict[str, int]):
+        self.klass = klass
+        self.slots = slots
+        self.transitions: dict[str, Shape] = {}
+
+    def add(self, name: str) -> "Shape":
+        shape = self.transitions.get(name)
+        if shape is None:
+            slots = dict(self.slots)
+            slots[name] = len(slots)
+            shape = self.transitions[name] = Shape(self.klass, slots)
+        return shape
+
+
+class LoxInstance:
+    __slots__ = ("shape", "fields")
+
+    def __init__(self, shape: Shape):
+        self.shape = shape
+        self.fields: list[object] = []
+
+    def __str__(self) -> str:
+        return f"{self.shape.klass.name} instance"
+
+
+class LoxClass(LoxCallable):
+    def __init__(self, name: str, superclass: "LoxClass", methods: dict[str, LoxFunction]):
+        self.name = name
+        self.superclass = superclass
+        # inherited methods are copied in, so finding one is a single lookup
+        self.methods: dict[str, LoxFunction] = {}
+        if superclass is not None:
+            self.methods.update(superclass.methods)
+        self.methods.update(methods)
+        self.shape = Shape(self, {})
+
+    def find_method(self, name: str) -> "LoxFunction | None":
+        return self.methods.get(name)
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        instance = LoxInstance(self.shape)
+        initializer = self.methods.get("init")
+        if initializer is not None:
+            initializer.call(interpreter, arguments, instance)
+        return instance
+
+    def arity(self) -> int:
+        initializer = self.methods.get("init")
+        if initializer is None:
+            return 0
+        return initializer.arity()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+# inline cache misses, shared by the tree-walker and the compiled tier
+
+def cache_get(expr, shape: Shape) -> None:
+    """
+    Points a Get node's cache at where its property is for instances of
+    this shape: a field first, then a method of the shape's class.
+    """
+
+    slot = shape.slots.get(expr.name.lexeme)
+    method = None
+    if slot is None:
+        method = shape.klass.find_method(expr.name.lexeme)
+        if method is None:
+            raise LoxRuntimeError(expr.name, f"Undefined property '{expr.name.lexeme}'.")
+    expr.shape = shape
+    expr.slot = slot
+    expr.method = method
+
+
+def cache_set(expr, shape: Shape) -> None:
+    """
+    Points a Set node's cache at its field's slot in this shape, or at the
+    shape that adds the field when it is new.
+    """
+
+    expr.shape = shape
+    expr.slot = shape.slots.get(expr.name.lexeme)
+    expr.transition = None
+    if expr.slot is None:
+        expr.slot = len(shape.slots)
+        expr.transition = shape.add(expr.name.lexeme)
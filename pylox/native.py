@@ -1,14 +1,330 @@
 import time
 
 from pylox.callable import LoxCallable
+from pylox.error import LoxRuntimeError
+from pylox.rope import Rope
+from pylox.values import stringify
 
 
-class Clock(LoxCallable):
+# code flag of `async def` functions (inspect.CO_COROUTINE, which costs
+# importing inspect)
+_CO_COROUTINE = 0x80
+
+
+class NativeFunction(LoxCallable):
+    """
+    A native backed by a plain python function taking the lox arguments
+    positionally. The engines call `function` directly, checking the
+    argument count against arg_count, rather than going through call().
+    Natives report errors by raising LoxRuntimeError without a token; the
+    call site fills in its own.
+
+    A pure native has no side effects and returns a value depending only on
+    its arguments, so the optimizer may fold calls to it whose arguments
+    are constants (see pylox.optimizer).
+
+    An `async def` native is kept as `coroutine`, for the interpreter that
+    can await it (pylox.cooperative); `function` raises in its place.
+    """
+
+    def __init__(self, name: str, arity: int, function, pure: bool = False):
+        self.name = name
+        self.arg_count = arity
+        self.function = function
+        self.coroutine = None
+        self.pure = pure
+
+        code = getattr(function, "__code__", None)
+        if code is not None and code.co_flags & _CO_COROUTINE:
+            self.coroutine = function
+            self.function = self._not_awaited
+
+    def _not_awaited(self, *arguments) -> object:
+        raise LoxRuntimeError(None, f"'{self.name}' can only be called by scripts run asynchronously.")
+
     def call(self, interpreter, arguments: list[object]) -> object:
-        return time.process_time()
+        return self.function(*arguments)
 
     def arity(self) -> int:
-        return 0
+        return self.arg_count
+
+    def __str__(self) -> str:
+        return f"<{self.name}:native fn>"
+
+
+class InterpreterNative(NativeFunction):
+    """
+    A native whose function takes the calling interpreter before the lox
+    arguments, for natives that need its state (pylox.parallel's, which
+    send functions along with their resolution). The engines reach these
+    through call(), and fill in tokens there too; the python engine leaves
+    scripts using one to the tree-walker.
+    """
+
+    def __init__(self, name: str, arity: int, function):
+        super().__init__(name, arity, self._no_interpreter)
+        self.with_interpreter = function
+
+    def _no_interpreter(self, *arguments) -> object:
+        raise LoxRuntimeError(None, f"'{self.name}' can only be called by the tree-walking interpreter.")
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        return self.with_interpreter(interpreter, *arguments)
+
+
+# the native registry: every interpreter (and transpiled program) created
+# gets the natives registered by then as globals
+
+_NATIVES: dict[str, NativeFunction] = {}
+
+# entry point group of plugin packages adding natives
+PLUGIN_GROUP = "pylox.natives"
+
+
+def register(
+    name: str,
+    function,
+    arity: int = None,
+    pure: bool = False,
+    interpreter: bool = False,
+) -> NativeFunction:
+    """
+    Registers a python function as the native `name`, replacing any native
+    of that name. arity defaults to the function's number of required
+    positional parameters. With interpreter set, the function is passed the
+    calling interpreter first (see InterpreterNative).
+    """
+
+    # built-ins go in first, so they never replace what embedding code
+    # registered
+    _load_builtins()
+    if arity is None:
+        import inspect
+
+        arity = sum(
+            1 for parameter in inspect.signature(function).parameters.values()
+            if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+            and parameter.default is parameter.empty
+        )
+        if interpreter:
+            arity -= 1
+    if interpreter:
+        registered = _NATIVES[name] = InterpreterNative(name, arity, function)
+    else:
+        registered = _NATIVES[name] = NativeFunction(name, arity, function, pure)
+    return registered
+
+
+def native(name: str = None, arity: int = None, pure: bool = False, interpreter: bool = False):
+    """
+    Decorator form of register(); the name defaults to the function's. The
+    function itself is returned unchanged:
+
+        @native(pure=True)
+        def hypot(x, y):
+            return math.hypot(x, y)
+    """
+
+    def decorate(function):
+        register(function.__name__ if name is None else name, function, arity, pure, interpreter)
+        return function
+
+    return decorate
+
+
+def natives() -> dict[str, NativeFunction]:
+    """
+    The registered natives by name.
+    """
+
+    _load_builtins()
+    return _NATIVES
+
+
+def load_plugins() -> None:
+    """
+    Imports the plugins installed under the PLUGIN_GROUP entry point group,
+    whose natives register themselves when imported (usually through the
+    decorator). Opt-in, as looking the plugins up costs more than starting
+    the interpreter does.
+    """
+
+    from importlib.metadata import entry_points
+
+    found = entry_points()
+    if hasattr(found, "select"):
+        found = found.select(group=PLUGIN_GROUP)
+    else:
+        # python 3.9 groups them in a dict
+        found = found.get(PLUGIN_GROUP, [])
+    for entry_point in found:
+        entry_point.load()
+
+
+def folding_key() -> bytes:
+    """
+    The names of the pure natives, whose calls optimized code may have
+    folded; caches of optimized code are keyed by it.
+    """
+
+    return " ".join(sorted(name for name, entry in natives().items() if entry.pure)).encode()
+
+
+# whether the built-in natives outside this module are all registered
+_builtins_loaded = False
+
+
+def _load_builtins() -> None:
+    # the built-in natives outside this module register when imported. The
+    # import lock makes a thread getting here while another is still
+    # importing wait until they all are in; the flag is only set once they
+    # are, so from then on this is a single check
+    global _builtins_loaded
+    if _builtins_loaded:
+        return
+    import pylox.arrays  # noqa: F401
+    import pylox.parallel  # noqa: F401
+
+    _builtins_loaded = True
+
+
+@native("clock", 0)
+def clock() -> float:
+    return time.process_time()
+
+
+# file I/O: openLines/nextLine stream a file a line at a time through a
+# buffered reader, readFile reads a whole file into one string, and
+# openWriter/write/writeLine buffer output until close
+
+# read and write in large chunks; scripts using these stream big files
+_BUFFER_SIZE = 1 << 16
+
+
+class LineReader:
+    __slots__ = ("path", "file")
+
+    def __init__(self, path: str, file):
+        self.path = path
+        self.file = file
+
+    def __str__(self) -> str:
+        return f"<lines {self.path}>"
+
+
+class FileWriter:
+    __slots__ = ("path", "file")
+
+    def __init__(self, path: str, file):
+        self.path = path
+        self.file = file
 
     def __str__(self) -> str:
-        return "<clock:native fn>"
+        return f"<writer {self.path}>"
+
+
+def _path(value: object) -> str:
+    if type(value) is Rope:
+        return str(value)
+    if type(value) is not str:
+        raise LoxRuntimeError(None, "Path must be a string.")
+    return value
+
+
+def _open(path: str, mode: str):
+    try:
+        return open(path, mode, buffering=_BUFFER_SIZE, encoding="utf-8")
+    except OSError as e:
+        raise LoxRuntimeError(None, f"Could not open '{path}': {e.strerror}.")
+
+
+@native("openLines", 1)
+def open_lines(path: object) -> LineReader:
+    path = _path(path)
+    return LineReader(path, _open(path, "r"))
+
+
+@native("nextLine", 1)
+def next_line(reader: object) -> object:
+    # the next line without its newline, or nil once the file is done (the
+    # reader is closed then)
+    if type(reader) is not LineReader:
+        raise LoxRuntimeError(None, "Expected a file opened with openLines.")
+    file = reader.file
+    if file.closed:
+        return None
+    try:
+        line = file.readline()
+    except UnicodeDecodeError:
+        raise LoxRuntimeError(None, f"'{reader.path}' is not valid UTF-8.")
+    if not line:
+        file.close()
+        return None
+    if line[-1] == "\n":
+        return line[:-1]
+    return line
+
+
+@native("readFile", 1)
+def read_file(path: object) -> str:
+    # lox strings are python strings, so the whole file is decoded; the
+    # newlines are the ones openLines would give
+    path = _path(path)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+    except OSError as e:
+        raise LoxRuntimeError(None, f"Could not read '{path}': {e.strerror}.")
+    except UnicodeDecodeError:
+        raise LoxRuntimeError(None, f"'{path}' is not valid UTF-8.")
+
+
+@native("openWriter", 1)
+def open_writer(path: object) -> FileWriter:
+    path = _path(path)
+    return FileWriter(path, _open(path, "w"))
+
+
+def _writer(writer: object):
+    if type(writer) is not FileWriter:
+        raise LoxRuntimeError(None, "Expected a file opened with openWriter.")
+    if writer.file.closed:
+        raise LoxRuntimeError(None, "File is closed.")
+    return writer.file
+
+
+def _write(writer: object, value: object, end: str) -> None:
+    file = _writer(writer)
+    try:
+        if type(value) is Rope:
+            # a long string goes out piece by piece, without joining it
+            file.writelines(value.pieces())
+        else:
+            file.write(stringify(value))
+        if end:
+            file.write(end)
+    except OSError as e:
+        raise LoxRuntimeError(None, f"Could not write '{writer.path}': {e.strerror}.")
+    return None
+
+
+@native("write", 2)
+def write(writer: object, value: object) -> None:
+    return _write(writer, value, "")
+
+
+@native("writeLine", 2)
+def write_line(writer: object, value: object) -> None:
+    return _write(writer, value, "\n")
+
+
+@native("close", 1)
+def close(file: object) -> None:
+    if type(file) is not LineReader and type(file) is not FileWriter:
+        raise LoxRuntimeError(None, "Expected a file.")
+    try:
+        file.file.close()
+    except OSError as e:
+        raise LoxRuntimeError(None, f"Could not write '{file.path}': {e.strerror}.")
+    return None
+
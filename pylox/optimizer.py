@@ -0,0 +1,558 @@
+from __future__ import annotations
+
+import math
+
+from pylox.expr import Stmt
+from pylox.ir import (
+    Unsupported,
+    Const,
+    Temp,
+    Local,
+    Global,
+    Instr,
+    MoveOp,
+    LoadOp,
+    StoreOp,
+    DeclareOp,
+    UnaryOp,
+    BinaryOp,
+    CallOp,
+    LogicalOp,
+    ReturnOp,
+    ScopeNode,
+    IfNode,
+    LoopNode,
+    Unit,
+    FunctionNode,
+    Lowering,
+    Lifting,
+)
+from pylox.native import NativeFunction, natives
+from pylox.token_type import TokenType
+
+
+# operators whose result is a number whenever they do not raise
+_NUMERIC = (TokenType.MINUS, TokenType.STAR, TokenType.SLASH)
+_EQUALITY = (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL)
+
+
+def _regions(node) -> list[list]:
+    # the blocks nested directly in a node, in execution order
+    if isinstance(node, LogicalOp):
+        return [node.right]
+    if isinstance(node, IfNode):
+        if node.else_branch is None:
+            return [node.then_branch]
+        return [node.then_branch, node.else_branch]
+    if isinstance(node, LoopNode):
+        return [node.header, node.body]
+    if isinstance(node, ScopeNode):
+        return [node.body]
+    return []
+
+
+def _walk(region: list):
+    """
+    Yields (block, node) for the nodes of a region and everything nested in
+    it, in program order. Nested functions are units of their own and are
+    not entered.
+    """
+
+    for node in region:
+        yield region, node
+        for nested in _regions(node):
+            yield from _walk(nested)
+
+
+def _register(var) -> bool:
+    return isinstance(var, Local) and var.register
+
+
+def _assigned(node) -> set[Local]:
+    # register locals a node may assign
+    assigned = set()
+    for region in _regions(node):
+        for _, inner in _walk(region):
+            if isinstance(inner, (StoreOp, DeclareOp)) and _register(inner.var):
+                assigned.add(inner.var)
+    return assigned
+
+
+class _Numbers:
+    """
+    Which operands of a unit are always numbers. Arithmetic produces a
+    number whenever it does not raise (`+` when either side is known to be
+    one); locals are numbers if every value assigned to them is. Solved
+    optimistically, so loop counters like `i = i + 1` count.
+    """
+
+    def __init__(self, unit: Unit):
+        instrs = [node for _, node in _walk(unit.body) if isinstance(node, Instr)]
+        self.known: set = {
+            instr.dest for instr in instrs
+            if isinstance(instr, (MoveOp, StoreOp, UnaryOp, BinaryOp))
+        }
+        defs: dict[Local, list] = {}
+        for instr in instrs:
+            if isinstance(instr, (StoreOp, DeclareOp)) and _register(instr.var):
+                defs.setdefault(instr.var, []).append(instr.args[0])
+        self.known.update(
+            local for local in defs
+            if not local.param and not local.function
+        )
+
+        changed = True
+        while changed:
+            changed = False
+            for instr in instrs:
+                if instr.dest in self.known and not self._numeric(instr):
+                    self.known.discard(instr.dest)
+                    changed = True
+            for local, values in defs.items():
+                if local in self.known and not all(self.number(value) for value in values):
+                    self.known.discard(local)
+                    changed = True
+
+    def number(self, operand) -> bool:
+        if isinstance(operand, Const):
+            return isinstance(operand.value, float)
+        return operand in self.known
+
+    def _numeric(self, instr: Instr) -> bool:
+        if isinstance(instr, (MoveOp, StoreOp)):
+            return self.number(instr.args[0])
+        if instr.token.type == TokenType.PLUS:
+            # `+` only succeeds on two numbers or two strings
+            return any(self.number(arg) for arg in instr.args)
+        return instr.token.type in _NUMERIC
+
+    def safe(self, instr: Instr) -> bool:
+        """
+        Whether an instruction is pure and cannot raise, so it can be dropped
+        or run speculatively.
+        """
+
+        if isinstance(instr, MoveOp):
+            return True
+        if isinstance(instr, UnaryOp):
+            return instr.token.type == TokenType.BANG or self.number(instr.args[0])
+        if isinstance(instr, BinaryOp):
+            return instr.token.type in _EQUALITY or all(self.number(arg) for arg in instr.args)
+        return False
+
+
+class _CopyPropagation:
+    """
+    Forwards copies (`var y = x;`, `y = 1;`) to the later uses of the copy,
+    as long as neither side is assigned in between. Only register locals
+    take part, and functions' own names are never forwarded.
+    """
+
+    def run(self, unit: Unit) -> None:
+        self._region(unit.body, {})
+
+    def _region(self, region: list, copies: dict) -> dict:
+        for node in region:
+            if isinstance(node, Instr):
+                callee = node.args[0] if isinstance(node, CallOp) else None
+                node.args = [copies.get(arg, arg) for arg in node.args]
+                if callee is not None and isinstance(node.args[0], Const):
+                    # calling a constant fails anyway; leave it to the variable
+                    node.args[0] = callee
+                if isinstance(node, LogicalOp):
+                    right = self._region(node.right, dict(copies))
+                    node.value = right.get(node.value, node.value)
+                    copies = self._meet(copies, right)
+
+                if isinstance(node, (StoreOp, DeclareOp)) and _register(node.var):
+                    self._kill(copies, node.var)
+                    if self._copyable(node.args[0]) and not node.var.function:
+                        copies[node.var] = node.args[0]
+                elif isinstance(node, MoveOp) and self._copyable(node.args[0]):
+                    copies[node.dest] = node.args[0]
+
+            elif isinstance(node, IfNode):
+                node.condition = copies.get(node.condition, node.condition)
+                then_copies = self._region(node.then_branch, dict(copies))
+                else_copies = copies
+                if node.else_branch is not None:
+                    else_copies = self._region(node.else_branch, dict(copies))
+                copies = self._meet(then_copies, else_copies)
+
+            elif isinstance(node, LoopNode):
+                # the header and body see copies from the previous iteration
+                for local in _assigned(node):
+                    self._kill(copies, local)
+                header = self._region(node.header, dict(copies))
+                node.condition = header.get(node.condition, node.condition)
+                self._region(node.body, header)
+
+            elif isinstance(node, FunctionNode):
+                if _register(node.var):
+                    self._kill(copies, node.var)
+
+            else:
+                inner = self._region(node.body, dict(copies))
+                declared = {
+                    inner_node.var for inner_node in node.body
+                    if isinstance(inner_node, (DeclareOp, FunctionNode))
+                }
+                copies = {
+                    key: value for key, value in inner.items()
+                    if key not in declared and value not in declared
+                }
+        return copies
+
+    @staticmethod
+    def _copyable(operand) -> bool:
+        return isinstance(operand, Const) or (
+            isinstance(operand, Local) and operand.register and not operand.function
+        )
+
+    @staticmethod
+    def _kill(copies: dict, local: Local) -> None:
+        for key in [key for key, value in copies.items() if key is local or value is local]:
+            del copies[key]
+
+    @staticmethod
+    def _meet(left: dict, right: dict) -> dict:
+        return {key: value for key, value in left.items() if right.get(key) is value}
+
+
+class _PureNatives:
+    """
+    Folds calls to pure natives (see pylox.native) whose arguments are all
+    constants into the value they return. Only natives the program never
+    redefines are folded, and only calls that succeed with a value lox can
+    write as a literal; the rest are left to run, and fail, as before.
+    """
+
+    def __init__(self, pure: dict[str, NativeFunction]):
+        self.pure = pure
+
+    def run(self, unit: Unit) -> None:
+        replace: dict[Temp, Const] = {}
+        loads: dict[Temp, tuple[list, LoadOp]] = {}
+        folded: list[tuple[list, Instr]] = []
+        for region, node in _walk(unit.body):
+            if not isinstance(node, Instr):
+                continue
+            node.args = [replace.get(arg, arg) for arg in node.args]
+            if isinstance(node, LoadOp) and isinstance(node.var, Global) and node.var.name in self.pure:
+                loads[node.dest] = (region, node)
+            elif isinstance(node, CallOp) and node.args[0] in loads:
+                load_region, load = loads[node.args[0]]
+                value = self._fold(self.pure[load.var.name], node.args[1:])
+                if value is not None:
+                    replace[node.dest] = value
+                    folded += [(load_region, load), (region, node)]
+
+        for region, node in folded:
+            region.remove(node)
+        # conditions and logical results are computed in blocks walked
+        # after the node using them
+        for _, node in _walk(unit.body):
+            if isinstance(node, (IfNode, LoopNode)):
+                node.condition = replace.get(node.condition, node.condition)
+            elif isinstance(node, LogicalOp):
+                node.value = replace.get(node.value, node.value)
+
+    @staticmethod
+    def _fold(native: NativeFunction, args: list) -> Const | None:
+        if len(args) != native.arg_count or not all(isinstance(arg, Const) for arg in args):
+            return None
+        try:
+            value = native.function(*[arg.value for arg in args])
+        except Exception:
+            return None
+        if value is None or type(value) in (bool, str):
+            return Const(value)
+        if type(value) is float and math.isfinite(value):
+            return Const(value)
+        return None
+
+
+class _CommonSubexpressions:
+    """
+    Local value numbering: within a basic block, an operation recomputing an
+    earlier one with the same operands reuses its result instead.
+    """
+
+    def run(self, unit: Unit) -> None:
+        self.replace: dict[Temp, Temp] = {}
+        self._region(unit.body, True)
+
+    def _region(self, region: list, numbering: bool) -> None:
+        table: dict[tuple, Temp] = {}
+        versions: dict[Local, int] = {}
+        kept = []
+        for node in region:
+            if isinstance(node, Instr):
+                node.args = [self.replace.get(arg, arg) for arg in node.args]
+                if isinstance(node, LogicalOp):
+                    self._region(node.right, False)
+                    node.value = self.replace.get(node.value, node.value)
+                    # assignments in there may or may not have happened
+                    table.clear()
+                elif isinstance(node, (StoreOp, DeclareOp)) and _register(node.var):
+                    versions[node.var] = versions.get(node.var, 0) + 1
+                elif numbering and isinstance(node, (UnaryOp, BinaryOp)):
+                    key = (type(node), node.token.type) + tuple(
+                        self._key(arg, versions) for arg in node.args
+                    )
+                    if key in table:
+                        self.replace[node.dest] = table[key]
+                        continue
+                    table[key] = node.dest
+            else:
+                if isinstance(node, IfNode):
+                    node.condition = self.replace.get(node.condition, node.condition)
+                if isinstance(node, LoopNode):
+                    self._region(node.header, False)
+                    node.condition = self.replace.get(node.condition, node.condition)
+                    self._region(node.body, True)
+                else:
+                    for nested in _regions(node):
+                        self._region(nested, True)
+                table.clear()
+            kept.append(node)
+        region[:] = kept
+
+    @staticmethod
+    def _key(operand, versions: dict[Local, int]) -> object:
+        if isinstance(operand, Const):
+            # repr tells 0.0 from -0.0, which divide differently
+            return (type(operand.value), repr(operand.value))
+        if isinstance(operand, Local):
+            return (operand, versions.get(operand, 0))
+        return operand
+
+
+class _LoopInvariants:
+    """
+    Hoists loop-invariant computations into a scope wrapping the loop, so
+    they run once instead of on every iteration. Only operations that are
+    pure and cannot raise move: hoisting runs them even if the loop never
+    does, and ahead of whatever the loop would have printed first.
+    """
+
+    def __init__(self, numbers: _Numbers):
+        self.numbers = numbers
+
+    def run(self, unit: Unit) -> None:
+        self._region(unit.body)
+
+    def _region(self, region: list) -> None:
+        for i, node in enumerate(region):
+            for nested in _regions(node):
+                self._region(nested)
+            if isinstance(node, LoopNode):
+                hoisted = self._hoist(node)
+                if hoisted:
+                    region[i] = ScopeNode(hoisted + [node])
+
+    def _hoist(self, loop: LoopNode) -> list[Instr]:
+        variant = _assigned(loop)
+        nodes = [
+            (block, node)
+            for region in _regions(loop)
+            for block, node in _walk(region)
+        ]
+        inside = {node.dest for _, node in nodes if isinstance(node, Instr)}
+
+        hoisted = []
+        for block, node in nodes:
+            if (
+                isinstance(node, (UnaryOp, BinaryOp))
+                and self.numbers.safe(node)
+                and all(self._invariant(arg, variant, inside) for arg in node.args)
+            ):
+                block.remove(node)
+                hoisted.append(node)
+                inside.discard(node.dest)
+        return hoisted
+
+    @staticmethod
+    def _invariant(operand, variant: set[Local], inside: set[Temp]) -> bool:
+        if isinstance(operand, Const):
+            return True
+        if isinstance(operand, Local):
+            return operand not in variant
+        return operand not in inside
+
+
+class _DeadStores:
+    """
+    Liveness over register locals: drops stores whose value is never read
+    again, and the pure computations left without a use. A declaration whose
+    value is dead stays, as `var x;`, while the variable is still assigned
+    elsewhere.
+    """
+
+    def __init__(self, numbers: _Numbers):
+        self.numbers = numbers
+
+    def run(self, unit: Unit) -> None:
+        self.uses: dict[Temp, int] = {}
+        self.refs: dict[Local, int] = {}
+        for _, node in _walk(unit.body):
+            for operand in self._operands(node):
+                self._count(operand, 1)
+            if isinstance(node, StoreOp):
+                self._count(node.var, 1)
+        self._region(unit.body, set(), True)
+
+    def _region(self, region: list, live: set[Local], delete: bool) -> set[Local]:
+        live = set(live)
+        kept = []
+        for node in reversed(region):
+            if isinstance(node, LogicalOp):
+                right_live = live | self._locals([node.value])
+                live |= self._region(node.right, right_live, delete)
+            elif isinstance(node, Instr):
+                if delete and self._dead(node, live):
+                    self._drop(node.args)
+                    continue
+                if isinstance(node, (StoreOp, DeclareOp)) and _register(node.var):
+                    live.discard(node.var)
+                if isinstance(node, ReturnOp):
+                    live = set()
+            elif isinstance(node, IfNode):
+                then_live = self._region(node.then_branch, live, delete)
+                if node.else_branch is not None:
+                    live = self._region(node.else_branch, live, delete)
+                live |= then_live
+            elif isinstance(node, LoopNode):
+                live = self._loop(node, live, delete)
+            elif isinstance(node, ScopeNode):
+                live = self._region(node.body, live, delete)
+            elif _register(node.var):
+                live.discard(node.var)
+
+            live |= self._locals(self._reads(node))
+            kept.append(node)
+        if delete:
+            region[:] = reversed(kept)
+        return live
+
+    def _loop(self, loop: LoopNode, live: set[Local], delete: bool) -> set[Local]:
+        condition = self._locals([loop.condition])
+        header_live: set[Local] = set()
+        while True:
+            after = live | condition | self._region(loop.body, header_live, False)
+            entry = self._region(loop.header, after, False)
+            if entry <= header_live:
+                break
+            header_live |= entry
+        if delete:
+            after = live | condition | self._region(loop.body, header_live, True)
+            self._region(loop.header, after, True)
+        return header_live
+
+    def _dead(self, instr: Instr, live: set[Local]) -> bool:
+        if isinstance(instr, DeclareOp):
+            if not _register(instr.var) or instr.var in live:
+                return False
+            if self.refs.get(instr.var, 0) == 0:
+                return True
+            # still assigned later: keep declaring it, without the value
+            if not (isinstance(instr.args[0], Const) and instr.args[0].value is None):
+                self._drop(instr.args)
+                instr.args = [Const(None)]
+            return False
+        if isinstance(instr, StoreOp):
+            if not _register(instr.var) or instr.var in live or self.uses.get(instr.dest):
+                return False
+            self._count(instr.var, -1)
+            return True
+        return instr.dest is not None and not self.uses.get(instr.dest) and self.numbers.safe(instr)
+
+    def _drop(self, operands: list) -> None:
+        for operand in operands:
+            self._count(operand, -1)
+
+    def _count(self, operand, n: int) -> None:
+        if isinstance(operand, Temp):
+            self.uses[operand] = self.uses.get(operand, 0) + n
+        elif _register(operand):
+            self.refs[operand] = self.refs.get(operand, 0) + n
+
+    @staticmethod
+    def _operands(node) -> list:
+        if isinstance(node, Instr):
+            if isinstance(node, LogicalOp):
+                return node.args + [node.value]
+            return node.args
+        if isinstance(node, (IfNode, LoopNode)):
+            return [node.condition]
+        return []
+
+    @staticmethod
+    def _reads(node) -> list:
+        # operands read by the node itself, not by the blocks nested in it
+        if isinstance(node, Instr):
+            return node.args
+        if isinstance(node, IfNode):
+            return [node.condition]
+        return []
+
+    @staticmethod
+    def _locals(operands: list) -> set[Local]:
+        return {operand for operand in operands if _register(operand)}
+
+
+class Optimizer:
+    """
+    Optimizes a resolved program through the mid-level IR (pylox.ir): copy
+    propagation, folding of pure native calls on constants, common
+    subexpression elimination within basic blocks, loop-invariant code
+    motion and dead store elimination, on the locals no closure captures.
+    The result is lifted back into an AST and resolved into `target`, the
+    interpreter (or transpiler) the program was resolved for, so every
+    engine runs it.
+
+    Runs before the inliner: it works on whole programs as written.
+    """
+
+    def __init__(self, target):
+        self.target = target
+
+    def optimize(self, statements: list[Stmt]) -> None:
+        from pylox.resolver import Resolver
+
+        try:
+            lowering = Lowering(self.target.locals_)
+            program = lowering.lower(statements)
+            pure = self._pure_natives(lowering.units)
+            for unit in lowering.units:
+                self._optimize(unit, pure)
+            optimized = Lifting().lift(program)
+        except (Unsupported, RecursionError):
+            # programs the IR cannot hold run as they are
+            return
+
+        Resolver(self.target).resolve(optimized)
+        statements[:] = optimized
+
+    def _optimize(self, unit: Unit, pure: dict[str, NativeFunction]) -> None:
+        _CopyPropagation().run(unit)
+        _PureNatives(pure).run(unit)
+        _CommonSubexpressions().run(unit)
+        numbers = _Numbers(unit)
+        _LoopInvariants(numbers).run(unit)
+        _DeadStores(numbers).run(unit)
+
+    @staticmethod
+    def _pure_natives(units: list[Unit]) -> dict[str, NativeFunction]:
+        # the pure natives whose names the program never assigns
+        assigned = {
+            node.var.name
+            for unit in units
+            for _, node in _walk(unit.body)
+            if isinstance(node, (StoreOp, DeclareOp, FunctionNode)) and isinstance(node.var, Global)
+        }
+        return {
+            name: native
+            for name, native in natives().items()
+            if native.pure and name not in assigned
+        }
@@ -0,0 +1,321 @@
+import _thread
+import io
+import os
+from array import array
+
+from pylox.callable import LoxCallable
+from pylox.environment import _UNDEFINED
+from pylox.error import LoxRuntimeError
+from pylox.expr import Expr, Stmt, Get, Set, Inlined
+from pylox.function import LoxFunction
+from pylox.lox_class import LoxClass, LoxInstance
+from pylox.native import NativeFunction, load_plugins, native, natives
+from pylox.rope import Rope
+from pylox.values import stringify
+
+
+# pmap and parallelFor call a lox function on every index of a range, in
+# chunks spread over a pool of worker processes. The function is sent as its
+# declaration's AST, together with the resolver's entries for it and copies
+# of the values it captures: its closure's blocks and the globals it reads,
+# with the functions and classes among those sent the same way. Each worker
+# rebuilds it on an interpreter of its own and keeps it for the next chunks
+# (and calls) of the same function, which then start without unpickling
+# anything, on code the compiled tier may already have made.
+#
+# Assignments to captured variables stay in the worker that made them, so
+# the function should be pure.
+
+# chunks per worker process, so that uneven ones still balance out
+_CHUNKS_PER_WORKER = 4
+# functions a worker keeps
+_KEPT = 8
+
+# node attributes that are caches, and what a sent node starts out with
+_CACHES = {
+    Inlined: {"calls": 0, "tiered": False, "compiled": None, "frames": None},
+    Get: {"shape": None, "slot": None, "method": None},
+    Set: {"shape": None, "slot": None, "transition": None},
+}
+_NO_CACHES = {}
+
+
+class _Captures:
+    """
+    What a function needs from the interpreter it was declared in: the
+    resolver's entries for the nodes of every function it can reach, and
+    the globals those read, by name.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.locals_: dict[Expr, int] = {}
+        self.global_names: dict[Expr, str] = {}
+        self.globals: dict[str, object] = {}
+        self._names = {slot: name for name, slot in interpreter.globals.slots.items()}
+        self._seen: set[int] = set()
+
+    def add(self, value: object) -> None:
+        values = [value]
+        while values:
+            value = values.pop()
+            if id(value) in self._seen:
+                continue
+            if type(value) is LoxFunction:
+                self._seen.add(id(value))
+                self._declaration(value.declaration, values)
+                for block in value.closure.blocks:
+                    values.extend(block.values())
+            elif type(value) is LoxClass:
+                self._seen.add(id(value))
+                values.extend(value.methods.values())
+                if value.superclass is not None:
+                    values.append(value.superclass)
+            elif type(value) is LoxInstance:
+                self._seen.add(id(value))
+                values.append(value.shape.klass)
+                values.extend(value.fields)
+
+    def _declaration(self, declaration: Stmt, values: list[object]) -> None:
+        interpreter = self.interpreter
+        nodes = [declaration]
+        while nodes:
+            node = nodes.pop()
+            if id(node) in self._seen:
+                continue
+            self._seen.add(id(node))
+
+            depth = interpreter.locals_.get(node)
+            if depth is not None:
+                self.locals_[node] = depth
+            slot = interpreter.global_slots.get(node)
+            if slot is not None:
+                name = self.global_names[node] = self._names[slot]
+                value = interpreter.globals.values[slot]
+                if name not in self.globals and value is not _UNDEFINED:
+                    self.globals[name] = value
+                    values.append(value)
+
+            caches = _CACHES.get(type(node), _NO_CACHES)
+            for attribute, child in vars(node).items():
+                if attribute in caches:
+                    continue
+                if isinstance(child, (Expr, Stmt)):
+                    nodes.append(child)
+                elif type(child) is list:
+                    nodes.extend(item for item in child if isinstance(item, (Expr, Stmt)))
+
+
+def _payload(interpreter, function: LoxCallable) -> bytes:
+    # imported here, as pickle costs more to import than the rest of this
+    # module
+    import copyreg
+    import pickle
+    from pylox.native import FileWriter, LineReader
+
+    class Pickler(pickle.Pickler):
+        # sends nodes and functions without their caches and tiering state,
+        # natives by name (each process has its own), and ropes flattened
+
+        def reducer_override(self, value: object):
+            if isinstance(value, (Expr, Stmt)):
+                state = dict(vars(value))
+                state.update(_CACHES.get(type(value), _NO_CACHES))
+                return copyreg.__newobj__, (type(value),), state
+            if type(value) is LoxFunction:
+                state = dict(vars(value))
+                state.update(calls=0, loops=0, tiered=False, compiled=None, environments=[])
+                return copyreg.__newobj__, (LoxFunction,), state
+            if isinstance(value, NativeFunction):
+                return _native, (value.name,)
+            if type(value) is Rope:
+                return str, (str(value),)
+            if type(value) is LineReader or type(value) is FileWriter:
+                raise LoxRuntimeError(None, f"Cannot send {stringify(value)} to worker processes.")
+            return NotImplemented
+
+    captures = _Captures(interpreter)
+    captures.add(function)
+    tiering = interpreter.tiering
+    buffer = io.BytesIO()
+    try:
+        Pickler(buffer, pickle.HIGHEST_PROTOCOL).dump((
+            function,
+            tiering.call_threshold,
+            tiering.loop_threshold,
+            captures.globals,
+            captures.locals_,
+            captures.global_names,
+        ))
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError) as e:
+        raise LoxRuntimeError(None, f"Cannot send the function to worker processes: {e}.")
+    return buffer.getvalue()
+
+
+def _native(name: str) -> NativeFunction:
+    found = natives().get(name)
+    if found is None:
+        raise LoxRuntimeError(None, f"Native '{name}' is not registered in worker processes.")
+    return found
+
+
+# worker processes
+
+_in_worker = False
+_jobs: dict[bytes, tuple] = {}
+
+
+def _start_worker(names: frozenset) -> None:
+    global _in_worker
+    _in_worker = True
+    if not names <= natives().keys():
+        # the parent loaded plugins; natives its __main__ module registers
+        # are registered again when spawning imports that module here
+        load_plugins()
+    # what running a function takes, imported before the first chunk comes
+    import pylox.interpreter  # noqa: F401
+    import pylox.transpiler  # noqa: F401
+
+
+def _job(key: bytes, payload: bytes) -> tuple:
+    job = _jobs.get(key)
+    if job is None:
+        import pickle
+        from pylox.interpreter import Interpreter
+
+        function, call_threshold, loop_threshold, globals_, locals_, global_names = pickle.loads(payload)
+        interpreter = Interpreter()
+        interpreter.tiering.call_threshold = call_threshold
+        interpreter.tiering.loop_threshold = loop_threshold
+        for name, value in globals_.items():
+            interpreter.globals.define(name, value)
+        interpreter.locals_.update(locals_)
+        for node, name in global_names.items():
+            interpreter.global_slots[node] = interpreter.globals.slot(name)
+        if len(_jobs) >= _KEPT:
+            del _jobs[next(iter(_jobs))]
+        job = _jobs[key] = interpreter, function
+    return job
+
+
+def _run_chunk(key: bytes, payload: bytes, start: int, end: int, collect: bool) -> tuple:
+    # the results of calling the function on start..end-1, what the calls
+    # printed, and the token and message of the error that stopped them
+    stdout = io.StringIO()
+    results = array("d")
+    try:
+        interpreter, function = _job(key, payload)
+        interpreter.stdout = stdout
+        _call_range(interpreter, function, start, end, results if collect else None)
+    except LoxRuntimeError as e:
+        return results, stdout.getvalue(), (e.token, e.error_msg)
+    return results, stdout.getvalue(), None
+
+
+def _call_range(interpreter, function: LoxCallable, start: int, end: int, results: array) -> None:
+    for i in range(start, end):
+        value = function.call(interpreter, [float(i)])
+        if results is not None:
+            if type(value) is not float:
+                raise LoxRuntimeError(None, "pmap results must be numbers.")
+            results.append(value)
+
+
+# the pool, started on first use and shared by the whole process (parsing
+# in pieces uses it too; see pylox.parallel_parse)
+
+_executor = None
+# threading.Lock(), without the cost of importing threading on every start
+_executor_lock = _thread.allocate_lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            try:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # spawned rather than forked: forking a process that may be
+                # running other threads is unsafe, and forked children were
+                # measured running lox code markedly slower than their parent
+                _executor = ProcessPoolExecutor(
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_start_worker,
+                    initargs=(frozenset(natives()),),
+                )
+            except (ImportError, OSError, NotImplementedError):
+                # no process support on this platform
+                return None
+        return _executor
+
+
+def _discard(pool) -> None:
+    # a pool with a dead worker, replaced on next use
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+
+
+def _map(interpreter, name: str, function: object, count: object, collect: bool) -> array:
+    from pylox.arrays import _integer
+
+    if interpreter.cooperative:
+        # the calls of a serial run would be coroutines, which a native
+        # cannot await
+        raise LoxRuntimeError(None, f"'{name}' is not supported in cooperative mode.")
+    if not isinstance(function, LoxCallable) or function.arity() != 1:
+        raise LoxRuntimeError(None, f"'{name}' expects a function taking one argument.")
+    n = _integer(count, "Count must be a non-negative integer.")
+    if n < 0:
+        raise LoxRuntimeError(None, "Count must be a non-negative integer.")
+
+    results = array("d")
+    # the calls run right here in a worker, without process support, and
+    # under a budget, which workers could not charge
+    pool = None if _in_worker or n == 0 or interpreter.budget is not None else _pool()
+    if pool is None:
+        _call_range(interpreter, function, 0, n, results if collect else None)
+        return results
+
+    import hashlib
+    from concurrent.futures.process import BrokenProcessPool
+
+    payload = _payload(interpreter, function)
+    key = hashlib.sha256(payload).digest()
+    chunks = min(n, (os.cpu_count() or 1) * _CHUNKS_PER_WORKER)
+    bounds = [n * k // chunks for k in range(chunks + 1)]
+    futures = [pool.submit(_run_chunk, key, payload, bounds[k], bounds[k + 1], collect) for k in range(chunks)]
+    try:
+        # in order, so the output comes out as a serial run would print it
+        for future in futures:
+            part, output, failure = future.result()
+            if output:
+                print(output, end="", file=interpreter.stdout)
+            results.extend(part)
+            if failure is not None:
+                raise LoxRuntimeError(*failure)
+    except BrokenProcessPool:
+        _discard(pool)
+        raise LoxRuntimeError(None, f"A worker process of '{name}' died.")
+    finally:
+        for future in futures:
+            future.cancel()
+    return results
+
+
+@native("pmap", 2, interpreter=True)
+def pmap(interpreter, function: object, count: object):
+    # an array of function(i) for every i from 0 to count - 1
+    from pylox.arrays import LoxArray
+
+    return LoxArray(_map(interpreter, "pmap", function, count, True))
+
+
+@native("parallelFor", 2, interpreter=True)
+def parallel_for(interpreter, function: object, count: object) -> None:
+    # calls function(i) for every i from 0 to count - 1, for what it prints
+    _map(interpreter, "parallelFor", function, count, False)
+    return None
@@ -0,0 +1,154 @@
+import gc
+import io
+import os
+from contextlib import contextmanager
+
+from pylox import error
+from pylox.expr import Expr, Stmt
+from pylox.incremental import declaration_bounds
+from pylox.parser import Parser
+from pylox.resolver import Resolver
+from pylox.scanner import Scanner
+from pylox.token import Token
+
+
+# Parsing a huge script in pieces, on the worker processes pylox.parallel
+# runs pmap on. A pre-scan for top-level declaration boundaries (see
+# incremental.declaration_bounds) cuts the source into pieces of about equal
+# size. Each worker scans, parses and resolves its pieces on its own,
+# starting their tokens at the right line. The workers send the statements
+# back with the resolver's results, and those are stitched together in
+# source order. Top-level names are globals, which the resolver leaves
+# late-bound, so no piece depends on another.
+#
+# Where a piece had errors, the pre-scan may have cut the script where the
+# parser would not have (an unclosed string throws off both), and the
+# parser's recovery would carry on differently. Scripts with errors are
+# therefore parsed again serially, which reports them exactly as usual; the
+# generated scripts this is for rarely have any.
+
+# pieces per worker process, so uneven ones still balance out
+_PIECES_PER_WORKER = 4
+# smallest piece worth sending to a worker; smaller scripts parse right here
+_MIN_PIECE = 1 << 18
+
+
+class _Resolutions:
+    """
+    Stands in for the interpreter while resolving a piece in a worker,
+    keeping what the resolver tells it for the real one.
+    """
+
+    def __init__(self):
+        self.locals_: dict[Expr, int] = {}
+        self.globals_: dict[Expr, Token] = {}
+
+    def resolve(self, expr: Expr, depth: int) -> None:
+        self.locals_[expr] = depth
+
+    def resolve_global(self, expr: Expr, name: Token) -> None:
+        self.globals_[expr] = name
+
+
+@contextmanager
+def _no_gc():
+    # an AST is all fresh objects and no cycles, which would otherwise set
+    # off full collections over and over while it is built or unpickled
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _parse(source: str, line: int, interpreter) -> list[Stmt]:
+    scanner = Scanner(source)
+    scanner.line = line
+    return Parser(scanner.scan_tokens(), Resolver(interpreter)).parse()
+
+
+def _parse_piece(source: str, line: int) -> tuple:
+    # in a worker: the statements of a piece and the resolver's results for
+    # them, or None if it had errors (reported by the serial parse instead)
+    errors = error.reset(io.StringIO())
+    resolutions = _Resolutions()
+    with _no_gc():
+        statements = _parse(source, line, resolutions)
+    if errors.had_error:
+        return None
+    return statements, resolutions.locals_, resolutions.globals_
+
+
+def _pieces(source: str, count: int) -> list[tuple[int, int, int]]:
+    # (start, end, first line) of about count pieces of equal size
+    pieces = []
+    size = len(source) / count
+    start, line, k = 0, 1, 1
+    for bound in declaration_bounds(source):
+        if bound < k * size:
+            continue
+        pieces.append((start, bound, line))
+        line += source.count("\n", start, bound)
+        start = bound
+        k = int(bound // size) + 1
+        if k >= count:
+            break
+    if start < len(source):
+        pieces.append((start, len(source), line))
+    return pieces
+
+
+def parse(source: str, interpreter) -> list[Stmt]:
+    """
+    Scans, parses and resolves a script for an interpreter (or anything
+    else the Resolver takes), splitting the work over worker processes.
+    Scripts too small to be worth it, machines with a single core and
+    scripts with errors get a plain serial parse.
+    """
+
+    from pylox import parallel
+
+    count = min((os.cpu_count() or 1) * _PIECES_PER_WORKER, len(source) // _MIN_PIECE)
+    pool = None if count < 2 or (os.cpu_count() or 1) < 2 else parallel._pool()
+    if pool is None:
+        return _parse(source, 1, interpreter)
+
+    import pickle
+    from concurrent.futures.process import BrokenProcessPool
+
+    with _no_gc():
+        pieces = _pieces(source, count)
+        if len(pieces) < 2:
+            # a script of one huge declaration
+            return _parse(source, 1, interpreter)
+        futures = [pool.submit(_parse_piece, source[start:end], line) for start, end, line in pieces]
+        results = []
+        try:
+            for future in futures:
+                result = future.result()
+                if result is None:
+                    break
+                results.append(result)
+        except BrokenProcessPool:
+            parallel._discard(pool)
+        except (pickle.PicklingError, RecursionError):
+            # an AST too deeply nested to send back
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+
+        if len(results) < len(futures):
+            return _parse(source, 1, interpreter)
+        statements: list[Stmt] = []
+        for part, locals_, globals_ in results:
+            # in source order, as the resolver would have told the
+            # interpreter about them
+            for expr, depth in locals_.items():
+                interpreter.resolve(expr, depth)
+            for expr, name in globals_.items():
+                interpreter.resolve_global(expr, name)
+            statements.extend(part)
+    return statements
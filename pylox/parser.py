@@ -1,19 +1,65 @@
-from typing import Optional
-
 from pylox.token_type import TokenType
 from pylox.token import Token
 from pylox.error import report
-from pylox.expr import *
+from pylox.resolver import Resolver, method_kind
+from pylox.expr import (
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+
+
+class Precedence:
+    """
+    Binding powers for expression parsing, loosest to tightest.
+    """
+
+    NONE = 0
+    ASSIGNMENT = 1
+    OR = 2
+    AND = 3
+    EQUALITY = 4
+    COMPARISON = 5
+    TERM = 6
+    FACTOR = 7
+    UNARY = 8
+    CALL = 9
+    PRIMARY = 10
 
 
 class Parser:
     """
-    Recursive descent parser.
+    Recursive descent parser for statements, with a table-driven Pratt
+    parser for expressions.
     """
 
-    def __init__(self, tokens: list[Token]):
+    def __init__(self, tokens: list[Token], resolver: Resolver = None):
         self.tokens = tokens
         self.current: int = 0
+        # single-pass mode: when a resolver is given, scopes are tracked and
+        # variables resolved as the tree is built, so no separate Resolver
+        # traversal is needed afterwards
+        self.resolver = resolver
 
     def parse(self) -> list[Stmt]:
         statements: list[Stmt] = []
@@ -24,6 +70,8 @@ class Parser:
 
     def declaration(self) -> Stmt:
         try:
+            if self._match(TokenType.CLASS):
+                return self.class_declaration()
             if self._match(TokenType.VAR):
                 return self.variable_declaration()
             if self._match(TokenType.FUN):
@@ -45,7 +93,11 @@ class Parser:
         if self._match(TokenType.RETURN):
             return self.return_stmt()
         if self._match(TokenType.LEFT_BRACE):
-            block = Block(self.block())
+            self._begin_scope()
+            try:
+                block = Block(self.block())
+            finally:
+                self._end_scope()
             return block
         return self.expr_stmt()
 
@@ -57,23 +109,61 @@ class Parser:
         self._consume(TokenType.RIGHT_BRACE, "Expect '}' after block.")
         return statements
 
+    def class_declaration(self) -> Stmt:
+        name: Token = self._consume(TokenType.IDENTIFIER, "Expect class name.")
+        self._declare(name)
+        self._define(name)
+
+        superclass: Variable | None = None
+        if self._match(TokenType.LESS):
+            self._consume(TokenType.IDENTIFIER, "Expect superclass name.")
+            superclass = Variable(self._previous())
+
+        self._consume(TokenType.LEFT_BRACE, "Expect '{' before class body.")
+        if self.resolver is not None:
+            self.resolver.begin_class(name, superclass)
+        try:
+            methods: list[Function] = []
+            while (not self._check(TokenType.RIGHT_BRACE)) and (not self._is_at_end):
+                methods.append(self.function("method"))
+        finally:
+            if self.resolver is not None:
+                self.resolver.end_class()
+
+        self._consume(TokenType.RIGHT_BRACE, "Expect '}' after class body.")
+        return Class(name, superclass, methods)
+
     def function(self, kind: str) -> Stmt:
         name: Token = self._consume(TokenType.IDENTIFIER, f"Expect {kind} name.")
-        self._consume(TokenType.LEFT_PAREN, f"Expect '(' after {kind} name.")
-        parameters: list[Token] = []
-        if not self._check(TokenType.RIGHT_PAREN):
-            while True:
-                if len(parameters) >= 255:
-                    self._error(self._peek(), "Can't have more than 255 arguments.")
-                
-                parameters.append(self._consume(TokenType.IDENTIFIER, "Expect parameter name."))
-                if not self._match(TokenType.COMMA):
-                    break
-
-        self._consume(TokenType.RIGHT_PAREN, "Expect ')' after parameters.")
+        if kind == "function":
+            # methods are found through their class, not as variables
+            self._declare(name)
+            self._define(name)
 
-        self._consume(TokenType.LEFT_BRACE, "Expect '{' before " + kind + " body.")
-        body: list[Stmt] = self.block()
+        self._consume(TokenType.LEFT_PAREN, f"Expect '(' after {kind} name.")
+        if self.resolver is not None:
+            self.resolver.begin_function(kind if kind == "function" else method_kind(name))
+        try:
+            parameters: list[Token] = []
+            if not self._check(TokenType.RIGHT_PAREN):
+                while True:
+                    if len(parameters) >= 255:
+                        self._error(self._peek(), "Can't have more than 255 arguments.")
+                    
+                    param: Token = self._consume(TokenType.IDENTIFIER, "Expect parameter name.")
+                    self._declare(param)
+                    self._define(param)
+                    parameters.append(param)
+                    if not self._match(TokenType.COMMA):
+                        break
+
+            self._consume(TokenType.RIGHT_PAREN, "Expect ')' after parameters.")
+
+            self._consume(TokenType.LEFT_BRACE, "Expect '{' before " + kind + " body.")
+            body: list[Stmt] = self.block()
+        finally:
+            if self.resolver is not None:
+                self.resolver.end_function()
         return Function(name, parameters, body)
 
     def if_stmt(self) -> Stmt:
@@ -82,43 +172,57 @@ class Parser:
         self._consume(TokenType.RIGHT_PAREN, "Expect ')' after if condition.")
 
         then_branch: Stmt = self.statement()
-        else_branch: Optional[Stmt] = None
+        else_branch: Stmt | None = None
         if self._match(TokenType.ELSE):
             else_branch = self.statement()
 
         return If(condition, then_branch, else_branch)
 
     def while_stmt(self) -> Stmt:
+        keyword: Token = self._previous()
         self._consume(TokenType.LEFT_PAREN, "Expect '(' after 'while'.")
         condition: Expr = self.expression()
         self._consume(TokenType.RIGHT_PAREN, "Expect ')' after while condition.")
         body: Stmt = self.statement()
-        return While(condition, body)
+        return While(keyword, condition, body)
 
     def for_stmt(self) -> Stmt:
+        keyword: Token = self._previous()
         self._consume(TokenType.LEFT_PAREN, "Expect '(' after 'for'.")
 
-        # parse initializer
-        if self._match(TokenType.SEMICOLON):
-            initializer = None
-        elif self._match(TokenType.VAR):
-            initializer = self.variable_declaration()
-        else:
-            initializer = self.expr_stmt()
-
-        # parse condition
-        condition: Optional[Expr] = None
-        if not self._check(TokenType.SEMICOLON):
-            condition = self.expression()
-        self._consume(TokenType.SEMICOLON, "Expect ';' after loop condition.")
-
-        # parse increment
-        increment: Optional[Expr] = None
-        if not self._check(TokenType.RIGHT_PAREN):
-            increment = self.expression()
-        self._consume(TokenType.RIGHT_PAREN, "Expect ')' after for clauses.")
-
-        loop_body: Stmt = self.statement()
+        # in single-pass mode, open the scopes of the Blocks the desugaring
+        # below wraps around the initializer and around body + increment
+        scopes = 0
+        try:
+            # parse initializer
+            if self._match(TokenType.SEMICOLON):
+                initializer = None
+            else:
+                self._begin_scope()
+                scopes += 1
+                if self._match(TokenType.VAR):
+                    initializer = self.variable_declaration()
+                else:
+                    initializer = self.expr_stmt()
+
+            # parse condition
+            condition: Expr | None = None
+            if not self._check(TokenType.SEMICOLON):
+                condition = self.expression()
+            self._consume(TokenType.SEMICOLON, "Expect ';' after loop condition.")
+
+            # parse increment
+            increment: Expr | None = None
+            if not self._check(TokenType.RIGHT_PAREN):
+                self._begin_scope()
+                scopes += 1
+                increment = self.expression()
+            self._consume(TokenType.RIGHT_PAREN, "Expect ')' after for clauses.")
+
+            loop_body: Stmt = self.statement()
+        finally:
+            for _ in range(scopes):
+                self._end_scope()
         # desugar for into while
         if increment is not None:
             loop_body = Block(
@@ -130,7 +234,7 @@ class Parser:
 
         if condition is None:
             condition = Literal(True)
-        loop_body = While(condition, loop_body)
+        loop_body = While(keyword, condition, loop_body)
 
         if initializer is not None:
             loop_body = Block(
@@ -154,14 +258,19 @@ class Parser:
             value = self.expression()
         
         self._consume(TokenType.SEMICOLON, "Expect ';' after return value.")
-        return Return(keyword, value)
+        stmt = Return(keyword, value)
+        if self.resolver is not None:
+            self.resolver.check_return(stmt)
+        return stmt
 
     def variable_declaration(self) -> Stmt:
         name: Token = self._consume(TokenType.IDENTIFIER, "Expect variable name.")
+        self._declare(name)
         initializer: Expr = None
         if self._match(TokenType.EQUAL):
             # optional initializer in lox language
             initializer = self.expression()
+        self._define(name)
 
         self._consume(TokenType.SEMICOLON, "Expect ';' after variable declaration")
         return Var(name, initializer)
@@ -172,101 +281,104 @@ class Parser:
         return Expression(expr)
 
     def expression(self) -> Expr:
-        return self.assignment()
+        return self._parse_precedence(Precedence.ASSIGNMENT)
+
+    def _parse_precedence(self, precedence: int) -> Expr:
+        # pratt parsing: one prefix rule for the leading token, then infix
+        # rules for as long as they bind at least as tightly as precedence
+        token: Token = self.tokens[self.current]
+        prefix = _PREFIX_RULES.get(token.type)
+        if prefix is None:
+            # report and carry on without an operand, like primary() did in
+            # the recursive descent parser, so the errors that follow match
+            self._error(token, "Expect expression.")
+            expr: Expr = None
+        else:
+            self.current += 1
+            expr = prefix(self, token)
 
-    def assignment(self) -> Expr:
-        # expr: Expr = self.equality()
-        expr: Expr = self.logical_or()
+        while True:
+            token = self.tokens[self.current]
+            rule = _INFIX_RULES.get(token.type)
+            if rule is None or rule[0] < precedence:
+                break
+            self.current += 1
+            expr = rule[1](self, expr, token, rule[0])
 
-        if self._match(TokenType.EQUAL):
-            equals: Token = self._previous()
-            value: Expr = self.assignment()
+        if precedence <= Precedence.ASSIGNMENT and self.tokens[self.current].type == TokenType.EQUAL:
+            equals: Token = self._advance()
+            value: Expr = self._parse_precedence(Precedence.ASSIGNMENT)
 
             if isinstance(expr, Variable):
-                name: Token = expr.name
-                return Assign(name, value)
+                assign = Assign(expr.name, value)
+                if self.resolver is not None:
+                    self.resolver.resolve_local(assign, assign.name)
+                return assign
+            if isinstance(expr, Get):
+                # the object was resolved as it was parsed
+                return Set(expr.object, expr.name, value)
             self._error(equals, "Invalid assignment target.")
         return expr
 
-    def logical_or(self) -> Expr:
-        expr: Expr = self.logical_and()
-        
-        while self._match(TokenType.OR):
-            operator: Token = self._previous()
-            right: Expr = self.logical_and()
-            expr = Logical(expr, operator, right)
-
-        return expr
-
-    def logical_and(self) -> Expr:
-        expr: Expr = self.equality()
+    # prefix rules
+    def _literal(self, token: Token) -> Expr:
+        return Literal(token.literal)
 
-        while self._match(TokenType.AND):
-            operator: Token = self._previous()
-            right: Expr = self.equality()
-            expr = Logical(expr, operator, right)
+    def _true(self, token: Token) -> Expr:
+        return Literal(True)
 
-        return expr
+    def _false(self, token: Token) -> Expr:
+        return Literal(False)
 
-    def equality(self) -> Expr:
-        expr: Expr = self.comparison()
-
-        while self._match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            operator: Token = self._previous()
-            right: Expr = self.comparison()
-            expr = Binary(expr, operator, right)
+    def _nil(self, token: Token) -> Expr:
+        return Literal(None)
 
+    def _variable(self, token: Token) -> Expr:
+        expr = Variable(token)
+        # an assignment target is resolved as an Assign instead
+        if self.resolver is not None and self.tokens[self.current].type != TokenType.EQUAL:
+            self.resolver.visit_variable_expr(expr)
         return expr
 
-    def comparison(self) -> Expr:
-        expr: Expr = self.term()
-
-        while self._match(TokenType.LESS, TokenType.LESS_EQUAL, TokenType.GREATER, TokenType.GREATER_EQUAL):
-            operator: Token = self._previous()
-            right: Expr = self.term()
-            expr = Binary(expr, operator, right)
-
+    def _this(self, token: Token) -> Expr:
+        expr = This(token)
+        if self.resolver is not None:
+            self.resolver.visit_this_expr(expr)
         return expr
 
-    def term(self) -> Expr:
-        expr: Expr = self.factor()
-
-        while self._match(TokenType.MINUS, TokenType.PLUS):
-            operator: Token = self._previous()
-            right: Expr = self.factor()
-            expr = Binary(expr, operator, right)
-
+    def _super(self, token: Token) -> Expr:
+        self._consume(TokenType.DOT, "Expect '.' after 'super'.")
+        method: Token = self._consume(TokenType.IDENTIFIER, "Expect superclass method name.")
+        expr = Super(token, method)
+        if self.resolver is not None:
+            self.resolver.visit_super_expr(expr)
         return expr
 
-    def factor(self) -> Expr:
-        expr: Expr = self.unary()
+    def _grouping(self, token: Token) -> Expr:
+        expr: Expr = self.expression()
+        self._consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
+        return Grouping(expr)
 
-        while self._match(TokenType.SLASH, TokenType.STAR):
-            operator: Token = self._previous()
-            right: Expr = self.unary()
-            expr = Binary(expr, operator, right)
+    def _unary(self, operator: Token) -> Expr:
+        right: Expr = self._parse_precedence(Precedence.UNARY)
+        return Unary(operator, right)
 
-        return expr
-
-    def unary(self) -> Expr:
-        if self._match(TokenType.BANG, TokenType.MINUS):
-            operator: Token = self._previous()
-            right: Expr = self.unary()
-            expr = Unary(operator, right)
-        else:
-            expr = self.call()
-        return expr
+    # infix rules
+    def _binary(self, left: Expr, operator: Token, precedence: int) -> Expr:
+        # left-associative: the right operand binds one level tighter
+        right: Expr = self._parse_precedence(precedence + 1)
+        return Binary(left, operator, right)
 
-    def call(self) -> Expr:
-        callee_expr: Expr = self.primary()
+    def _logical(self, left: Expr, operator: Token, precedence: int) -> Expr:
+        right: Expr = self._parse_precedence(precedence + 1)
+        return Logical(left, operator, right)
 
-        while True:
-            if self._match(TokenType.LEFT_PAREN):
-                callee_expr = self.finish_call(callee_expr)
-            else:
-                break
+    def _call(self, callee: Expr, paren: Token, precedence: int) -> Expr:
+        return self.finish_call(callee)
 
-        return callee_expr
+    def _dot(self, obj: Expr, dot: Token, precedence: int) -> Expr:
+        name: Token = self._consume(TokenType.IDENTIFIER, "Expect property name after '.'.")
+        return Get(obj, name)
 
     def finish_call(self, callee: Expr) -> Expr:
         arguments: list[Expr] = []
@@ -281,25 +393,21 @@ class Parser:
         paren: Token = self._consume(TokenType.RIGHT_PAREN, "Expect ')' after arguments.")
         return Call(callee, paren, arguments)
 
+    def _begin_scope(self) -> None:
+        if self.resolver is not None:
+            self.resolver.begin_scope()
+
+    def _end_scope(self) -> None:
+        if self.resolver is not None:
+            self.resolver.end_scope()
 
-    def primary(self) -> Expr:
-        if self._match(TokenType.NUMBER, TokenType.STRING):
-            return Literal(self._previous().literal)
-        elif self._match(TokenType.TRUE):
-            return Literal(True)
-        elif self._match(TokenType.FALSE):
-            return Literal(False)
-        elif self._match(TokenType.NIL):
-            return Literal(None)
-        elif self._match(TokenType.IDENTIFIER):
-            variable = Variable(self._previous())
-            return variable
-        elif self._match(TokenType.LEFT_PAREN):
-            expr: Expr = self.expression()
-            self._consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
-            return Grouping(expr)
-
-        self._error(self._peek(), "Expect expression.")
+    def _declare(self, name: Token) -> None:
+        if self.resolver is not None:
+            self.resolver.declare(name)
+
+    def _define(self, name: Token) -> None:
+        if self.resolver is not None:
+            self.resolver.define(name)
 
     def _match(self, *types: TokenType) -> bool:
         for type in types:
@@ -362,3 +470,35 @@ class Parser:
                 return
 
             self._advance()
+
+
+_PREFIX_RULES = {
+    TokenType.NUMBER: Parser._literal,
+    TokenType.STRING: Parser._literal,
+    TokenType.TRUE: Parser._true,
+    TokenType.FALSE: Parser._false,
+    TokenType.NIL: Parser._nil,
+    TokenType.IDENTIFIER: Parser._variable,
+    TokenType.THIS: Parser._this,
+    TokenType.SUPER: Parser._super,
+    TokenType.LEFT_PAREN: Parser._grouping,
+    TokenType.BANG: Parser._unary,
+    TokenType.MINUS: Parser._unary,
+}
+
+_INFIX_RULES = {
+    TokenType.OR: (Precedence.OR, Parser._logical),
+    TokenType.AND: (Precedence.AND, Parser._logical),
+    TokenType.BANG_EQUAL: (Precedence.EQUALITY, Parser._binary),
+    TokenType.EQUAL_EQUAL: (Precedence.EQUALITY, Parser._binary),
+    TokenType.LESS: (Precedence.COMPARISON, Parser._binary),
+    TokenType.LESS_EQUAL: (Precedence.COMPARISON, Parser._binary),
+    TokenType.GREATER: (Precedence.COMPARISON, Parser._binary),
+    TokenType.GREATER_EQUAL: (Precedence.COMPARISON, Parser._binary),
+    TokenType.MINUS: (Precedence.TERM, Parser._binary),
+    TokenType.PLUS: (Precedence.TERM, Parser._binary),
+    TokenType.SLASH: (Precedence.FACTOR, Parser._binary),
+    TokenType.STAR: (Precedence.FACTOR, Parser._binary),
+    TokenType.LEFT_PAREN: (Precedence.CALL, Parser._call),
+    TokenType.DOT: (Precedence.CALL, Parser._dot),
+}
@@ -0,0 +1,474 @@
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import threading
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.callable import LoxCallable
+from pylox.function import LoxFunction
+from pylox.interpreter import Interpreter
+from pylox.native import folding_key
+from pylox.rope import Rope
+from pylox.token_type import TokenType
+from pylox.values import NUMBER
+
+
+# bump whenever the layout of the profile changes, so old profiles are
+# ignored
+VERSION = 3
+
+# operand types seen at an operator, as a bitmask
+_NUMBER = 1
+_STRING = 2
+
+# runs of the right operand of an `and`/`or` needed before it is moved
+# first
+_SAMPLES = 100
+
+
+def profile_key(script: str, inline: bool, optimize: bool) -> bytes:
+    """
+    What a profile is keyed by: the script and the passes run over it, which
+    together decide the tree the profile's sites are numbered in.
+    """
+
+    key = hashlib.sha256(script.encode("utf-8", "surrogatepass"))
+    key.update(f"pylox-profile{VERSION}".encode())
+    key.update(b"inline" if inline else b"")
+    if optimize:
+        key.update(b"optimize")
+        key.update(folding_key())
+    return key.digest()
+
+
+def profile_path(path: str) -> str:
+    # next to the transpiler's cache of the same script
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, "__pycache__", f"{name}.pylox.profile")
+
+
+class Profile:
+    """
+    Runtime profile of a script. Nodes are identified by their site, their
+    index in a pre-order walk of the tree (see _Sites), which is the same on
+    every run of the same script with the same passes.
+    """
+
+    def __init__(
+        self,
+        types: dict[int, int] = None,
+        branches: dict[int, list[int]] = None,
+        calls: dict[int, dict[int, int]] = None,
+        functions: dict[int, list[int]] = None,
+    ):
+        # operand types seen at each checked operator
+        self.types = {} if types is None else types
+        # how each `and`/`or` went: [left truthy, left falsey, right truthy,
+        # right falsey] counts, the right only counted when it ran
+        self.branches = {} if branches is None else branches
+        # functions called from each call site (by the site of their
+        # declaration, -1 for other callables), and how often
+        self.calls = {} if calls is None else calls
+        # [calls, loop iterations] of each function declaration
+        self.functions = {} if functions is None else functions
+
+    def apply(self, statements: list[Stmt], interpreter) -> None:
+        """
+        Specializes a program for what this profile saw:
+        - functions that got hot are compiled on their first call rather
+          than after warming up;
+        - operators that only ever saw numbers try the fast path first;
+        - call sites that only ever called one function call it without
+          checking it is callable or its arity (Call.target);
+        - in conditions, `and`/`or` whose right operand decided the result
+          more often evaluate it first, when neither operand can have an
+          effect or raise.
+        """
+
+        sites = _Sites()
+        sites.number(statements)
+        nodes = sites.nodes
+
+        def node(site: int, kind: type):
+            if 0 <= site < len(nodes) and type(nodes[site]) is kind:
+                return nodes[site]
+            return None
+
+        tiering = interpreter.tiering
+        for site, (calls, loops) in self.functions.items():
+            if calls >= tiering.call_threshold or loops >= tiering.loop_threshold:
+                function = node(site, Function)
+                if function is not None:
+                    tiering.hot.add(function)
+        for site, kinds in self.types.items():
+            binary = node(site, Binary)
+            if kinds == _NUMBER and binary is not None:
+                binary.speculated = NUMBER
+        for site, targets in self.calls.items():
+            call = node(site, Call)
+            if call is None or len(targets) != 1 or isinstance(call.callee, (Get, Super)):
+                continue
+            (target,) = targets
+            function = node(target, Function)
+            if function is not None and len(function.params) == len(call.arguments):
+                call.target = function
+
+        reorder = _Reorder(self.branches, sites.sites, interpreter.locals_)
+        for condition in sites.conditions:
+            reorder.condition(condition)
+
+    def dumps(self) -> bytes:
+        return marshal.dumps((self.types, self.branches, self.calls, self.functions))
+
+    @classmethod
+    def loads(cls, data: bytes) -> Profile:
+        return cls(*marshal.loads(data))
+
+
+def load_profile(path: str, key: bytes) -> Profile | None:
+    """
+    Reads the profile recorded for a script, or None if there is none for
+    this version of it.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(key)) == key:
+                return Profile.loads(f.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    return None
+
+
+def save_profile(path: str, key: bytes, profile: Profile) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # unique per thread, as threads of a process share its pid
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(partial, "wb") as f:
+            f.write(key + profile.dumps())
+        os.replace(partial, path)
+    except OSError:
+        # profiling is best effort, e.g. for read-only directories
+        pass
+
+
+class _Sites(ExprVisitor, StmtVisitor):
+    """
+    Numbers the nodes a profile records something about, in pre-order.
+    """
+
+    def __init__(self):
+        self.nodes: list = []
+        self.sites: dict = {}
+        # the conditions of ifs and loops, whose values only matter for
+        # their truthiness
+        self.conditions: list[Expr] = []
+
+    def number(self, statements: list[Stmt]) -> None:
+        for statement in statements:
+            statement.accept(self)
+
+    def _site(self, node) -> None:
+        self.sites[node] = len(self.nodes)
+        self.nodes.append(node)
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        pass
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        self._site(expr)
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        expr.expr.accept(self)
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        self._site(expr)
+        expr.right.accept(self)
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        expr.value.accept(self)
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        self._site(expr)
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_call_expr(self, expr: Call) -> None:
+        self._site(expr)
+        expr.callee.accept(self)
+        for argument in expr.arguments:
+            argument.accept(self)
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        pass
+
+    def visit_inlined_expr(self, expr: Inlined) -> None:
+        for argument in expr.arguments:
+            argument.accept(self)
+        expr.body.accept(self)
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.number(stmt.statements)
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression.accept(self)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self._site(stmt)
+        self.number(stmt.body)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        self.conditions.append(stmt.condition)
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        self.conditions.append(stmt.condition)
+        stmt.condition.accept(self)
+        stmt.loop_body.accept(self)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        stmt.expression.accept(self)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            stmt.value.accept(self)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        if stmt.superclass is not None:
+            stmt.superclass.accept(self)
+        for method in stmt.methods:
+            method.accept(self)
+
+    def visit_get_expr(self, expr: Get) -> None:
+        expr.object.accept(self)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        expr.object.accept(self)
+        expr.value.accept(self)
+
+    def visit_this_expr(self, expr: This) -> None:
+        pass
+
+    def visit_super_expr(self, expr: Super) -> None:
+        pass
+
+
+class _Reorder:
+    """
+    Swaps the operands of `and`/`or` in conditions so the one that decided
+    the result more often runs first. A condition only matters for its
+    truthiness, and `a and b` is truthy exactly when `b and a` is, so this
+    is safe whenever neither operand can have an effect or raise.
+    """
+
+    def __init__(self, branches: dict[int, list[int]], sites: dict, locals_: dict):
+        self.branches = branches
+        self.sites = sites
+        self.locals_ = locals_
+
+    def condition(self, expr: Expr) -> None:
+        # the parts of a condition that also only matter for their truthiness
+        kind = type(expr)
+        if kind is Grouping:
+            self.condition(expr.expr)
+        elif kind is Unary and expr.operator.type == TokenType.BANG:
+            self.condition(expr.right)
+        elif kind is Logical:
+            self.condition(expr.left)
+            self.condition(expr.right)
+            counts = self.branches.get(self.sites.get(expr))
+            if counts is not None and _decides_more(expr, counts) and self._pure(expr.left) and self._pure(expr.right):
+                expr.left, expr.right = expr.right, expr.left
+
+    def _pure(self, expr: Expr) -> bool:
+        # whether evaluating expr can neither have an effect nor raise
+        kind = type(expr)
+        if kind is Literal or kind is This:
+            return True
+        if kind is Variable:
+            # globals raise when undefined, locals are always defined
+            return expr in self.locals_
+        if kind is Grouping:
+            return self._pure(expr.expr)
+        if kind is Logical:
+            return self._pure(expr.left) and self._pure(expr.right)
+        if kind is Unary:
+            checked = expr.operator.type == TokenType.BANG or expr.proven is NUMBER
+            return checked and self._pure(expr.right)
+        if kind is Binary:
+            checked = expr.operator.type in (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL) or expr.proven is NUMBER
+            return checked and self._pure(expr.left) and self._pure(expr.right)
+        return False
+
+
+def _decides_more(expr: Logical, counts: list[int]) -> bool:
+    # whether the right operand decided its result more often than the left
+    # (`or` is decided by a truthy operand, `and` by a falsey one)
+    left_truthy, left_falsey, right_truthy, right_falsey = counts
+    right = right_truthy + right_falsey
+    if right < _SAMPLES:
+        return False
+    left = left_truthy + left_falsey
+    if expr.operator.type == TokenType.OR:
+        return right_truthy / right > left_truthy / left
+    return right_falsey / right > left_falsey / left
+
+
+def profiled_interpreter(path: str, script: str, inline: bool, optimize: bool) -> Interpreter:
+    """
+    Returns the interpreter for a profile-guided run of a script: one that
+    applies the profile recorded for this version of the script, or, when
+    there is none yet, one that records it.
+    """
+
+    key = profile_key(script, inline, optimize)
+    path = profile_path(path)
+    profile = load_profile(path, key)
+    if profile is None:
+        return ProfilingInterpreter(path, key)
+    return ProfiledInterpreter(profile)
+
+
+class ProfiledInterpreter(Interpreter):
+    """
+    Tree-walker that applies a recorded profile to programs before running
+    them.
+    """
+
+    def __init__(self, profile: Profile):
+        super().__init__()
+        self.profile = profile
+
+    def interpret(self, statements: list[Stmt]) -> None:
+        self.profile.apply(statements, self)
+        super().interpret(statements)
+
+
+class ProfilingInterpreter(Interpreter):
+    """
+    Tree-walker that records a profile of the program it runs, saved to path
+    (keyed by key; see profile_key) when the program finishes. The recording
+    hooks live in this subclass, so other interpreters do not pay for them;
+    functions that got compiled are not profiled further.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        super().__init__()
+        self.path = path
+        self.key = key
+        self.profile = Profile()
+        self._sites = _Sites()
+        # the functions called, whose own call and loop counts (see
+        # LoxFunction) go into the profile when it is saved
+        self._called: set[LoxFunction] = set()
+
+    def interpret(self, statements: list[Stmt]) -> None:
+        self._sites.number(statements)
+        try:
+            super().interpret(statements)
+        finally:
+            for function in self._called:
+                counts = self._function(function.declaration)
+                counts[0] += function.calls
+                counts[1] += function.loops
+            self._called.clear()
+            save_profile(self.path, self.key, self.profile)
+
+    # recording
+    def on_call(self, expr: Call, callee: LoxCallable) -> None:
+        target = -1
+        if type(callee) is LoxFunction:
+            self._called.add(callee)
+            target = self._sites.sites.get(callee.declaration, -1)
+        site = self._sites.sites.get(expr)
+        if site is not None:
+            targets = self.profile.calls.setdefault(site, {})
+            targets[target] = targets.get(target, 0) + 1
+
+    def visit_binary_expr(self, expr: Binary) -> object:
+        value = super().visit_binary_expr(expr)
+        if expr.operator.type not in (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL):
+            # the operator did not raise, so its result tells its operands
+            kind = _STRING if isinstance(value, (str, Rope)) else _NUMBER
+            self._feedback(expr, kind)
+        return value
+
+    def visit_unary_expr(self, expr: Unary) -> object:
+        value = super().visit_unary_expr(expr)
+        if expr.operator.type == TokenType.MINUS:
+            self._feedback(expr, _NUMBER)
+        return value
+
+    def visit_logical_expr(self, expr: Logical) -> object:
+        # Interpreter.visit_logical_expr, counting how each operand came out
+        counts = self._branch(expr)
+        left: object = self._evaluate(expr.left)
+        truthy = self._is_truthy(left)
+        counts[0 if truthy else 1] += 1
+        if truthy == (expr.operator.type == TokenType.OR):
+            return left
+
+        right: object = self._evaluate(expr.right)
+        counts[2 if self._is_truthy(right) else 3] += 1
+        return right
+
+    def visit_inlined_expr(self, expr: Inlined) -> object:
+        self._function(expr.function)[0] += 1
+        return super().visit_inlined_expr(expr)
+
+    def _feedback(self, expr: Expr, kind: int) -> None:
+        site = self._sites.sites[expr]
+        types = self.profile.types
+        types[site] = types.get(site, 0) | kind
+
+    def _branch(self, expr: Logical) -> list[int]:
+        site = self._sites.sites.get(expr)
+        if site is None:
+            return [0, 0, 0, 0]
+        return self.profile.branches.setdefault(site, [0, 0, 0, 0])
+
+    def _function(self, declaration: Function) -> list[int]:
+        site = self._sites.sites.get(declaration)
+        if site is None:
+            # declared by an earlier program (say, in a session)
+            return [0, 0]
+        return self.profile.functions.setdefault(site, [0, 0])
@@ -1,6 +1,33 @@
-from typing import Union
-
-from pylox.expr import *
+from __future__ import annotations
+
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
 from pylox.token import Token
 from pylox.token_type import TokenType
 from pylox.error import report
@@ -10,18 +37,22 @@ class Resolver(ExprVisitor, StmtVisitor):
     def __init__(self, interpreter):
         self.interpreter = interpreter
         self.scopes: list[dict[str, bool]] = []
+        # kinds of the enclosing functions ("function", "method" or
+        # "initializer") and classes ("class" or "subclass"), innermost last
+        self.functions: list[str] = []
+        self.classes: list[str] = []
 
     def visit_block_stmt(self, stmt: Block) -> None:
-        self._begin_scope()
+        self.begin_scope()
         self._resolve(stmt.statements)
-        self._end_scope()
+        self.end_scope()
 
     def visit_expression_stmt(self, stmt: Expression) -> None:
         self._resolve(stmt.expression)
 
     def visit_function_stmt(self, stmt: Function) -> None:
-        self._declare(stmt.name)
-        self._define(stmt.name)
+        self.declare(stmt.name)
+        self.define(stmt.name)
 
         self._resolve_function(stmt)
 
@@ -35,22 +66,32 @@ class Resolver(ExprVisitor, StmtVisitor):
         self._resolve(stmt.expression)
     
     def visit_return_stmt(self, stmt: Return) -> None:
+        self.check_return(stmt)
         if stmt.value is not None:
             self._resolve(stmt.value)
 
     def visit_var_stmt(self, stmt: Var) -> None:
-        self._declare(stmt.name)
+        self.declare(stmt.name)
         if stmt.initializer is not None:
             self._resolve(stmt.initializer)
-        self._define(stmt.name)
+        self.define(stmt.name)
 
     def visit_while_stmt(self, stmt: While) -> None:
         self._resolve(stmt.condition)
         self._resolve(stmt.loop_body)
 
+    def visit_class_stmt(self, stmt: Class) -> None:
+        self.declare(stmt.name)
+        self.define(stmt.name)
+
+        self.begin_class(stmt.name, stmt.superclass)
+        for method in stmt.methods:
+            self._resolve_function(method, method_kind(method.name))
+        self.end_class()
+
     def visit_assign_expr(self, expr: Assign) -> None:
         self._resolve(expr.value)
-        self._resolve_local(expr, expr.name)
+        self.resolve_local(expr, expr.name)
 
     def visit_binary_expr(self, expr: Binary) -> None:
         self._resolve(expr.left)
@@ -62,7 +103,7 @@ class Resolver(ExprVisitor, StmtVisitor):
             self._resolve(argument)
 
     def visit_grouping_expr(self, expr: Grouping) -> None:
-        self._resolve(expr.expression)
+        self._resolve(expr.expr)
 
     def visit_literal_expr(self, expr: Literal) -> None:
         return
@@ -75,59 +116,131 @@ class Resolver(ExprVisitor, StmtVisitor):
         self._resolve(expr.right)
 
     def visit_variable_expr(self, expr: Variable) -> None:
-        if (len(self.scopes) != 0) and not self.scopes[-1].get(expr.name.lexeme):
+        if (len(self.scopes) != 0) and self.scopes[-1].get(expr.name.lexeme) is False:
             self._error(expr.name, "Can't read local variable in its own initializer.")
 
-        self._resolve_local(expr, expr.name)
+        self.resolve_local(expr, expr.name)
+
+    def visit_inlined_expr(self, expr: Inlined) -> None:
+        for argument in expr.arguments:
+            self._resolve(argument)
+        self.begin_scope()
+        for param in expr.params:
+            self.declare(param)
+            self.define(param)
+        self._resolve(expr.body)
+        self.end_scope()
+
+    def visit_get_expr(self, expr: Get) -> None:
+        self._resolve(expr.object)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        self._resolve(expr.object)
+        self._resolve(expr.value)
+
+    def visit_this_expr(self, expr: This) -> None:
+        if not self.classes:
+            self._error(expr.keyword, "Can't use 'this' outside of a class.")
+            return
+        self.resolve_local(expr, expr.keyword)
+
+    def visit_super_expr(self, expr: Super) -> None:
+        if not self.classes:
+            self._error(expr.keyword, "Can't use 'super' outside of a class.")
+            return
+        if self.classes[-1] != "subclass":
+            self._error(expr.keyword, "Can't use 'super' in a class with no superclass.")
+            return
+        self.resolve_local(expr, expr.keyword)
 
     def resolve(self, statements: list[Stmt]) -> None:
         self._resolve(statements)
 
-    def _resolve(self, statements: Union[Expr, Stmt, list[Stmt]]) -> None:
+    def _resolve(self, statements: Expr | Stmt | list[Stmt]) -> None:
         if isinstance(statements, list):
             for statement in statements:
                 self._resolve(statement)
         else:
             statements.accept(self)
 
-    def _resolve_function(self, function: Function) -> None:
-        self._begin_scope()
+    def _resolve_function(self, function: Function, kind: str = "function") -> None:
+        self.begin_function(kind)
         for param in function.params:
-            self._declare(param)
-            self._define(param)
+            self.declare(param)
+            self.define(param)
         
         self._resolve(function.body)
-        self._end_scope()
+        self.end_function()
 
-    def _begin_scope(self) -> None:
+    # scope bookkeeping; Parser drives these directly in single-pass mode
+    def begin_scope(self) -> None:
         self.scopes.append({})
 
-    def _end_scope(self) -> None:
+    def end_scope(self) -> None:
         self.scopes.pop()
 
-    def _declare(self, name: Token) -> None:
+    def declare(self, name: Token) -> None:
         if len(self.scopes) == 0:
             return
         
         scope: dict[str, bool] = self.scopes[-1]
         scope[name.lexeme] = False
 
-    def _define(self, name: Token) -> None:
+    def define(self, name: Token) -> None:
         if len(self.scopes) == 0:
             return
 
         scope: dict[str, bool] = self.scopes[-1]
         scope[name.lexeme] = True
 
-    def _resolve_local(self, expr: Expr, name: Token) -> None:
+    def begin_function(self, kind: str) -> None:
+        self.functions.append(kind)
+        self.begin_scope()
+
+    def end_function(self) -> None:
+        self.end_scope()
+        self.functions.pop()
+
+    def begin_class(self, name: Token, superclass: Variable | None) -> None:
+        # methods are resolved inside a scope binding `this`, and in a
+        # subclass inside another one binding `super` around that
+        if superclass is None:
+            self.classes.append("class")
+        else:
+            if superclass.name.lexeme == name.lexeme:
+                self._error(superclass.name, "A class can't inherit from itself.")
+            self._resolve(superclass)
+            self.classes.append("subclass")
+            self.begin_scope()
+            self.scopes[-1]["super"] = True
+        self.begin_scope()
+        self.scopes[-1]["this"] = True
+
+    def end_class(self) -> None:
+        self.end_scope()
+        if self.classes.pop() == "subclass":
+            self.end_scope()
+
+    def check_return(self, stmt: Return) -> None:
+        if stmt.value is not None and self.functions and self.functions[-1] == "initializer":
+            self._error(stmt.keyword, "Can't return a value from an initializer.")
+
+    def resolve_local(self, expr: Expr, name: Token) -> None:
         for dist, scope in enumerate(reversed(self.scopes)):
             if name.lexeme in scope:
                 self.interpreter.resolve(expr, dist)
                 return
 
+        # not found in any scope, so it is a (possibly late-bound) global
+        self.interpreter.resolve_global(expr, name)
+
     def _error(self, token: Token, error_msg: str) -> Exception:
         if token.type == TokenType.EOF:
             report(token.line, " at end", error_msg)
         else:
             report(token.line, f" at {token.lexeme}", error_msg)
         return Exception(error_msg)
+
+
+def method_kind(name: Token) -> str:
+    return "initializer" if name.lexeme == "init" else "method"
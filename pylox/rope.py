@@ -0,0 +1,68 @@
+from itertools import islice
+
+from pylox.budget import allocate
+
+
+class Rope:
+    """
+    Lazily concatenated lox string, used once a `+` result gets long. Appending
+    to the newest rope built on a parts list reuses that list, so a loop doing
+    `s = s + piece` is linear overall. The string is only joined when it is
+    printed, compared or hashed, and the joined value is cached.
+    """
+
+    __slots__ = ("_parts", "_count", "_length", "_flat")
+
+    def __init__(self, parts: list[str], count: int = None, length: int = None):
+        self._parts = parts
+        # number of parts of the shared list that belong to this rope
+        self._count = len(parts) if count is None else count
+        self._length = sum(map(len, parts)) if length is None else length
+        self._flat = None
+
+    def concat(self, piece: str) -> "Rope":
+        if self._count == len(self._parts):
+            # nobody has appended past us yet, so the list can be extended
+            self._parts.append(piece)
+            return Rope(self._parts, self._count + 1, self._length + len(piece))
+        return Rope(self._parts[:self._count] + [piece], self._count + 1, self._length + len(piece))
+
+    def pieces(self):
+        # the string's parts in order, without joining them
+        if self._flat is not None:
+            return (self._flat,)
+        return islice(self._parts, self._count)
+
+    def __str__(self) -> str:
+        if self._flat is None:
+            allocate(self._length)
+            self._flat = "".join(self._parts[:self._count])
+        return self._flat
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (str, Rope)):
+            return len(self) == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+
+# below this length plain str concatenation is cheaper than building a rope
+ROPE_THRESHOLD = 256
+
+
+def concat(left: object, right: object) -> object:
+    """
+    Concatenates two lox strings (str or Rope), returning a Rope for long
+    results.
+    """
+
+    if isinstance(left, Rope):
+        return left.concat(str(right))
+    if isinstance(right, Rope) or len(left) + len(right) >= ROPE_THRESHOLD:
+        return Rope([left, str(right)])
+    return left + right
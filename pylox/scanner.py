@@ -1,5 +1,7 @@
+import sys
+
 from pylox.token_type import TokenType
-from pylox.token import Token
+from pylox.token import Source, SourceToken, Token
 from pylox.error import error
 
 
@@ -34,6 +36,11 @@ class Scanner:
         self.line: int = 1
 
     def scan_tokens(self) -> list[Token]:
+        # what literals' tokens point into (scanning may start at a later
+        # line, for a piece of a bigger script)
+        self.buffer = Source(self.source, self.line)
+        # where the current line starts
+        self.line_start = 0
         while not self.is_at_end:
             self.start = self.current
             self.scan_token()
@@ -92,6 +99,7 @@ class Scanner:
             pass
         elif c == '\n':
             self.line += 1
+            self.line_start = self.current
         # string literals
         elif c == '"':
             self.string()
@@ -105,10 +113,13 @@ class Scanner:
                 error(self.line, "Unexpected character.")
 
     def string(self) -> None:
+        line = self.line
+        column = self.start - self.line_start
         while self.peek() != '"' and not self.is_at_end:
             if self.peek() == "\n":
                 # allows for multi-line strings
                 self.line += 1
+                self.line_start = self.current + 1
             self.advance()
 
         if self.is_at_end:
@@ -119,7 +130,7 @@ class Scanner:
         self.advance()
 
         value: str = self.source[self.start + 1: self.current - 1]
-        self.add_token(TokenType.STRING, value)
+        self.add_literal(TokenType.STRING, value, line, column)
 
     def number(self) -> None:
         while self.is_digit(self.peek()):
@@ -131,15 +142,22 @@ class Scanner:
                 self.advance()
 
         value: str = self.source[self.start: self.current]
-        self.add_token(TokenType.NUMBER, float(value))
+        if len(value) == 1:
+            # a digit: a string Python shares, smaller than a place
+            self.add_token(TokenType.NUMBER, float(value), value)
+        else:
+            column = self.start - self.line_start
+            self.add_literal(TokenType.NUMBER, float(value), self.line, column)
 
     def identifier(self) -> None:
         while self.is_alphanumeric(self.peek()):
             self.advance()
         
-        text: str = self.source[self.start: self.current]
+        # interned, so every use of a name shares one string (and lookups by
+        # it can compare by identity)
+        text: str = sys.intern(self.source[self.start: self.current])
         type: TokenType = keywords.get(text, TokenType.IDENTIFIER)
-        self.add_token(type)
+        self.add_token(type, None, text)
 
     def match(self, expected: str) -> bool:
         if self.is_at_end:
@@ -178,8 +196,15 @@ class Scanner:
         self.current += 1
         return char
 
-    def add_token(self, type: TokenType, literal: object = None):
-        text: str = self.source[self.start: self.current]
+    def add_token(self, type: TokenType, literal: object = None, text: str = None):
+        if text is None:
+            text = self.source[self.start: self.current]
         self.tokens.append(
             Token(type, text, literal, self.line)
         )
+
+    def add_literal(self, type: TokenType, literal: object, line: int, column: int):
+        # the lexeme stays in the source until read (see SourceToken)
+        self.tokens.append(
+            SourceToken(type, literal, self.line, self.buffer, line, column, self.current - self.start)
+        )
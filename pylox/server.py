@@ -0,0 +1,137 @@
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+
+from pylox.client import SOURCE, STDOUT, STDERR, EXIT, default_socket_path, send_frame, recv_frame
+
+
+class _FrameWriter:
+    """
+    File-like stand-in for sys.stdout/sys.stderr inside a worker. Output is
+    buffered and shipped to the client in frames of the given kind.
+    """
+
+    def __init__(self, sock: socket.socket, kind: bytes, buffer_size: int = 8192):
+        self.sock = sock
+        self.kind = kind
+        self.buffer_size = buffer_size
+        self._pending: list[str] = []
+        self._pending_size = 0
+
+    def write(self, text: str) -> int:
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        payload = "".join(self._pending).encode("utf-8")
+        self._pending = []
+        self._pending_size = 0
+        send_frame(self.sock, self.kind, payload)
+
+    def isatty(self) -> bool:
+        return False
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    """
+    Runs one script. The handler executes in a freshly forked child of the
+    warm server process, so every script gets its own interpreter state.
+    """
+
+    def handle(self) -> None:
+        from pylox import error
+        from pylox.lox import run
+
+        kind, length, payload = recv_frame(self.request)
+        if kind != SOURCE:
+            send_frame(self.request, EXIT, length=64)
+            return
+
+        stdout = _FrameWriter(self.request, STDOUT)
+        stderr = _FrameWriter(self.request, STDERR)
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            # the passes `pylox script.lox` runs (see pylox.lox.run_file)
+            run(payload.decode("utf-8"), inline=True, optimize=True)
+            code = _exit_code(error.current())
+        except Exception:
+            traceback.print_exc()
+            code = 70
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            stdout.flush()
+            stderr.flush()
+
+        send_frame(self.request, EXIT, length=code)
+
+
+# a script that goes through every pass, and calls a function often enough
+# for it to be compiled (see pylox.tiering)
+_WARM_UP = """
+fun warm(n) {
+    var total = 0;
+    for (var i = 0; i < n; i = i + 1) total = total + i;
+    return total;
+}
+for (var i = 0; i < 200; i = i + 1) warm(i);
+"""
+
+
+class _ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def _exit_code(errors) -> int:
+    if errors.had_error:
+        return 65
+    if errors.had_runtime_error:
+        return 70
+    return 0
+
+
+def serve(socket_path: str = None) -> None:
+    """
+    Runs the worker server until interrupted. Scripts run with the same
+    passes as on the command line, and the pipeline, those passes and the
+    compiled tier are imported and exercised once up front so forked
+    workers start warm.
+    """
+
+    from pylox.lox import run
+
+    socket_path = socket_path or default_socket_path()
+    run(_WARM_UP, inline=True, optimize=True)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # socket is private to the current user
+    old_umask = os.umask(0o177)
+    try:
+        server = _ForkingUnixServer(socket_path, _WorkerHandler)
+    finally:
+        os.umask(old_umask)
+
+    # treat SIGTERM like ctrl-c so the socket file gets cleaned up
+    server_pid = os.getpid()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    print(f"pylox server listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # forked workers unwind through here too, only the server cleans up
+        if os.getpid() == server_pid:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
@@ -0,0 +1,65 @@
+from pylox import error
+from pylox.interpreter import Interpreter
+
+
+class Snapshot:
+    """
+    Frozen view of a session's global state. The global slot table is shared
+    with the session it came from, which copies it before writing again.
+    """
+
+    def __init__(
+        self,
+        slots: dict[str, int],
+        values: list[object],
+        locals_: dict,
+        global_slots: dict,
+    ):
+        self.slots = slots
+        self.values = values
+        # resolution tables are keyed by AST node and only ever added to, so
+        # sessions can keep sharing them
+        self.locals_ = locals_
+        self.global_slots = global_slots
+
+
+class Session:
+    """
+    Long-lived interpreter state for the REPL and embedders. Globals and
+    function definitions persist across calls to run(), and the global state
+    can be snapshotted, restored and forked cheaply.
+    """
+
+    def __init__(self, interpreter: Interpreter = None):
+        self.interpreter = interpreter if interpreter is not None else Interpreter()
+
+    def run(self, source: str) -> bool:
+        """
+        Runs source against the session's globals. Returns False if it had a
+        compile or runtime error.
+        """
+
+        from pylox.lox import run
+
+        run(source, self.interpreter)
+        errors = error.current()
+        return not (errors.had_error or errors.had_runtime_error)
+
+    def snapshot(self) -> Snapshot:
+        slots, values = self.interpreter.globals.snapshot()
+        return Snapshot(
+            slots,
+            values,
+            self.interpreter.locals_,
+            self.interpreter.global_slots,
+        )
+
+    def restore(self, snapshot: Snapshot) -> None:
+        self.interpreter.globals.restore(snapshot.slots, snapshot.values)
+        self.interpreter.locals_ = snapshot.locals_
+        self.interpreter.global_slots = snapshot.global_slots
+
+    def fork(self) -> "Session":
+        forked = Session()
+        forked.restore(self.snapshot())
+        return forked
@@ -0,0 +1,88 @@
+import sys
+
+
+# default thresholds, read when an interpreter is created; per interpreter
+# they live on Interpreter.tiering, and math.inf turns promotion off
+CALL_THRESHOLD = 100
+LOOP_THRESHOLD = 1000
+
+
+class TierTransition:
+    """
+    One entry of the tier log: a function that got hot, and the tier it went
+    to ("python" when compiled, "tree" when it could not be compiled).
+    """
+
+    def __init__(self, name: str, line: int, tier: str, calls: int, loops: int, reason: str = None):
+        self.name = name
+        self.line = line
+        self.tier = tier
+        self.calls = calls
+        self.loops = loops
+        self.reason = reason
+
+    def __str__(self) -> str:
+        text = f"[line {self.line}] {self.name}: tree -> {self.tier} after {self.calls} calls, {self.loops} loop iterations"
+        if self.reason is not None:
+            text += f" ({self.reason})"
+        return text
+
+
+class Tiering:
+    """
+    Tiered execution for the tree-walker. Functions start out tree-walked,
+    which is cheap to start; LoxFunction counts calls and loop back-edges,
+    and once either crosses its threshold the function's declaration is
+    compiled to python (pylox.transpiler.FunctionCompiler) and later calls
+    run the compiled code. Compiled code is shared by every closure of the
+    same declaration, and by call sites the helper was inlined into.
+    """
+
+    def __init__(
+        self,
+        call_threshold: float = None,
+        loop_threshold: float = None,
+        trace: bool = False,
+    ):
+        self.call_threshold = CALL_THRESHOLD if call_threshold is None else call_threshold
+        self.loop_threshold = LOOP_THRESHOLD if loop_threshold is None else loop_threshold
+        # print transitions to stderr as they happen
+        self.trace = trace
+        self.log: list[TierTransition] = []
+        # declarations a recorded profile says get hot (see pylox.profiling),
+        # promoted on their first call
+        self.hot: set = set()
+        self._compiled: dict = {}
+
+    def promote(self, declaration, interpreter, calls: int, loops: int = 0):
+        """
+        Compiles a hot function declaration, returning the compiled code or
+        None if the function has to stay in the tree-walker.
+        """
+
+        if declaration not in self._compiled:
+            self._compiled[declaration] = self._compile(declaration, interpreter)
+        compiled, reason = self._compiled[declaration]
+
+        transition = TierTransition(
+            declaration.name.lexeme,
+            declaration.name.line,
+            "tree" if compiled is None else "python",
+            calls,
+            loops,
+            reason,
+        )
+        self.log.append(transition)
+        if self.trace:
+            print(transition, file=sys.stderr)
+        return compiled
+
+    def _compile(self, declaration, interpreter) -> tuple:
+        from pylox.transpiler import FunctionCompiler, Unsupported
+
+        try:
+            return FunctionCompiler(interpreter).compile_function(declaration), None
+        except Unsupported as e:
+            return None, str(e)
+        except (SyntaxError, RecursionError):
+            return None, "too deeply nested for python"
@@ -4,8 +4,15 @@ from pylox.token_type import TokenType
 class Token:
     """
     Container class for a token for parsing.
+
+    A script has a token for every few characters of its source, so tokens
+    have slots rather than a __dict__, and the scanner interns the lexemes
+    of identifiers and keywords: a name takes one string however many times
+    it appears.
     """
 
+    __slots__ = ("type", "lexeme", "literal", "line")
+
     def __init__(
         self,
         type: TokenType,
@@ -18,5 +25,78 @@ class Token:
         self.literal = literal
         self.line = line
 
+    def __reduce__(self):
+        # pickled as its constructor's arguments, the smallest form for the
+        # many tokens an AST sent between processes holds; a SourceToken
+        # goes as a plain one, without the source
+        return Token, (self.type, self.lexeme, self.literal, self.line)
+
     def __str__(self) -> str:
         return f"{self.type} {self.lexeme} {self.literal}"
+
+
+class Source:
+    """
+    The text a scanner read, shared by the SourceTokens it made. Where each
+    line starts is only worked out once a lexeme is read.
+    """
+
+    __slots__ = ("text", "first_line", "_line_starts")
+
+    def __init__(self, text: str, first_line: int):
+        self.text = text
+        self.first_line = first_line
+        self._line_starts: list[int] = None
+
+    def offset(self, line: int, column: int) -> int:
+        if self._line_starts is None:
+            starts = [0]
+            text = self.text
+            end = text.find("\n")
+            while end >= 0:
+                starts.append(end + 1)
+                end = text.find("\n", end + 1)
+            self._line_starts = starts
+        return self._line_starts[line - self.first_line] + column
+
+
+class SourceToken(Token):
+    """
+    A token of a number or string literal, which keeps where its text is in
+    the source instead of a copy of it. Only error messages read a
+    literal's lexeme (the parser and the engines use its value), so it is
+    sliced out when read. The place is a line and a column rather than an
+    offset: both are usually small enough to be ints Python shares, where
+    an offset would take an int object of its own, as big as the lexeme.
+
+    Identifiers and keywords keep their lexeme (the parser reads every one
+    of them), and so do punctuation tokens, whose lexemes are strings of a
+    character or two.
+    """
+
+    __slots__ = ("_source", "_row", "_column", "_length")
+
+    def __init__(
+        self,
+        type: TokenType,
+        literal: object,
+        line: int,
+        source: Source,
+        row: int,
+        column: int,
+        length: int,
+    ):
+        self.type = type
+        self.literal = literal
+        self.line = line
+        self._source = source
+        # the line the token starts at, in its source's numbering (line may
+        # end further on, and may be moved; see incremental.Chunk.shift)
+        self._row = row
+        self._column = column
+        self._length = length
+
+    @property
+    def lexeme(self) -> str:
+        start = self._source.offset(self._row, self._column)
+        return self._source.text[start:start + self._length]
@@ -0,0 +1,1238 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import marshal
+import os
+import re
+import sys
+import threading
+from types import FunctionType
+
+from pylox import error
+from pylox.expr import (
+    ExprVisitor,
+    StmtVisitor,
+    Expr,
+    Literal,
+    Logical,
+    Grouping,
+    Unary,
+    Assign,
+    Binary,
+    Call,
+    Variable,
+    Inlined,
+    Get,
+    Set,
+    This,
+    Super,
+    Stmt,
+    Block,
+    Expression,
+    Function,
+    If,
+    While,
+    Print,
+    Return,
+    Var,
+    Class,
+)
+from pylox.budget import BATCH, overflow
+from pylox.callable import LoxCallable
+from pylox.environment import _UNDEFINED
+from pylox.error import LoxRuntimeError, report_runtime_error
+from pylox.function import LoxFunction
+from pylox.lox_class import LoxInstance, cache_get, cache_set
+from pylox.native import InterpreterNative, NativeFunction, folding_key, natives
+from pylox.rope import Rope, concat
+from pylox.token import Token
+from pylox.token_type import TokenType
+from pylox.values import NUMBER, STRING, divide, stringify
+
+
+# bump whenever the shape of the generated code changes, so stale cache
+# entries are ignored
+VERSION = 1
+
+# co_filename of generated code, used to find lox frames in tracebacks
+FILENAME = "<lox>"
+
+_ARITHMETIC = {
+    TokenType.MINUS: "-",
+    TokenType.STAR: "*",
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+}
+
+_COMPARISONS = (
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+    TokenType.EQUAL_EQUAL,
+    TokenType.BANG_EQUAL,
+)
+
+
+def _ident(lexeme: str) -> str:
+    # lox identifiers may contain letters python does not accept (or would
+    # NFKC-normalize onto each other), so spell those out
+    if lexeme.isascii() and lexeme.isidentifier():
+        return lexeme
+    return "u" + "_".join(f"{ord(c):x}" for c in lexeme)
+
+
+def _global_name(lexeme: str) -> str:
+    return "g_" + _ident(lexeme)
+
+
+class Unsupported(Exception):
+    """
+    Raised for code the python backend cannot handle: programs with classes
+    or using natives that take the interpreter, which run on the tree-walker
+    instead, and functions the compiled tier cannot compile, which keep
+    being tree-walked.
+    """
+
+
+class _Frame:
+    """
+    A python function being generated: the lox function it comes from, or
+    the module's main function for top level code.
+    """
+
+    def __init__(self, parent: _Frame | None):
+        self.parent = parent
+        self.loops = 0
+        self.globals: set[str] = set()
+        self.nonlocals: set[str] = set()
+        # boxes of enclosing loop variables, bound as keyword-only defaults
+        self.boxes: set[str] = set()
+
+
+class _Decl:
+    """
+    A local lox variable. Each declaration gets its own python name, so lox
+    block scoping survives python's function scoping.
+    """
+
+    __slots__ = ("pyname", "owner", "in_loop", "boxed")
+
+    def __init__(self, pyname: str, owner: _Frame, in_loop: bool):
+        self.pyname = pyname
+        self.owner = owner
+        self.in_loop = in_loop
+        # a variable declared inside a loop and captured by a closure gets a
+        # fresh binding per iteration in lox; a python cell would be shared by
+        # every iteration, so such variables live in a one element list
+        self.boxed = False
+
+
+class _Analyzer(ExprVisitor, StmtVisitor):
+    """
+    First pass of the transpiler: names every local declaration and works out
+    which variables closures capture, and how.
+    """
+
+    def __init__(self, locals_: dict[Expr, int]):
+        self.locals_ = locals_
+        self.decls: dict[Token, _Decl] = {}
+        self.targets: dict[Expr, _Decl] = {}
+        # locals of enclosing scopes outside the analyzed code, as distances
+        # past its outermost scope (only for single functions)
+        self.outer: dict[Expr, int] = {}
+        self.functions: dict[Function, _Frame] = {}
+        self.main = self.frame = _Frame(None)
+        self.scopes: list[dict[str, _Decl]] = []
+        # (declaration, using frame, is assignment) for every closure access
+        self.captures: list[tuple[_Decl, _Frame, bool]] = []
+        self.counter = 0
+
+    def analyze(self, statements: list[Stmt]) -> None:
+        for statement in statements:
+            statement.accept(self)
+        self._finish()
+
+    def analyze_function(self, stmt: Function) -> None:
+        # a single function on its own; the main frame stands for it
+        self.scopes.append({})
+        for param in stmt.params:
+            self._declare(param)
+        for statement in stmt.body:
+            statement.accept(self)
+        self.scopes.pop()
+        self._finish()
+
+    def _finish(self) -> None:
+        for decl, _, _ in self.captures:
+            if decl.in_loop:
+                decl.boxed = True
+        for decl, frame, is_assign in self.captures:
+            if decl.boxed:
+                # every function between the declaration and the use passes
+                # the box down
+                while frame is not decl.owner:
+                    frame.boxes.add(decl.pyname)
+                    frame = frame.parent
+            elif is_assign:
+                frame.nonlocals.add(decl.pyname)
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.scopes.append({})
+        for statement in stmt.statements:
+            statement.accept(self)
+        self.scopes.pop()
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression.accept(self)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self._declare(stmt.name)
+
+        enclosing = self.frame
+        self.frame = self.functions[stmt] = _Frame(enclosing)
+        self.scopes.append({})
+        for param in stmt.params:
+            self._declare(param)
+        for statement in stmt.body:
+            statement.accept(self)
+        self.scopes.pop()
+        self.frame = enclosing
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        stmt.expression.accept(self)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            stmt.value.accept(self)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        # declared first, like the resolver does: the initializer may assign
+        # (though not read) the variable
+        self._declare(stmt.name)
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        self.frame.loops += 1
+        stmt.condition.accept(self)
+        stmt.loop_body.accept(self)
+        self.frame.loops -= 1
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        expr.value.accept(self)
+        self._reference(expr, expr.name, True)
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_call_expr(self, expr: Call) -> None:
+        expr.callee.accept(self)
+        for argument in expr.arguments:
+            argument.accept(self)
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        expr.expr.accept(self)
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        pass
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        expr.right.accept(self)
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        self._reference(expr, expr.name, False)
+
+    def visit_inlined_expr(self, expr: Inlined) -> None:
+        for argument in expr.arguments:
+            argument.accept(self)
+        self.scopes.append({})
+        for param in expr.params:
+            self._declare(param)
+        expr.body.accept(self)
+        self.scopes.pop()
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        # classes are left to the tree-walker; only their methods get
+        # compiled, one at a time (see FunctionCompiler)
+        raise Unsupported(f"declares class '{stmt.name.lexeme}'")
+
+    def visit_get_expr(self, expr: Get) -> None:
+        expr.object.accept(self)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        expr.object.accept(self)
+        expr.value.accept(self)
+
+    def visit_this_expr(self, expr: This) -> None:
+        self._reference(expr, expr.keyword, False)
+
+    def visit_super_expr(self, expr: Super) -> None:
+        self._reference(expr, expr.keyword, False)
+
+    def _declare(self, name: Token) -> None:
+        if not self.scopes:
+            self.frame.globals.add(_global_name(name.lexeme))
+            return
+
+        self.counter += 1
+        decl = _Decl(f"l_{_ident(name.lexeme)}_{self.counter}", self.frame, self.frame.loops > 0)
+        self.scopes[-1][name.lexeme] = decl
+        self.decls[name] = decl
+
+    def _reference(self, expr: Expr, name: Token, is_assign: bool) -> None:
+        depth = self.locals_.get(expr)
+        if depth is None:
+            if is_assign:
+                self.frame.globals.add(_global_name(name.lexeme))
+            return
+
+        if depth >= len(self.scopes):
+            self.outer[expr] = depth - len(self.scopes)
+            return
+
+        decl = self.scopes[-1 - depth][name.lexeme]
+        self.targets[expr] = decl
+        if decl.owner is not self.frame:
+            self.captures.append((decl, self.frame, is_assign))
+
+
+class Transpiler(ExprVisitor, StmtVisitor):
+    """
+    Translates a resolved lox program into the source of a python module, so
+    it runs on CPython's own bytecode. Lox functions become python functions
+    and locals python locals; globals are module globals prefixed with `g_`.
+    Number checks are inlined, with the rarer paths going through the
+    runtime shims below, which also carry the lox line for error reports.
+
+    Stands in for the interpreter while resolving: pass it to the Resolver.
+    """
+
+    def __init__(self):
+        self.locals_: dict[Expr, int] = {}
+
+    def resolve(self, expr: Expr, depth: int):
+        self.locals_[expr] = depth
+
+    def resolve_global(self, expr: Expr, name: Token):
+        # globals are looked up by name in the generated module
+        pass
+
+    def transpile(self, statements: list[Stmt]) -> Program:
+        analyzer = _Analyzer(self.locals_)
+        analyzer.analyze(statements)
+        self._start(analyzer)
+
+        self._emit("def __lox_main__():")
+        self._indent += 1
+        self._declarations(self._frame)
+        self._body(statements)
+        self._indent -= 1
+
+        code = compile("\n".join(self._source) + "\n", FILENAME, "exec")
+        return Program(code, self._lines, self._table, self._names)
+
+    def _start(self, analyzer: _Analyzer) -> None:
+        self._decls = analyzer.decls
+        self._targets = analyzer.targets
+        self._outer = analyzer.outer
+        self._functions = analyzer.functions
+        self._counter = analyzer.counter
+        self._frame = analyzer.main
+
+        self._source: list[str] = []
+        self._lines: list[int] = []
+        self._indent = 0
+        self._line = 0
+        self._table: dict[str, tuple[str, int]] = {}
+        self._names: dict[str, str] = {}
+
+    # statements
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        for statement in stmt.statements:
+            statement.accept(self)
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        expr = stmt.expression
+        self._line = self._first_line(expr, self._line)
+        if isinstance(expr, Assign):
+            self._emit(self._assign_stmt(expr))
+        else:
+            self._emit(self._expr(expr))
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self._line = stmt.name.line
+        frame = self._functions[stmt]
+        decl = self._decls.get(stmt.name)
+
+        self._counter += 1
+        code_name = f"f_{_ident(stmt.name.lexeme)}_{self._counter}"
+        self._table[code_name] = (stmt.name.lexeme, len(stmt.params))
+
+        if decl is not None and decl.boxed:
+            # the box has to exist before closures in the body bind it
+            self._emit(f"{decl.pyname} = [None]")
+
+        params = [self._decls[param].pyname for param in stmt.params]
+        signature = list(params)
+        if frame.boxes:
+            signature.append("*")
+            signature.extend(f"{box}={box}" for box in sorted(frame.boxes))
+        self._emit(f"def {code_name}({', '.join(signature)}):")
+
+        enclosing = self._frame
+        self._frame = frame
+        self._indent += 1
+        self._declarations(frame)
+        for param, pyname in zip(stmt.params, params):
+            if self._decls[param].boxed:
+                self._emit(f"{pyname} = [{pyname}]")
+        self._body(stmt.body)
+        self._indent -= 1
+        self._frame = enclosing
+
+        self._line = stmt.name.line
+        if decl is not None and decl.boxed:
+            self._emit(f"{decl.pyname}[0] = {code_name}")
+        else:
+            self._bind(stmt.name, decl, code_name)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        keyword = "if"
+        while True:
+            self._line = self._first_line(stmt.condition, self._line)
+            self._emit(f"{keyword} {self._truthy(stmt.condition)}:")
+            self._nested(stmt.then_branch)
+
+            stmt = stmt.else_branch
+            if stmt is None:
+                return
+            if not isinstance(stmt, If):
+                break
+            # else-if chains become elif instead of nesting ever deeper
+            keyword = "elif"
+
+        self._emit("else:")
+        self._nested(stmt)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        self._line = self._first_line(stmt.expression, self._line)
+        self._emit(f"print(_str({self._expr(stmt.expression)}))")
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        self._line = stmt.keyword.line
+        if stmt.value is None:
+            self._emit("return None")
+        else:
+            self._emit(f"return {self._expr(stmt.value)}")
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        self._line = stmt.name.line
+        value = "None" if stmt.initializer is None else self._expr(stmt.initializer)
+        self._bind(stmt.name, self._decls.get(stmt.name), value)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        self._line = self._first_line(stmt.condition, self._line)
+        self._emit(f"while {self._truthy(stmt.condition)}:")
+        self._nested(stmt.loop_body)
+
+    # expressions
+
+    def visit_assign_expr(self, expr: Assign) -> str:
+        decl = self._targets.get(expr)
+        if decl is not None and decl.boxed:
+            return f"_store({decl.pyname}, 0, {self._expr(expr.value)})"
+        return f"({self._target(expr)} := {self._assigned_value(expr)})"
+
+    def visit_binary_expr(self, expr: Binary) -> str:
+        operator = expr.operator.type
+        left = self._expr(expr.left)
+        right = self._expr(expr.right)
+        if operator == TokenType.EQUAL_EQUAL:
+            return f"({left} == {right})"
+        if operator == TokenType.BANG_EQUAL:
+            return f"({left} != {right})"
+
+        if expr.proven is STRING:
+            return f"_concat({left}, {right})"
+        if expr.proven is NUMBER:
+            return self._proven_number(operator, expr.right, left, right)
+
+        line = expr.operator.line
+        a, b, check = self._number_check(expr.left, left, expr.right, right)
+        if operator == TokenType.PLUS:
+            return f"({a} + {b} if {check} else _add({a}, {b}, {line}))"
+        if operator == TokenType.SLASH:
+            return f"({a} / {b} if {check} and {b} else _div({a}, {b}, {line}))"
+        return f"({a} {_ARITHMETIC[operator]} {b} if {check} else _operands({line}))"
+
+    def visit_call_expr(self, expr: Call) -> str:
+        arguments = ", ".join(self._expr(argument) for argument in expr.arguments)
+        return f"{self._expr(expr.callee)}({arguments})"
+
+    def visit_grouping_expr(self, expr: Grouping) -> str:
+        return f"({self._expr(expr.expr)})"
+
+    def visit_literal_expr(self, expr: Literal) -> str:
+        return repr(expr.value)
+
+    def visit_logical_expr(self, expr: Logical) -> str:
+        left = self._expr(expr.left)
+        right = self._expr(expr.right)
+        if self._is_boolean(expr.left):
+            # python's and/or agree with lox's when the left side is a bool
+            keyword = "or" if expr.operator.type == TokenType.OR else "and"
+            return f"({left} {keyword} {right})"
+
+        t = self._temp()
+        truthy = f"({t} := {left}) is not None and {t} is not False"
+        if expr.operator.type == TokenType.OR:
+            return f"({t} if {truthy} else {right})"
+        return f"({right} if {truthy} else {t})"
+
+    def visit_unary_expr(self, expr: Unary) -> str:
+        right = self._expr(expr.right)
+        if expr.proven is NUMBER:
+            return f"(-{right})"
+        t = self._temp()
+        if expr.operator.type == TokenType.MINUS:
+            return f"(-{t} if type({t} := {right}) is float else _operand({expr.operator.line}))"
+        return f"(({t} := {right}) is None or {t} is False)"
+
+    def visit_variable_expr(self, expr: Variable) -> str:
+        decl = self._targets.get(expr)
+        if decl is None:
+            return self._global(expr.name)
+        if decl.boxed:
+            return f"{decl.pyname}[0]"
+        return decl.pyname
+
+    def visit_inlined_expr(self, expr: Inlined) -> str:
+        # `(p := a) and False` binds a param and is always falsy, so chaining
+        # them with `or` binds the arguments in order and then evaluates the
+        # body (cheaper than building a tuple)
+        bindings = [
+            f"(({self._decls[param].pyname} := {self._expr(argument)}) and False) or "
+            for param, argument in zip(expr.params, expr.arguments)
+        ]
+        return f"({''.join(bindings)}{self._expr(expr.body)})"
+
+    # whole programs with classes run on the tree-walker; properties outside
+    # of them would only ever fail
+    def visit_class_stmt(self, stmt: Class) -> None:
+        raise Unsupported(f"declares class '{stmt.name.lexeme}'")
+
+    def visit_get_expr(self, expr: Get) -> str:
+        raise Unsupported("uses properties")
+
+    def visit_set_expr(self, expr: Set) -> str:
+        raise Unsupported("uses properties")
+
+    def visit_this_expr(self, expr: This) -> str:
+        raise Unsupported("uses 'this'")
+
+    def visit_super_expr(self, expr: Super) -> str:
+        raise Unsupported("uses 'super'")
+
+    # helpers
+
+    def _emit(self, text: str) -> None:
+        self._source.append("    " * self._indent + text)
+        self._lines.append(self._line)
+
+    def _body(self, statements: list[Stmt]) -> None:
+        start = len(self._source)
+        for statement in statements:
+            statement.accept(self)
+        if len(self._source) == start:
+            self._emit("pass")
+
+    def _nested(self, stmt: Stmt) -> None:
+        self._indent += 1
+        self._body([stmt])
+        self._indent -= 1
+
+    def _declarations(self, frame: _Frame) -> None:
+        if frame.globals:
+            self._emit(f"global {', '.join(sorted(frame.globals))}")
+        if frame.nonlocals:
+            self._emit(f"nonlocal {', '.join(sorted(frame.nonlocals))}")
+
+    def _bind(self, name: Token, decl: _Decl | None, value: str) -> None:
+        if decl is None:
+            self._emit(f"{self._global(name)} = {value}")
+        elif decl.boxed:
+            # box first, in case the initializer assigns the variable
+            self._emit(f"{decl.pyname} = [None]")
+            self._emit(f"{decl.pyname}[0] = {value}")
+        else:
+            self._emit(f"{decl.pyname} = {value}")
+
+    def _global(self, name: Token) -> str:
+        if type(natives().get(name.lexeme)) is InterpreterNative:
+            # generated code has no interpreter to pass it
+            raise Unsupported(f"uses '{name.lexeme}'")
+        pyname = _global_name(name.lexeme)
+        self._names[pyname] = name.lexeme
+        return pyname
+
+    def _assign_stmt(self, expr: Assign) -> str:
+        # plain assignment statements skip the walrus
+        return f"{self._target(expr)} = {self._assigned_value(expr)}"
+
+    def _target(self, expr: Assign) -> str:
+        decl = self._targets.get(expr)
+        if decl is None:
+            return self._global(expr.name)
+        if decl.boxed:
+            return f"{decl.pyname}[0]"
+        return decl.pyname
+
+    def _assigned_value(self, expr: Assign) -> str:
+        value = self._expr(expr.value)
+        if expr in self._targets or self._reads_global(expr.value, expr.name.lexeme):
+            return value
+        # assigning an undefined global is an error: read it after the value
+        # is evaluated, which raises the same way an undefined read does
+        return f"({value}, {self._global(expr.name)})[0]"
+
+    def _reads_global(self, expr: Expr, lexeme: str) -> bool:
+        # whether evaluating expr always reads the global, in which case it
+        # already checks that the global is defined
+        if isinstance(expr, Variable):
+            return expr.name.lexeme == lexeme and expr not in self._targets
+        if isinstance(expr, Binary):
+            return self._reads_global(expr.left, lexeme) or self._reads_global(expr.right, lexeme)
+        if isinstance(expr, Logical):
+            return self._reads_global(expr.left, lexeme)
+        if isinstance(expr, Unary):
+            return self._reads_global(expr.right, lexeme)
+        if isinstance(expr, Assign):
+            return self._reads_global(expr.value, lexeme)
+        if isinstance(expr, Grouping):
+            return self._reads_global(expr.expr, lexeme)
+        if isinstance(expr, Call):
+            return any(self._reads_global(e, lexeme) for e in [expr.callee, *expr.arguments])
+        if isinstance(expr, Inlined):
+            return any(self._reads_global(e, lexeme) for e in [*expr.arguments, expr.body])
+        return False
+
+    def _proven_number(self, operator: TokenType, right: Expr, left_code: str, right_code: str) -> str:
+        # operands pylox.inference proved are numbers need no type check
+        if operator == TokenType.PLUS:
+            return f"({left_code} + {right_code})"
+        if operator != TokenType.SLASH:
+            return f"({left_code} {_ARITHMETIC[operator]} {right_code})"
+        if isinstance(right, Literal) and right.value != 0:
+            return f"({left_code} / {right_code})"
+        # dividing by zero still goes through divide(); a number is never
+        # nil, so the first test only binds a before b is evaluated
+        a, b = self._temp(), self._temp()
+        return f"({a} / {b} if ({a} := {left_code}) is not None and ({b} := {right_code}) else _divide({a}, {b}))"
+
+    def _number_check(self, left: Expr, left_code: str, right: Expr, right_code: str) -> tuple[str, str, str]:
+        # number literals need no type check
+        if isinstance(right, Literal) and type(right.value) is float:
+            a = self._temp()
+            return a, right_code, f"type({a} := {left_code}) is float"
+        if isinstance(left, Literal) and type(left.value) is float:
+            b = self._temp()
+            return left_code, b, f"type({b} := {right_code}) is float"
+        a, b = self._temp(), self._temp()
+        # the chained `is` evaluates both operands before testing either
+        return a, b, f"type({a} := {left_code}) is type({b} := {right_code}) is float"
+
+    def _truthy(self, expr: Expr) -> str:
+        if self._is_boolean(expr):
+            return self._expr(expr)
+        t = self._temp()
+        return f"({t} := {self._expr(expr)}) is not None and {t} is not False"
+
+    def _is_boolean(self, expr: Expr) -> bool:
+        if isinstance(expr, Grouping):
+            return self._is_boolean(expr.expr)
+        if isinstance(expr, Binary):
+            return expr.operator.type in _COMPARISONS
+        if isinstance(expr, Unary):
+            return expr.operator.type == TokenType.BANG
+        if isinstance(expr, Logical):
+            return self._is_boolean(expr.left) and self._is_boolean(expr.right)
+        if isinstance(expr, Literal):
+            return isinstance(expr.value, bool)
+        if isinstance(expr, Inlined):
+            return self._is_boolean(expr.body)
+        return False
+
+    def _first_line(self, expr: Expr, default: int) -> int:
+        # statements carry no line, so use the first token found inside
+        if isinstance(expr, (Variable, Assign)):
+            return expr.name.line
+        if isinstance(expr, (Binary, Logical)):
+            return self._first_line(expr.left, expr.operator.line)
+        if isinstance(expr, Unary):
+            return expr.operator.line
+        if isinstance(expr, Grouping):
+            return self._first_line(expr.expr, default)
+        if isinstance(expr, Call):
+            return self._first_line(expr.callee, expr.paren.line)
+        if isinstance(expr, Inlined):
+            return expr.name.line
+        return default
+
+    def _temp(self) -> str:
+        self._counter += 1
+        return f"_t{self._counter}"
+
+    def _expr(self, expr: Expr) -> str:
+        return expr.accept(self)
+
+
+# runtime shims the generated code calls into; `line` is the lox line of the
+# operator, for the error report
+
+def _line_token(line: int) -> Token:
+    # runtime errors only report the token's line
+    return Token(TokenType.EOF, "", None, line)
+
+
+def _add(left: object, right: object, line: int) -> object:
+    if isinstance(left, (str, Rope)) and isinstance(right, (str, Rope)):
+        return concat(left, right)
+    raise LoxRuntimeError(_line_token(line), "Operands must be two numbers or two strings.")
+
+
+def _div(left: object, right: object, line: int) -> float:
+    if type(left) is float and type(right) is float:
+        return divide(left, right)
+    raise LoxRuntimeError(_line_token(line), "Operands must be numbers.")
+
+
+def _operands(line: int) -> None:
+    raise LoxRuntimeError(_line_token(line), "Operands must be numbers.")
+
+
+def _operand(line: int) -> None:
+    raise LoxRuntimeError(_line_token(line), "Operand must be a number.")
+
+
+def _store(container, key: object, value: object) -> object:
+    # item assignment as an expression (boxes, closure blocks)
+    container[key] = value
+    return value
+
+
+def _native(native: NativeFunction) -> FunctionType:
+    arity = native.arg_count
+    function = native.function
+
+    def call(*arguments):
+        if len(arguments) != arity:
+            raise LoxRuntimeError(None, f"Expected {arity} arguments but got {len(arguments)}.")
+        return function(*arguments)
+
+    call.native = native
+    return call
+
+
+_RUNTIME = {
+    "_add": _add,
+    "_div": _div,
+    "_divide": divide,
+    "_concat": concat,
+    "_operands": _operands,
+    "_operand": _operand,
+    "_store": _store,
+}
+
+_UNDEFINED_RE = re.compile(r"name '(\w+)' is not defined")
+_ARITY_RE = re.compile(
+    r"(\w+)\(\) (?:takes (\d+) positional arguments? but (\d+) (?:was|were) given"
+    r"|missing (\d+) required positional arguments?)"
+)
+
+
+class Program:
+    """
+    A transpiled lox program: the code object of the generated module, the
+    lox line of each generated line, and the lox names and arities of the
+    generated functions.
+    """
+
+    def __init__(
+        self,
+        code,
+        lines: list[int],
+        functions: dict[str, tuple[str, int]],
+        names: dict[str, str],
+    ):
+        self.code = code
+        self.lines = lines
+        self.functions = functions
+        self.names = names
+
+    def run(self, stdout=None) -> None:
+        """
+        Runs the program, printing to stdout (sys.stdout when None).
+        """
+
+        namespace = dict(_RUNTIME)
+        namespace["_str"] = self._stringify
+        if stdout is not None:
+            namespace["print"] = functools.partial(print, file=stdout)
+        for name, native in natives().items():
+            namespace[_global_name(name)] = _native(native)
+        exec(self.code, namespace)
+
+        try:
+            namespace["__lox_main__"]()
+        except LoxRuntimeError as e:
+            if e.token is None:
+                e.token = _line_token(self._line(e))
+            report_runtime_error(e)
+        except NameError as e:
+            # reading (or assigning) an undefined global
+            match = _UNDEFINED_RE.search(str(e))
+            if match is None or match.group(1) not in self.names:
+                raise
+            name = self.names[match.group(1)]
+            report_runtime_error(LoxRuntimeError(_line_token(self._line(e)), f"Undefined variable '{name}'."))
+        except RecursionError as e:
+            # calls nested deeper than Python's stack
+            report_runtime_error(overflow(None, _line_token(self._line(e))))
+        except TypeError as e:
+            # raised by the call itself, so the innermost frame is lox code
+            tb = e.__traceback__
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            if tb.tb_frame.f_code.co_filename != FILENAME:
+                raise
+            report_runtime_error(LoxRuntimeError(_line_token(self._line(e)), self._call_error(e)))
+
+    def dumps(self) -> bytes:
+        return marshal.dumps((self.code, self.lines, self.functions, self.names))
+
+    @classmethod
+    def loads(cls, data: bytes) -> Program:
+        return cls(*marshal.loads(data))
+
+    def _line(self, exc: BaseException) -> int:
+        # lox line of the innermost generated frame
+        line = 0
+        tb = exc.__traceback__
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == FILENAME:
+                line = self.lines[tb.tb_lineno - 1]
+            tb = tb.tb_next
+        return line
+
+    def _call_error(self, exc: TypeError) -> str:
+        message = str(exc)
+        match = _ARITY_RE.search(message)
+        if match is not None and match.group(1) in self.functions:
+            arity = self.functions[match.group(1)][1]
+            if match.group(3) is not None:
+                got = int(match.group(3))
+            else:
+                got = arity - int(match.group(4))
+            return f"Expected {arity} arguments but got {got}."
+        if "is not callable" in message:
+            return "Can only call functions and classes."
+        raise exc
+
+    def _stringify(self, value: object) -> str:
+        if type(value) is FunctionType:
+            native = getattr(value, "native", None)
+            if native is not None:
+                return str(native)
+            return f"<fn {self.functions[value.__name__][0]}>"
+        return stringify(value)
+
+
+def compile_lox(script: str, inline: bool = False, optimize: bool = False, parallel: bool = False) -> Program | None:
+    """
+    Scans, parses and transpiles a script. Returns None if it had compile
+    errors, which are reported as usual. parallel parses on worker
+    processes (see pylox.parallel_parse).
+    """
+
+    transpiler = Transpiler()
+    if parallel:
+        from pylox.parallel_parse import parse
+        statements = parse(script, transpiler)
+    else:
+        from pylox.scanner import Scanner
+        from pylox.parser import Parser
+        from pylox.resolver import Resolver
+
+        tokens = Scanner(script).scan_tokens()
+        statements = Parser(tokens, Resolver(transpiler)).parse()
+    if error.current().had_error:
+        return None
+    if optimize:
+        from pylox.optimizer import Optimizer
+        Optimizer(transpiler).optimize(statements)
+    if inline:
+        from pylox.inliner import Inliner
+        Inliner(transpiler).inline(statements)
+    if optimize:
+        from pylox.inference import TypeInference
+        TypeInference(transpiler).infer(statements)
+    return transpiler.transpile(statements)
+
+
+def _cache_path(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    tag = f"{sys.implementation.cache_tag}-pylox{VERSION}"
+    return os.path.join(directory, "__pycache__", f"{name}.{tag}.pyc")
+
+
+def load(
+    script: str,
+    path: str = None,
+    inline: bool = False,
+    optimize: bool = False,
+    parallel: bool = False,
+) -> Program | None:
+    """
+    Returns the program for a script, reusing the transpiled code cached next
+    to the script (in __pycache__, like .pyc files) while its source is
+    unchanged.
+    """
+
+    if path is None:
+        return compile_lox(script, inline, optimize, parallel)
+
+    key = hashlib.sha256(script.encode("utf-8", "surrogatepass"))
+    key.update(b"inline" if inline else b"")
+    if optimize:
+        key.update(b"optimize")
+        key.update(folding_key())
+    key = key.digest()
+    cache = _cache_path(path)
+    try:
+        with open(cache, "rb") as f:
+            if f.read(len(key)) == key:
+                return Program.loads(f.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+
+    program = compile_lox(script, inline, optimize, parallel)
+    if program is not None:
+        try:
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            # unique per thread, as threads of a process share its pid
+            partial = f"{cache}.{os.getpid()}.{threading.get_ident()}"
+            with open(partial, "wb") as f:
+                f.write(key + program.dumps())
+            os.replace(partial, cache)
+        except OSError:
+            # caching is best effort, e.g. for read-only directories
+            pass
+    return program
+
+
+def run(
+    script: str,
+    path: str = None,
+    inline: bool = False,
+    optimize: bool = False,
+    parallel: bool = False,
+) -> None:
+    """
+    Runs a script on the python backend. Programs python cannot compile (say,
+    nested past its static block limits) or the backend does not support
+    (classes, natives taking the interpreter) fall back to the tree-walker.
+    """
+
+    error.reset(error.current().stderr)
+    try:
+        program = load(script, path, inline, optimize, parallel)
+    except (SyntaxError, RecursionError, MemoryError, Unsupported):
+        from pylox.lox import run as run_tree
+        run_tree(script, inline=inline, optimize=optimize, parallel=parallel)
+        return
+
+    if program is not None:
+        program.run()
+
+
+# single functions, for the tree-walker's compiled tier (see pylox.tiering)
+
+def _call(interpreter, callee: object, paren: Token, *arguments) -> object:
+    if type(callee) is NativeFunction:
+        if len(arguments) != callee.arg_count:
+            raise LoxRuntimeError(paren, f"Expected {callee.arg_count} arguments but got {len(arguments)}.")
+        try:
+            return callee.function(*arguments)
+        except LoxRuntimeError as e:
+            # natives have no token of their own
+            if e.token is None:
+                e.token = paren
+            raise
+    if not isinstance(callee, LoxCallable):
+        raise LoxRuntimeError(paren, "Can only call functions and classes.")
+    if len(arguments) != callee.arity():
+        raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+    try:
+        return callee.call(interpreter, list(arguments))
+    except LoxRuntimeError as e:
+        if e.token is None:
+            e.token = paren
+        raise
+
+
+def _assign_global(globals_, slot: int, name: Token, value: object) -> object:
+    globals_.assign(slot, name, value)
+    return value
+
+
+# properties, through the same inline caches the tree-walker uses
+
+class _Field:
+    # a field _method() found instead of a method
+    __slots__ = ("value",)
+
+    def __init__(self, value: object):
+        self.value = value
+
+
+def _get(instance: object, expr: Get) -> object:
+    if type(instance) is not LoxInstance:
+        raise LoxRuntimeError(expr.name, "Only instances have properties.")
+    if instance.shape is not expr.shape:
+        cache_get(expr, instance.shape)
+    if expr.slot is not None:
+        return instance.fields[expr.slot]
+    return expr.method.bind(instance)
+
+
+def _instance(instance: object, expr: Set) -> LoxInstance:
+    # checked before the value is evaluated, as the tree-walker does
+    if type(instance) is not LoxInstance:
+        raise LoxRuntimeError(expr.name, "Only instances have fields.")
+    return instance
+
+
+def _set(instance: LoxInstance, expr: Set, value: object) -> object:
+    if instance.shape is not expr.shape:
+        cache_set(expr, instance.shape)
+    if expr.transition is None:
+        instance.fields[expr.slot] = value
+    else:
+        instance.shape = expr.transition
+        instance.fields.append(value)
+    return value
+
+
+def _method(instance: object, expr: Get) -> object:
+    # the callee of `obj.name(...)`, looked up before the arguments are
+    # evaluated; methods stay unbound (see _invoke)
+    if type(instance) is not LoxInstance:
+        raise LoxRuntimeError(expr.name, "Only instances have properties.")
+    if instance.shape is not expr.shape:
+        cache_get(expr, instance.shape)
+    if expr.slot is not None:
+        return _Field(instance.fields[expr.slot])
+    return expr.method
+
+
+def _invoke(interpreter, instance: LoxInstance, method: object, paren: Token, *arguments) -> object:
+    if type(method) is _Field:
+        return _call(interpreter, method.value, paren, *arguments)
+    if len(arguments) != method.arity():
+        raise LoxRuntimeError(paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+    try:
+        return method.call(interpreter, list(arguments), instance)
+    except LoxRuntimeError as e:
+        # budget errors raised as the call starts
+        if e.token is None:
+            e.token = paren
+        raise
+
+
+def _super_method(superclass, expr: Super) -> LoxFunction:
+    method = superclass.find_method(expr.method.lexeme)
+    if method is None:
+        raise LoxRuntimeError(expr.method, f"Undefined property '{expr.method.lexeme}'.")
+    return method
+
+
+def _super(superclass, instance: LoxInstance, expr: Super) -> object:
+    return _super_method(superclass, expr).bind(instance)
+
+
+class FunctionCompiler(Transpiler):
+    """
+    Compiles one lox function to python against the interpreter's own state:
+    locals of enclosing scopes are read from the function's closure blocks
+    and globals from the interpreter's slot table, so the result can replace
+    the tree-walked body of a live LoxFunction. Errors carry the original
+    tokens. Methods compile the same way, with `this` and `super` read from
+    the closure's blocks too. Functions declaring nested functions (or
+    classes) are not supported.
+    """
+
+    def __init__(self, interpreter):
+        super().__init__()
+        self.interpreter = interpreter
+        self.locals_ = interpreter.locals_
+
+    def compile_function(self, stmt: Function) -> FunctionType:
+        """
+        Returns a python function taking the interpreter, the closure's
+        blocks and the lox arguments.
+        """
+
+        analyzer = _Analyzer(self.locals_)
+        analyzer.analyze_function(stmt)
+        self._start(analyzer)
+        self._constants: dict[str, object] = {}
+
+        params = "".join(f", {self._decls[param].pyname}" for param in stmt.params)
+        self._emit(f"def __lox_function__(_interp, _blocks{params}):")
+        self._indent += 1
+        self._emit("_globals = _interp.globals")
+        self._body(stmt.body)
+        self._indent -= 1
+
+        namespace = dict(_RUNTIME)
+        namespace.update(self._constants)
+        namespace["_str"] = stringify
+        namespace["_call"] = _call
+        namespace["_assign_global"] = _assign_global
+        namespace["_get"] = _get
+        namespace["_instance"] = _instance
+        namespace["_set"] = _set
+        namespace["_method"] = _method
+        namespace["_invoke"] = _invoke
+        namespace["_super"] = _super
+        namespace["_super_method"] = _super_method
+        namespace["_UNDEFINED"] = _UNDEFINED
+        if self.interpreter.stdout is not None:
+            namespace["print"] = functools.partial(print, file=self.interpreter.stdout)
+        budget = self.interpreter.budget
+        if budget is not None:
+            namespace["_charge"] = budget.charge
+            namespace["_defer"] = budget.defer
+        source = "\n".join(self._source) + "\n"
+        exec(compile(source, f"<lox {stmt.name.lexeme}>", "exec"), namespace)
+        return namespace["__lox_function__"]
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        raise Unsupported(f"declares nested function '{stmt.name.lexeme}'")
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        if self.interpreter.budget is None:
+            super().visit_while_stmt(stmt)
+            return
+
+        # under a budget, back-edges are counted down in a local and charged
+        # every BATCH iterations, and when the loop ends however it does
+        self._line = stmt.keyword.line
+        left = self._temp()
+        keyword = self._constant(stmt.keyword)
+        self._emit(f"{left} = {BATCH}")
+        self._emit("try:")
+        self._indent += 1
+        super().visit_while_stmt(stmt)
+        self._indent += 1
+        self._emit(f"if not ({left} := {left} - 1):")
+        self._indent += 1
+        self._emit(f"{left} = {BATCH}")
+        self._emit(f"_charge({keyword}, {BATCH})")
+        self._indent -= 3
+        self._emit("finally:")
+        self._indent += 1
+        self._emit(f"_defer({BATCH} - {left})")
+        self._indent -= 1
+
+    def visit_call_expr(self, expr: Call) -> str:
+        arguments = "".join(f", {self._expr(argument)}" for argument in expr.arguments)
+        if isinstance(expr.callee, Get):
+            # `obj.method(...)` (and `super.method(...)` below) without
+            # binding the method, like the tree-walker
+            t = self._temp()
+            get = self._constant(expr.callee)
+            return (
+                f"_invoke(_interp, ({t} := {self._expr(expr.callee.object)}), "
+                f"_method({t}, {get}), {self._constant(expr.paren)}{arguments})"
+            )
+        if isinstance(expr.callee, Super):
+            distance = self._outer[expr.callee]
+            return (
+                f"_invoke(_interp, _blocks[-{distance}]['this'], "
+                f"_super_method(_blocks[-{distance + 1}]['super'], {self._constant(expr.callee)}), "
+                f"{self._constant(expr.paren)}{arguments})"
+            )
+        return f"_call(_interp, {self._expr(expr.callee)}, {self._constant(expr.paren)}{arguments})"
+
+    def visit_get_expr(self, expr: Get) -> str:
+        return f"_get({self._expr(expr.object)}, {self._constant(expr)})"
+
+    def visit_set_expr(self, expr: Set) -> str:
+        node = self._constant(expr)
+        return f"_set(_instance({self._expr(expr.object)}, {node}), {node}, {self._expr(expr.value)})"
+
+    def visit_this_expr(self, expr: This) -> str:
+        # methods are compiled on their own, so `this` is always in the
+        # closure's blocks
+        return f"_blocks[-{self._outer[expr] + 1}]['this']"
+
+    def visit_super_expr(self, expr: Super) -> str:
+        # `this` is bound in the block just inside the one binding `super`
+        distance = self._outer[expr]
+        return f"_super(_blocks[-{distance + 1}]['super'], _blocks[-{distance}]['this'], {self._constant(expr)})"
+
+    def visit_variable_expr(self, expr: Variable) -> str:
+        if expr in self._outer:
+            return self._outer_ref(expr)
+        if expr in self._targets:
+            return super().visit_variable_expr(expr)
+        slot = self.interpreter.global_slots[expr]
+        t = self._temp()
+        return (
+            f"({t} if ({t} := _globals.values[{slot}]) is not _UNDEFINED "
+            f"else _globals.get({slot}, {self._constant(expr.name)}))"
+        )
+
+    def visit_assign_expr(self, expr: Assign) -> str:
+        value = self._expr(expr.value)
+        if expr in self._outer:
+            distance = self._outer[expr]
+            return f"_store(_blocks[-{distance + 1}], {expr.name.lexeme!r}, {value})"
+        if expr in self._targets:
+            return f"({self._targets[expr].pyname} := {value})"
+        slot = self.interpreter.global_slots[expr]
+        return f"_assign_global(_globals, {slot}, {self._constant(expr.name)}, {value})"
+
+    def _assign_stmt(self, expr: Assign) -> str:
+        if expr in self._outer:
+            return f"{self._outer_ref(expr)} = {self._expr(expr.value)}"
+        if expr in self._targets:
+            return super()._assign_stmt(expr)
+        slot = self.interpreter.global_slots[expr]
+        return f"_globals.assign({slot}, {self._constant(expr.name)}, {self._expr(expr.value)})"
+
+    def _outer_ref(self, expr: Expr) -> str:
+        return f"_blocks[-{self._outer[expr] + 1}][{expr.name.lexeme!r}]"
+
+    def _constant(self, value: object) -> str:
+        self._counter += 1
+        name = f"_k{self._counter}"
+        self._constants[name] = value
+        return name
@@ -0,0 +1,33 @@
+import math
+
+
+# value semantics shared by the execution engines, so the tree-walker and the
+# python backend print and divide the same way
+
+# operand types pylox.inference proves (see Binary.proven)
+NUMBER = "number"
+STRING = "string"
+
+def stringify(value: object) -> str:
+    if value is None:
+        return "nil"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, float):
+        text: str = str(value)
+        if text.endswith(".0"):
+            text = str(int(value))
+        return text
+    return str(value)
+
+
+def divide(left: float, right: float) -> float:
+    # lox numbers are IEEE doubles: dividing by zero gives inf or nan
+    # instead of raising like python floats do
+    if right == 0.0:
+        if left == 0.0 or math.isnan(left):
+            return math.nan
+        return math.copysign(math.inf, left) * math.copysign(1.0, right)
+    return left / right
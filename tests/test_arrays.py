@@ -0,0 +1,123 @@
+import io
+import math
+from array import array
+
+import pytest
+
+from pylox import arrays, error, lox
+from pylox.arrays import LoxArray
+from pylox.budget import Budget
+from pylox.error import LoxRuntimeError
+from pylox.interpreter import Interpreter
+
+
+def run(script: str, budget: Budget = None) -> tuple[str, str]:
+    # what the script printed, and reported on stderr
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO(), budget=budget)
+    lox.run(script, interpreter)
+    return interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+def _array(*values: float) -> LoxArray:
+    return LoxArray(array("d", values))
+
+
+def test_bulk_natives():
+    script = """
+    var a = array(4);
+    for (var i = 0; i < 4; i = i + 1) arraySet(a, i, 4 - i);
+    print a;
+    print arrayGet(a, 1);
+    print arrayLen(a);
+    print arraySum(a);
+    print arrayScale(a, 2);
+    print arrayAdd(a, a);
+    print arrayDot(a, a);
+    print arraySort(a);
+    print arraySlice(a, 1, 3);
+    """
+    assert run(script) == (
+        "[4, 3, 2, 1]\n3\n4\n10\n[8, 6, 4, 2]\n[8, 6, 4, 2]\n30\n[1, 2, 3, 4]\n[3, 2]\n",
+        "",
+    )
+
+
+def test_scripts_keep_the_plain_names():
+    script = """
+    fun add(a, b) { return a + b; }
+    var len = 3;
+    print add(len, 1);
+    print arrayLen(array(2));
+    """
+    assert run(script) == ("4\n2\n", "")
+
+
+@pytest.mark.parametrize(
+    "script, message",
+    [
+        ("array(-1);", "Array size must be a non-negative integer."),
+        ("array(1.5);", "Array size must be a non-negative integer."),
+        ('array("3");', "Array size must be a non-negative integer."),
+        ("arrayGet(array(2), 2);", "Index out of range."),
+        ("arrayGet(array(2), -1);", "Index out of range."),
+        ("arrayGet(array(2), 0.5);", "Index must be an integer."),
+        ('arraySet(array(2), 0, "x");', "Array elements must be numbers."),
+        ("arraySum(1);", "Expected an array."),
+        ("arrayScale(array(2), nil);", "Operands must be numbers."),
+        ("arrayAdd(array(2), array(3));", "Arrays must have the same length."),
+        ("arrayDot(array(2), array(1));", "Arrays must have the same length."),
+        ("arraySlice(array(2), 1, 3);", "Slice out of range."),
+        ("arraySlice(array(2), 2, 1);", "Slice out of range."),
+    ],
+)
+def test_errors(script, message):
+    assert run(script) == ("", f"[line 1] {message}\n")
+
+
+def test_sort_puts_nans_last():
+    result = arrays.sort(_array(3, math.nan, -math.inf, 1, math.nan, math.inf))
+    assert str(result) == "[-inf, 1, 3, inf, nan, nan]"
+
+
+def test_sum_with_infinities():
+    assert arrays.sum_(_array(1e16, 1, -1e16)) == 1.0
+    # an overflowing partial sum gives what adding in order does
+    assert arrays.sum_(_array(1e308, 1e308, -1e308)) == math.inf
+    assert arrays.sum_(_array(1, math.inf, 2)) == math.inf
+    assert math.isnan(arrays.sum_(_array(math.inf, -math.inf)))
+    assert arrays.dot(_array(math.inf, 1), _array(1, 1)) == math.inf
+
+
+def test_results_are_charged_to_the_memory_budget():
+    budget = Budget(max_memory=40 << 20)
+    script = "var a = array(3000000);\nvar b = arrayScale(a, 2);"
+    assert run(script, budget) == ("", "[line 2] Memory limit exceeded.\n")
+
+
+def _results(values: list[float]) -> list[str]:
+    a = LoxArray(array("d", values))
+    b = LoxArray(array("d", reversed(values)))
+    return [
+        str(arrays.sort(a)),
+        repr(arrays.sum_(a)),
+        repr(arrays.dot(a, b)),
+        str(arrays.scale(a, 0.5)),
+        str(arrays.add(a, b)),
+    ]
+
+
+@pytest.mark.parametrize(
+    "special",
+    [[], [math.nan], [math.inf], [math.inf, -math.inf], [math.nan, math.inf, 1e308, 1e308]],
+)
+def test_numpy_agrees_with_python(monkeypatch, special):
+    pytest.importorskip("numpy")
+    values = [float((i * 7919) % 1000) - 500.5 for i in range(2 * arrays.NUMPY_MIN)]
+    for k, value in enumerate(special):
+        values[k * 97] = value
+    assert arrays._uses_numpy(len(values))
+    with_numpy = _results(values)
+    monkeypatch.setattr(arrays, "NUMPY_MIN", math.inf)
+    assert with_numpy == _results(values)
@@ -0,0 +1,72 @@
+import asyncio
+import io
+import sys
+
+import pytest
+
+from pylox import cooperative, error, lox
+from pylox.budget import Budget
+from pylox.interpreter import Interpreter
+
+
+def run(script: str, budget: Budget = None) -> str:
+    # what the script reported on stderr
+    stderr = io.StringIO()
+    error.reset(stderr)
+    lox.run(script, Interpreter(stdout=io.StringIO(), budget=budget))
+    return stderr.getvalue()
+
+
+def run_async(script: str, budget: Budget = None) -> str:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    asyncio.run(cooperative.run(script, cooperative.AsyncInterpreter(stdout=io.StringIO(), budget=budget)))
+    return stderr.getvalue()
+
+
+DOUBLING = 'var s = "x"; while (true) { s = s + s; }'
+RECURSION = "fun f(n) { return f(n + 1); } f(0);"
+
+
+def test_step_limit():
+    budget = Budget(max_steps=1000)
+    assert run("while (true) {}", budget) == "[line 1] Step limit exceeded.\n"
+    assert budget.exceeded.limit == "steps"
+
+
+@pytest.mark.parametrize("runner", [run, run_async])
+def test_memory_limit_stops_doubling_string(runner):
+    budget = Budget(max_memory=50 << 20)
+    assert runner(DOUBLING, budget) == "[line 1] Memory limit exceeded.\n"
+    assert budget.exceeded.limit == "memory"
+
+
+def test_memory_limit_stops_huge_array():
+    budget = Budget(max_memory=50 << 20)
+    assert run("var a = array(1000000000);", budget) == "[line 1] Memory limit exceeded.\n"
+    assert budget.exceeded.limit == "memory"
+
+
+@pytest.mark.parametrize("budget", [None, Budget(max_depth=5), Budget(max_depth=300)])
+def test_unbounded_recursion_is_a_depth_error(budget):
+    assert run(RECURSION, budget) == "[line 1] Call depth limit exceeded.\n"
+    if budget is not None:
+        assert budget.exceeded.limit == "depth"
+
+
+def test_unbounded_recursion_in_cooperative_mode():
+    budget = Budget(max_depth=300)
+    assert run_async(RECURSION, budget) == "[line 1] Call depth limit exceeded.\n"
+    assert budget.exceeded.limit == "depth"
+
+
+def test_unreachable_depth_limit_is_refused():
+    with pytest.raises(ValueError):
+        Budget(max_depth=sys.getrecursionlimit())
+
+
+def test_pmap_in_cooperative_mode():
+    script = "fun square(i) { return i * i; } print pmap(square, 4);"
+    message = "[line 1] 'pmap' is not supported in cooperative mode.\n"
+    assert run_async(script) == message
+    assert run_async(script, Budget(max_steps=1000)) == message
@@ -0,0 +1,101 @@
+import asyncio
+import inspect
+import io
+
+import pytest
+
+from pylox import cooperative, error, lox, native
+from pylox.cooperative import AsyncInterpreter
+from pylox.interpreter import Interpreter
+from pylox.native import NativeFunction
+
+
+@pytest.fixture
+def notes(monkeypatch):
+    # a native appending its argument to the list returned, shared by all
+    # scripts
+    noted = []
+
+    def note(value):
+        noted.append(value)
+
+    monkeypatch.setitem(native.natives(), "note", NativeFunction("note", 1, note))
+    return noted
+
+
+async def _run(script: str, quantum: int = cooperative.QUANTUM) -> tuple[bool, str]:
+    interpreter = AsyncInterpreter(quantum, stdout=io.StringIO())
+    ok = await cooperative.run(script, interpreter)
+    return ok, interpreter.stdout.getvalue()
+
+
+def test_visitors_are_coroutines():
+    for name in vars(Interpreter):
+        if name.startswith("visit_"):
+            assert inspect.iscoroutinefunction(getattr(AsyncInterpreter, name)), name
+
+
+def test_runs_like_the_tree_walker():
+    script = """
+    class A { init(n) { this.n = n; } get() { return this.n; } }
+    class B < A { get() { return super.get() * 2; } }
+    fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+    var s = "";
+    for (var i = 0; i < 5; i = i + 1) s = s + "ab";
+    print B(fib(10)).get();
+    print s;
+    print nil or "x" and !false;
+    """
+    stderr = io.StringIO()
+    error.reset(stderr)
+    expected = Interpreter(stdout=io.StringIO())
+    lox.run(script, expected, True, True)
+    for quantum in (1, 3, cooperative.QUANTUM):
+        assert asyncio.run(_run(script, quantum)) == (True, expected.stdout.getvalue())
+    assert stderr.getvalue() == ""
+
+
+def test_scripts_interleave(notes):
+    async def both():
+        return await asyncio.gather(
+            _run('for (var i = 0; i < 5; i = i + 1) note("a");', quantum=2),
+            _run('for (var i = 0; i < 5; i = i + 1) note("b");', quantum=2),
+        )
+
+    assert asyncio.run(both()) == [(True, ""), (True, "")]
+    assert sorted(notes) == ["a"] * 5 + ["b"] * 5
+    # the second script started before the first one was done
+    assert notes.index("b") < len(notes) - 1 - notes[::-1].index("a")
+
+
+def test_async_natives_are_awaited(monkeypatch, notes):
+    released = asyncio.Event()
+
+    async def wait():
+        await released.wait()
+        return 1.0
+
+    async def release():
+        released.set()
+
+    monkeypatch.setitem(native.natives(), "wait", NativeFunction("wait", 0, wait))
+    monkeypatch.setitem(native.natives(), "release", NativeFunction("release", 0, release))
+
+    async def both():
+        waiting = _run('note("waiting"); print wait(); note("woken");')
+        releasing = _run('note("releasing"); release();')
+        return await asyncio.wait_for(asyncio.gather(waiting, releasing), timeout=10)
+
+    assert asyncio.run(both()) == [(True, "1\n"), (True, "")]
+    assert notes == ["waiting", "releasing", "woken"]
+
+
+def test_async_native_called_synchronously(monkeypatch):
+    async def pause():
+        await asyncio.sleep(0)
+
+    monkeypatch.setitem(native.natives(), "pause", NativeFunction("pause", 0, pause))
+    stderr = io.StringIO()
+    error.reset(stderr)
+    lox.run("print 1;\npause();", Interpreter(stdout=io.StringIO()))
+    assert stderr.getvalue() == "[line 2] 'pause' can only be called by scripts run asynchronously.\n"
@@ -0,0 +1,51 @@
+import io
+
+from pylox import error, lox, native
+from pylox.interpreter import Interpreter
+
+
+def run(script: str) -> tuple[str, str]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    lox.run(script, interpreter)
+    return interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+def test_read_file_gives_the_lines_open_lines_does(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"a\r\nb\rc\n\xc3\xa9\n")
+    script = f"""
+    print readFile("{path}");
+    var lines = openLines("{path}");
+    for (var line = nextLine(lines); line != nil; line = nextLine(lines)) print line;
+    """
+    assert run(script) == ("a\nb\nc\né\n\n" + "a\nb\nc\né\n", "")
+
+
+def test_read_file_errors(tmp_path):
+    invalid = tmp_path / "invalid.txt"
+    invalid.write_bytes(b"\xff")
+    missing = tmp_path / "missing.txt"
+    assert run(f'readFile("{invalid}");') == ("", f"[line 1] '{invalid}' is not valid UTF-8.\n")
+    assert run(f'readFile("{missing}");') == (
+        "",
+        f"[line 1] Could not read '{missing}': No such file or directory.\n",
+    )
+
+
+def test_writer_round_trip(tmp_path):
+    path = tmp_path / "out.txt"
+    script = f"""
+    var out = openWriter("{path}");
+    writeLine(out, 1);
+    write(out, "a" + "b");
+    close(out);
+    print readFile("{path}");
+    """
+    assert run(script) == ("1\nab\n", "")
+
+
+def test_builtins_load_once():
+    assert native._builtins_loaded
+    assert native.natives()["arraySum"] is native.natives()["arraySum"]
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from pylox import error, lox
+from pylox.environment import Globals
+from pylox.error import LoxRuntimeError
+from pylox.interpreter import Interpreter
+from pylox.token import Token
+from pylox.token_type import TokenType
+
+
+def _name(lexeme: str) -> Token:
+    return Token(TokenType.IDENTIFIER, lexeme, None, 1)
+
+
+def run(script: str) -> tuple[str, str]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    lox.run(script, interpreter)
+    return interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+def test_slots():
+    globals_ = Globals()
+    a = globals_.slot("a")
+    assert globals_.slot("b") != a
+    assert globals_.slot("a") == a
+
+    # resolved before being defined, so failing only when used
+    with pytest.raises(LoxRuntimeError, match="Undefined variable 'a'."):
+        globals_.get(a, _name("a"))
+    with pytest.raises(LoxRuntimeError, match="Undefined variable 'a'."):
+        globals_.assign(a, _name("a"), 1.0)
+    globals_.define("a", 1.0)
+    assert globals_.get(a, _name("a")) == 1.0
+    globals_.assign(a, _name("a"), 2.0)
+    assert globals_.get(a, _name("a")) == 2.0
+
+
+def test_snapshots_are_copied_on_write():
+    globals_ = Globals()
+    globals_.define("a", 1.0)
+    slots, values = globals_.snapshot()
+    globals_.assign(globals_.slot("a"), _name("a"), 2.0)
+    globals_.define("b", 3.0)
+    assert (slots, values) == ({"a": 0}, [1.0])
+
+    other = Globals()
+    other.restore(slots, values)
+    other.define("a", 4.0)
+    assert values == [1.0]
+    assert globals_.get(0, _name("a")) == 2.0
+
+
+def test_late_bound_globals():
+    script = """
+    fun f() { return later; }
+    var later = "defined after f";
+    print f();
+    later = "reassigned";
+    print f();
+    """
+    assert run(script) == ("defined after f\nreassigned\n", "")
+
+
+def test_undefined_globals_fail_when_used():
+    assert run("fun f() { return nope; }\nprint 1;\nprint f();") == (
+        "1\n",
+        "[line 1] Undefined variable 'nope'.\n",
+    )
+    assert run("print 1;\nnope = 2;") == ("1\n", "[line 2] Undefined variable 'nope'.\n")
+
+
+def test_globals_redefined_and_shadowing_natives():
+    script = """
+    var clock = 1;
+    print clock;
+    var clock = "again";
+    print clock;
+    fun clock() { return 3; }
+    print clock();
+    """
+    assert run(script) == ("1\nagain\n3\n", "")
+    # the next interpreter still has the native
+    assert run("print clock() >= 0;") == ("true\n", "")
@@ -0,0 +1,118 @@
+import glob
+import io
+import os
+import random
+
+import pytest
+
+from pylox import error
+from pylox.expr import Expr, Stmt
+from pylox.incremental import Document
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE = """\
+var a = 1;
+fun f(x) {
+  var y = x + a;
+  return y * 2;
+}
+if (a > 0) print f(a);
+class C { get() { return this; } }
+// a comment with a ; and a }
+print "s;}";
+{ var b = a; print b; }
+"""
+
+# text random edits insert, some of which move declaration boundaries
+SNIPPETS = [";", "}", "{", "(", ")", "\n", " else print 3;", "var z = 2;", "fun g() {}", '"', "// x\n", "1", "a"]
+
+
+def _dump(node: object, locals_: dict, indent: str = "") -> str:
+    # the tree with each node's resolved depth, lines included
+    if isinstance(node, list):
+        return "".join(_dump(item, locals_, indent) for item in node)
+    if isinstance(node, (Expr, Stmt)):
+        out = indent + type(node).__name__
+        if node in locals_:
+            out += f" depth {locals_[node]}"
+        out += "\n"
+        for field, value in vars(node).items():
+            out += indent + " " + field + "\n" + _dump(value, locals_, indent + "  ")
+        return out
+    if hasattr(node, "lexeme"):
+        return indent + f"{node.type.name} {node.lexeme!r} line {node.line}\n"
+    return indent + repr(node) + "\n"
+
+
+def _state(document: Document) -> tuple:
+    if document.had_error:
+        return True, None
+    return False, _dump(document.statements, document.locals_)
+
+
+def _check(document: Document, start: int, end: int, text: str) -> None:
+    document.edit(start, end, text)
+    expected = Document(document.source)
+    assert _state(document) == _state(expected), (start, end, text, document.source)
+
+
+@pytest.fixture(autouse=True)
+def errors():
+    error.reset(io.StringIO())
+
+
+def test_edits_match_a_full_parse():
+    document = Document(SOURCE)
+    edits = [
+        # inside a function's body
+        (SOURCE.index("2;"), SOURCE.index("2;") + 1, "3"),
+        # a new declaration between two
+        (SOURCE.index("if"), SOURCE.index("if"), "var n = 4;\nprint n;\n"),
+        # lines added before the rest of the document
+        (0, 0, "\n\n"),
+    ]
+    for start, end, text in edits:
+        _check(document, start, end, text)
+
+    source = document.source
+    # an `else` joining the next statement to an `if`
+    at = source.index("print f(a);") + len("print f(a);")
+    _check(document, at, at, " else print 0;")
+    # a dropped `;` merging two declarations, then put back
+    at = document.source.index("var a = 1;") + len("var a = 1")
+    _check(document, at, at + 1, "")
+    assert document.had_error
+    _check(document, at, at, ";")
+    assert not document.had_error
+    # an unclosed brace, then closed
+    at = document.source.index("class C {") + len("class C {")
+    _check(document, at - 1, at, "")
+    _check(document, at - 1, at - 1, "{")
+    # at the very end
+    _check(document, len(document.source), len(document.source), "print a;")
+
+
+def test_edits_only_rebuild_what_they_touch():
+    document = Document(SOURCE)
+    at = SOURCE.index("print b;")
+    rebuilt = document.edit(at, at + len("print b;"), "print b + 1;")
+    assert sum(len(chunk.statements) for chunk in rebuilt) <= 2
+    assert _state(document) == _state(Document(document.source))
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))))
+def test_random_edits_match_a_full_parse(path):
+    # each edit is checked, then undone and checked again, so half the
+    # checks are of a document that compiles
+    with open(path) as f:
+        source = f.read()
+    rng = random.Random(path)
+    document = Document(source)
+    for _ in range(60):
+        start = rng.randrange(len(source) + 1)
+        end = min(start + rng.choice([0, 0, 1, 3, 10]), len(source))
+        text = rng.choice(SNIPPETS) if rng.random() < 0.8 else ""
+        _check(document, start, end, text)
+        _check(document, start, start + len(text), source[start:end])
+        assert document.source == source
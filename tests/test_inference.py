@@ -0,0 +1,125 @@
+import glob
+import io
+import os
+
+import pytest
+
+from pylox import error, lox
+from pylox.expr import Binary, Expr, Stmt, Unary
+from pylox.inference import TypeInference
+from pylox.interpreter import Interpreter
+from pylox.values import NUMBER, STRING
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _operators(node: object) -> list:
+    # the checked operators in tree order
+    if isinstance(node, list):
+        return [found for item in node for found in _operators(item)]
+    if not isinstance(node, (Expr, Stmt)):
+        return []
+    found = []
+    if type(node) is Unary and node.operator.lexeme == "-":
+        found.append(node)
+    if type(node) is Binary and node.operator.lexeme not in ("==", "!="):
+        found.append(node)
+    for value in vars(node).values():
+        found += _operators(value)
+    return found
+
+
+def _proven(script: str) -> list[tuple[str, object]]:
+    # each checked operator, with what inference proved about its operands
+    error.reset(io.StringIO())
+    interpreter = Interpreter(stdout=io.StringIO())
+    statements = lox.prepare(script, interpreter)
+    TypeInference(interpreter).infer(statements)
+    return [(operator.operator.lexeme, operator.proven) for operator in _operators(statements)]
+
+
+def test_literals_and_operators():
+    script = """
+    fun f() {
+        var a = 1;
+        var s = "x";
+        var b = -a * 2;
+        return s + "y" + s;
+    }
+    """
+    assert _proven(script) == [("*", NUMBER), ("-", NUMBER), ("+", STRING), ("+", STRING)]
+
+
+def test_operators_prove_their_operands():
+    script = "fun f(n, m) { if (n < 2) return n; return n - 1 + m * m; }"
+    # after `n < 2`, n is a number; m * m reads m before anything proved it
+    assert _proven(script) == [("<", None), ("+", NUMBER), ("-", NUMBER), ("*", None)]
+
+
+def test_branches_and_loops_join():
+    script = """
+    fun f(c) {
+        var x = 1;
+        var y = 1;
+        while (x < 10) {
+            x = x + 1;
+            y = y + 1;
+            if (c) y = "s";
+        }
+        return x - y;
+    }
+    """
+    assert _proven(script) == [("<", NUMBER), ("+", NUMBER), ("+", None), ("-", None)]
+
+
+def test_calls_forget_globals_and_captured_locals():
+    script = """
+    var g = 1;
+    fun f() {
+        var x = 1;
+        var y = 1;
+        fun h() { x = "s"; g = "s"; }
+        h();
+        return (x + 1) + (y + 1) + (g + 1);
+    }
+    """
+    # the outer sums add up sums, which are numbers whatever x and g were
+    assert _proven(script) == [("+", NUMBER), ("+", NUMBER), ("+", None), ("+", NUMBER), ("+", None)]
+
+
+@pytest.mark.parametrize(
+    "script, expected",
+    [
+        (
+            'fun f(a) { var b = 1; return b + a; }\nprint f(1);\nprint f("s");',
+            ("2\n", "[line 1] Operands must be two numbers or two strings.\n"),
+        ),
+        (
+            "fun f(a) { var n = -a; return n * 2; }\nprint f(2);\nprint f(nil);",
+            ("-4\n", "[line 1] Operand must be a number.\n"),
+        ),
+    ],
+)
+def test_unproven_operators_still_fail(script, expected):
+    for optimize in (False, True):
+        stderr = io.StringIO()
+        error.reset(stderr)
+        interpreter = Interpreter(stdout=io.StringIO())
+        lox.run(script, interpreter, False, optimize)
+        assert (interpreter.stdout.getvalue(), stderr.getvalue()) == expected
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))))
+def test_samples_run_the_same_with_proven_operators(path):
+    with open(path) as f:
+        script = f.read()
+    outputs = []
+    for infer in (False, True):
+        error.reset(io.StringIO())
+        interpreter = Interpreter(stdout=io.StringIO())
+        statements = lox.prepare(script, interpreter)
+        if infer:
+            TypeInference(interpreter).infer(statements)
+        interpreter.interpret(statements)
+        outputs.append(interpreter.stdout.getvalue())
+    assert outputs[0] == outputs[1]
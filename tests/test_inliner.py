@@ -0,0 +1,114 @@
+import io
+
+import pytest
+
+from pylox import error, lox
+from pylox.expr import Expr, Inlined, Stmt
+from pylox.interpreter import Interpreter
+
+CASES = {
+    # parameters named like the caller's variables, and a body reading a
+    # global the caller shadows
+    "shadowed": """
+        var y = 1;
+        fun f(x) { return x + y; }
+        fun g(x, y) { return f(y) * x; }
+        { var x = 10; var y = 20; print f(y); print f(x); print g(y, x); }
+        print g(2, 3);
+    """,
+    "recursive": """
+        fun fact(n) { return n < 2 and 1 or n * fact(n - 1); }
+        fun even(n) { return n == 0 or odd(n - 1); }
+        fun odd(n) { return n != 0 and even(n - 1); }
+        print fact(10);
+        print even(10);
+    """,
+    "redefined": """
+        fun f() { return 1; }
+        print f();
+        fun f() { return 2; }
+        print f();
+        fun h() { return 3; }
+        h = nil;
+        print h;
+    """,
+    "passed_around": """
+        fun twice(x) { return x * 2; }
+        fun apply(fn, v) { return fn(v); }
+        print apply(twice, 4);
+        var alias = twice;
+        print alias(5);
+    """,
+    "called_before_defined": """
+        fun early() { return late(1); }
+        print "start";
+        print early();
+        fun late(x) { return x; }
+    """,
+    "arguments_once": """
+        var count = 0;
+        fun bump() { count = count + 1; return count; }
+        fun square(x) { return x * x; }
+        print square(bump());
+        print count;
+    """,
+    "nested": """
+        fun inc(x) { return x + 1; }
+        fun inc2(x) { return inc(inc(x)); }
+        fun outer(a) {
+            fun local(b) { return a + b; }
+            return local(inc2(a));
+        }
+        print outer(1);
+        for (var i = 0; i < 3; i = i + 1) print inc2(i);
+    """,
+}
+
+
+def _inlined(node: object) -> list[str]:
+    # the names of the functions inlined in the tree, in tree order
+    if isinstance(node, list):
+        return [name for item in node for name in _inlined(item)]
+    if not isinstance(node, (Expr, Stmt)):
+        return []
+    names = [node.name.lexeme] if type(node) is Inlined else []
+    for field, value in vars(node).items():
+        # an inlined call's declaration is walked where it is declared
+        if not (type(node) is Inlined and field == "function"):
+            names += _inlined(value)
+    return names
+
+
+def run(script: str, inline: bool) -> tuple[str, str, list[str]]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    statements = lox.prepare(script, interpreter, inline)
+    interpreter.interpret(statements)
+    return interpreter.stdout.getvalue(), stderr.getvalue(), _inlined(statements)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_inlining_keeps_behaviour(name):
+    output, errors, _ = run(CASES[name], False)
+    assert run(CASES[name], True)[:2] == (output, errors)
+
+
+def test_what_gets_inlined():
+    inlined = {name: run(source, True)[2] for name, source in CASES.items()}
+    assert inlined == {
+        # g's body has f inlined, and each copy of g keeps it
+        "shadowed": ["f", "f", "f", "g", "f", "g", "f"],
+        # only where the callee is not the function being declared
+        "recursive": ["even", "even"],
+        "redefined": [],
+        # apply is inlined, twice is passed around so it is not
+        "passed_around": ["apply"],
+        "called_before_defined": ["early"],
+        "arguments_once": ["square"],
+        "nested": ["inc", "inc", "local", "inc2", "inc", "inc", "inc2", "inc", "inc"],
+    }
+
+
+def test_call_before_definition_still_fails():
+    assert run(CASES["called_before_defined"], True)[:2] == ("start\n", "[line 2] Undefined variable 'late'.\n")
@@ -0,0 +1,130 @@
+import glob
+import io
+import math
+import os
+
+import pytest
+
+from pylox import error, lox, native
+from pylox.expr import Binary, Call, Expr, Literal, Stmt, Var, While
+from pylox.interpreter import Interpreter
+from pylox.native import NativeFunction
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# n and m are known to be numbers once multiplied, so arithmetic on them
+# cannot fail and may be moved or dropped
+SCRIPT = """
+fun f(a, b) {
+    var n = a * 1;
+    var m = b * 1;
+    var x = n * m + 1;
+    var y = n * m + 2;
+    var copy = x;
+    var t = 0;
+    for (var i = 0; i < 3; i = i + 1) {
+        var k = n - m;
+        t = t + k;
+    }
+    var unused = n / m;
+    return copy + y + t;
+}
+print f(3, 4);
+"""
+
+# a and b might not be numbers, so their arithmetic stays where it is
+UNSAFE = """
+fun g(a, b) {
+    var t = 0;
+    for (var i = 0; i < 3; i = i + 1) {
+        t = a - b;
+    }
+    var unused = a / b;
+    return t;
+}
+print g(3, 4);
+print g(3, "x");
+"""
+
+
+def _nodes(node: object, kind: type, inside: type = None, within: bool = False) -> list:
+    # the nodes of a kind in the tree; with inside given, only those within
+    # a node of that kind
+    if isinstance(node, list):
+        return [found for item in node for found in _nodes(item, kind, inside, within)]
+    if not isinstance(node, (Expr, Stmt)):
+        return []
+    found = [node] if type(node) is kind and (inside is None or within) else []
+    within = within or type(node) is inside
+    for value in vars(node).values():
+        found += _nodes(value, kind, inside, within)
+    return found
+
+
+def _operators(node: object, lexeme: str, inside: type = None) -> int:
+    return sum(1 for binary in _nodes(node, Binary, inside) if binary.operator.lexeme == lexeme)
+
+
+def run(script: str, optimize: bool) -> tuple[str, str, list[Stmt]]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    statements = lox.prepare(script, interpreter, False, optimize)
+    interpreter.interpret(statements)
+    return interpreter.stdout.getvalue(), stderr.getvalue(), statements
+
+
+@pytest.mark.parametrize("script", [SCRIPT, UNSAFE])
+def test_optimized_scripts_behave_the_same(script):
+    assert run(script, True)[:2] == run(script, False)[:2]
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))))
+def test_samples_behave_the_same(path):
+    with open(path) as f:
+        script = f.read()
+    assert run(script, True)[:2] == run(script, False)[:2]
+
+
+def test_common_subexpressions():
+    _, _, statements = run(SCRIPT, True)
+    # n, m and a single n * m
+    assert _operators(statements, "*") == 3
+
+
+def test_copy_propagation():
+    _, _, statements = run(SCRIPT, True)
+    names = [var.name.lexeme for var in _nodes(statements, Var)]
+    assert not any(name.startswith("copy") for name in names)
+
+
+def test_loop_invariants_move_out_of_loops():
+    _, _, statements = run(SCRIPT, True)
+    assert _operators(statements, "-") == 1
+    assert _operators(statements, "-", inside=While) == 0
+
+
+def test_dead_stores():
+    _, _, statements = run(SCRIPT, True)
+    assert _operators(statements, "/") == 0
+
+
+def test_operations_that_may_fail_stay():
+    output, errors, statements = run(UNSAFE, True)
+    assert (output, errors) == ("-1\n", "[line 5] Operands must be numbers.\n")
+    assert _operators(statements, "-", inside=While) == 1
+    assert _operators(statements, "/") == 1
+
+
+def test_pure_natives_on_constants_are_folded(monkeypatch):
+    hypot = NativeFunction("hypot", 2, math.hypot, pure=True)
+    monkeypatch.setitem(native.natives(), "hypot", hypot)
+    script = "fun f() { var h = hypot(3, 4); return h * 2; }\nprint f();"
+    output, errors, statements = run(script, True)
+    assert (output, errors) == ("10\n", "")
+    assert [call.callee.name.lexeme for call in _nodes(statements, Call)] == ["f"]
+    assert 5.0 in [literal.value for literal in _nodes(statements, Literal)]
+
+    # not when the program assigns the name
+    _, _, statements = run("hypot = nil;\n" + script, True)
+    assert [call.callee.name.lexeme for call in _nodes(statements, Call)] == ["hypot", "f"]
@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from pylox import error, lox, parallel
+from pylox.budget import Budget
+from pylox.interpreter import Interpreter
+
+SCRIPT = """
+var k = 100;
+fun helper(x) { return x * 2; }
+class Box { init(v) { this.v = v; } }
+fun f(i) { return helper(i) + k + Box(i).v; }
+print pmap(f, 10);
+print arraySum(pmap(f, 1000));
+fun adder(n) { fun add(i) { return i + n; } return add; }
+print pmap(adder(0.5), 4);
+fun show(i) { print "item"; print i; }
+parallelFor(show, 12);
+print pmap(f, 0);
+"""
+
+FAILING = """
+fun bad(i) {
+  if (i == 37) return nil + 1;
+  print i;
+  return i;
+}
+print "before";
+print pmap(bad, 100);
+print "not reached";
+"""
+
+
+def run(script: str, serial: bool) -> tuple[str, str]:
+    # under a budget the calls run in this process, one after another
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO(), budget=Budget() if serial else None)
+    lox.run(script, interpreter)
+    return interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+def test_results_and_output_order_match_a_serial_run():
+    expected = run(SCRIPT, True)
+    assert expected[0].startswith("[100, 103, 106, 109, 112, 115, 118, 121, 124, 127]\n1598500\n[0.5, 1.5, 2.5, 3.5]\n")
+    assert expected[1] == ""
+    assert run(SCRIPT, False) == expected
+    # the calls went to worker processes
+    assert parallel._executor is not None and parallel._executor._processes
+
+
+def test_errors_propagate_like_a_serial_run():
+    expected = run(FAILING, True)
+    assert expected[1] == "[line 3] Operands must be two numbers or two strings.\n"
+    assert expected[0] == "before\n" + "".join(f"{i}\n" for i in range(37))
+    assert run(FAILING, False) == expected
+
+
+@pytest.mark.parametrize(
+    "script, message",
+    [
+        ("fun s(i) { return \"x\"; }\npmap(s, 3);", "pmap results must be numbers."),
+        ("fun two(a, b) { return a; }\npmap(two, 3);", "'pmap' expects a function taking one argument."),
+        ("parallelFor(1, 3);", "'parallelFor' expects a function taking one argument."),
+        ("fun one(i) { return i; }\npmap(one, -1);", "Count must be a non-negative integer."),
+        ("fun one(i) { return i; }\npmap(one, 1.5);", "Count must be a non-negative integer."),
+    ],
+)
+def test_argument_errors(script, message):
+    line = script.count("\n") + 1
+    for serial in (True, False):
+        assert run(script, serial) == ("", f"[line {line}] {message}\n")
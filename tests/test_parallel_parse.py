@@ -0,0 +1,86 @@
+import io
+import os
+
+import pytest
+
+from pylox import error, lox, parallel, parallel_parse
+from pylox.expr import Expr, Stmt
+from pylox.interpreter import Interpreter
+
+
+def _script(count: int) -> str:
+    parts = []
+    for k in range(count):
+        parts.append(
+            f"// declaration {k}\n"
+            f"fun f{k}(n) {{\n"
+            f'  var s = "line one\n  line two {{ ;";\n'
+            f"  if (n > 0) return n + {k}; else return 0;\n"
+            f"}}\n"
+            f"class C{k} {{ m() {{ return this.x; }} init() {{ this.x = {k}; }} }}\n"
+            f"var v{k} = f{k}(1) + C{k}().m();\n"
+            f"{{ var local = v{k}; print local; }}\n"
+        )
+    return "".join(parts)
+
+
+SCRIPT = _script(60) + "print missing;\n"
+
+
+@pytest.fixture
+def pieces(monkeypatch):
+    # small pieces, over a few workers, even on one core
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(parallel_parse, "_MIN_PIECE", 500)
+
+
+def _dump(node: object, locals_: dict, out: list) -> list:
+    # the tokens of the tree with their lines, and each resolved depth
+    if isinstance(node, list):
+        for item in node:
+            _dump(item, locals_, out)
+    elif isinstance(node, (Expr, Stmt)):
+        out.append((type(node).__name__, locals_.get(node)))
+        for value in vars(node).values():
+            _dump(value, locals_, out)
+    elif hasattr(node, "lexeme"):
+        out.append((node.type.name, node.lexeme, node.line))
+    return out
+
+
+def run(script: str, parallel_: bool) -> tuple:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    statements = lox.prepare(script, interpreter, parallel=parallel_)
+    if statements is None:
+        return None, "", stderr.getvalue()
+    tree = _dump(statements, interpreter.locals_, [])
+    interpreter.interpret(statements)
+    return tree, interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+def test_pieces_tile_the_script(pieces):
+    cut = parallel_parse._pieces(SCRIPT, 8)
+    assert len(cut) > 2
+    assert [start for start, _, _ in cut[1:]] == [end for _, end, _ in cut[:-1]]
+    assert cut[-1][1] == len(SCRIPT)
+    for start, _, line in cut:
+        assert line == 1 + SCRIPT.count("\n", 0, start)
+
+
+def test_matches_the_serial_parse(pieces):
+    expected = run(SCRIPT, False)
+    assert expected[2] == f"[line {SCRIPT.count(chr(10))}] Undefined variable 'missing'.\n"
+    assert run(SCRIPT, True) == expected
+    # the pieces went to worker processes
+    assert parallel._executor is not None and parallel._executor._processes
+
+
+@pytest.mark.parametrize("broken", ["fun (", "var = 1;", '"unclosed', "}", "class { }"])
+def test_errors_match_the_serial_parse(pieces, broken):
+    middle = SCRIPT.index("// declaration 30")
+    script = SCRIPT[:middle] + broken + "\n" + SCRIPT[middle:]
+    expected = run(script, False)
+    assert expected[2] != ""
+    assert run(script, True) == expected
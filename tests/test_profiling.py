@@ -0,0 +1,72 @@
+import io
+
+from pylox import error, lox
+from pylox.expr import Binary, Call, Logical
+from pylox.profiling import ProfiledInterpreter, ProfilingInterpreter, _Sites, profiled_interpreter
+
+SCRIPT = """
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+fun g(x) { return x; }
+fun count(n) {
+    var c = 0;
+    for (var i = 0; i < n; i = i + 1) {
+        if (i > 5 and i == 7) c = c + 1;
+        if (g(i) > 5 and i == 7) c = c + 10;
+    }
+    return c;
+}
+print fib(15);
+print count(500);
+"""
+
+
+def _run(path, script: str = SCRIPT):
+    # one profile-guided run: the interpreter, what it printed and the tree
+    # it ran
+    error.reset(io.StringIO())
+    interpreter = profiled_interpreter(str(path), script, False, True)
+    interpreter.stdout = io.StringIO()
+    statements = lox.prepare(script, interpreter, False, True)
+    interpreter.interpret(statements)
+    return interpreter, interpreter.stdout.getvalue(), statements
+
+
+def _nodes(statements, kind: type) -> list:
+    sites = _Sites()
+    sites.number(statements)
+    return [node for node in sites.nodes if type(node) is kind]
+
+
+def test_recorded_profile_is_applied_on_later_runs(tmp_path):
+    path = tmp_path / "script.lox"
+    path.write_text(SCRIPT)
+    first, expected, _ = _run(path)
+    assert type(first) is ProfilingInterpreter
+    assert expected == "610\n11\n"
+    for _ in range(2):
+        later, output, _ = _run(path)
+        assert type(later) is ProfiledInterpreter
+        assert output == expected
+
+
+def test_monomorphic_call_sites_get_their_target(tmp_path):
+    path = tmp_path / "script.lox"
+    path.write_text(SCRIPT)
+    _run(path)
+    _, _, statements = _run(path)
+    fib = statements[0]
+    targets = {call.callee.name.lexeme: call.target for call in _nodes(statements, Call)}
+    assert targets["fib"] is fib
+    assert targets["g"] is statements[1]
+
+
+def test_conditions_run_the_deciding_operand_first(tmp_path):
+    path = tmp_path / "script.lox"
+    path.write_text(SCRIPT)
+    _run(path)
+    _, _, statements = _run(path)
+    pure, calling = _nodes(statements, Logical)[:2]
+    # `i == 7` is false far more often than `i > 5`, and both are pure
+    assert (pure.left.operator.lexeme, pure.right.operator.lexeme) == ("==", ">")
+    # g(i) might have an effect, so its condition keeps its order
+    assert type(calling.left) is Binary and type(calling.left.left) is Call
@@ -0,0 +1,106 @@
+import glob
+import io
+import os
+
+import pytest
+
+from pylox import error
+from pylox.expr import Expr, Stmt
+from pylox.parser import Parser
+from pylox.resolver import Resolver
+from pylox.scanner import Scanner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    "var a = 1; { var a = a; }",
+    "{ var a = 1; var a = 2; }",
+    "return 1;",
+    "print this;",
+    "fun f() { return this; }",
+    "class A { f() { return super.f(); } }",
+    "print super.x;",
+    "class A < A {}",
+    "class A { init() { return 1; } }",
+    "class A { init() { return; } }",
+    "fun outer() { var x = 1; fun inner() { x = x + 1; return x; } return inner; }",
+    "class A { f() { return 1; } } class B < A { f() { var g = super.f; return g() + this.y; } }",
+    "{ var x; { var y = x; fun h(p) { { return p + y + x + z; } } } }",
+    "for (var i = 0; i < 3; i = i + 1) { var j = i; print j; }",
+    "var g = 1; fun f() { g = 2; undefined = 3; return g; }",
+]
+
+
+class _Resolutions:
+    # what a resolver told the interpreter, by node
+
+    def __init__(self):
+        self.depths = {}
+
+    def resolve(self, expr: Expr, depth: int) -> None:
+        self.depths[expr] = depth
+
+    def resolve_global(self, expr: Expr, name) -> None:
+        self.depths[expr] = "global " + name.lexeme
+
+
+def _walk(node: object, depths: dict, out: list) -> list:
+    # each resolved node's depth, in tree order
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, depths, out)
+    elif isinstance(node, (Expr, Stmt)):
+        if node in depths:
+            out.append((type(node).__name__, depths[node]))
+        for value in vars(node).values():
+            _walk(value, depths, out)
+    return out
+
+
+def _resolve(source: str, single_pass: bool) -> tuple[list, str]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    resolutions = _Resolutions()
+    tokens = Scanner(source).scan_tokens()
+    if single_pass:
+        statements = Parser(tokens, Resolver(resolutions)).parse()
+    else:
+        statements = Parser(tokens).parse()
+        Resolver(resolutions).resolve(statements)
+    return _walk(statements, resolutions.depths, []), stderr.getvalue()
+
+
+def _sources() -> list[str]:
+    sources = list(CASES)
+    for path in sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))):
+        with open(path) as f:
+            sources.append(f.read())
+    return sources
+
+
+@pytest.mark.parametrize("source", _sources())
+def test_single_pass_matches_separate_pass(source):
+    assert _resolve(source, True) == _resolve(source, False)
+
+
+def test_resolution_errors():
+    messages = [_resolve(source, True)[1] for source in CASES[:9]]
+    assert messages == [
+        "[line 1] Error  at a: Can't read local variable in its own initializer.\n",
+        # redeclaring a local, and returning from the top level, are allowed
+        "",
+        "",
+        "[line 1] Error  at this: Can't use 'this' outside of a class.\n",
+        "[line 1] Error  at this: Can't use 'this' outside of a class.\n",
+        "[line 1] Error  at super: Can't use 'super' in a class with no superclass.\n",
+        "[line 1] Error  at super: Can't use 'super' outside of a class.\n",
+        "[line 1] Error  at A: A class can't inherit from itself.\n",
+        "[line 1] Error  at return: Can't return a value from an initializer.\n",
+    ]
+
+
+def test_depths():
+    depths, errors = _resolve(CASES[10], True)
+    assert errors == ""
+    # x in inner is one function scope out; inner itself is in outer's
+    assert depths == [("Assign", 1), ("Variable", 1), ("Variable", 1), ("Variable", 0)]
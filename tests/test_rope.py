@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pylox.rope import ROPE_THRESHOLD, Rope, concat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LONG = "x" * ROPE_THRESHOLD
+
+
+def test_short_results_stay_strings():
+    assert type(concat("a", "b")) is str
+    assert type(concat(LONG, "b")) is Rope
+    assert type(concat("a", Rope([LONG]))) is Rope
+
+
+def test_appends_from_an_older_rope_do_not_see_newer_ones():
+    base = concat(LONG, "a")
+    first = concat(base, "b")
+    second = concat(base, "c")
+    longer = concat(first, "d")
+    assert (str(base), str(first), str(second), str(longer)) == (
+        LONG + "a",
+        LONG + "ab",
+        LONG + "ac",
+        LONG + "abd",
+    )
+    assert len(longer) == len(LONG) + 3
+
+
+def test_ropes_compare_and_hash_as_their_text():
+    rope = concat(concat(LONG, "a"), "b")
+    other = Rope([LONG + "a", "b"])
+    assert rope == LONG + "ab" and LONG + "ab" == rope
+    assert rope == other and hash(rope) == hash(other) == hash(LONG + "ab")
+    assert rope != LONG + "ba"
+    assert rope != 1.0
+    assert "".join(rope.pieces()) == str(rope)
+
+
+SCRIPT = """
+var s = "";
+for (var i = 0; i < 300; i = i + 1) s = s + "ab";
+var t = s + "!";
+var u = s + "?";
+s = s + "#";
+print t;
+print u;
+print s;
+print t == u;
+print t + "" == t;
+var plain = "";
+for (var i = 0; i < 300; i = i + 1) plain = plain + "ab";
+print plain + "!" == t;
+"""
+
+
+@pytest.mark.parametrize("engine", ["tree", "python"])
+def test_scripts_building_long_strings(tmp_path, engine):
+    path = tmp_path / "ropes.lox"
+    path.write_text(SCRIPT)
+    result = subprocess.run(
+        [sys.executable, "-m", "pylox.lox", "--engine", engine, str(path)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    s = "ab" * 300
+    assert result.stdout == f"{s}!\n{s}?\n{s}#\nfalse\ntrue\ntrue\n"
+    assert result.stderr == ""
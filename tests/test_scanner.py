@@ -0,0 +1,86 @@
+import glob
+import os
+import pickle
+
+import pytest
+
+from pylox.scanner import Scanner
+from pylox.token import SourceToken, Token
+from pylox.token_type import TokenType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MULTI_LINE = (
+    'var s = "a\nb\nc";\n'
+    "// a comment\n"
+    'print "x\n\ny" + 12.5;\n'
+    '{ print "one"; print 3; }\n'
+    'print "z\n" + s;\n'
+)
+
+
+def _sources() -> list[str]:
+    sources = [MULTI_LINE]
+    for path in sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))):
+        with open(path) as f:
+            sources.append(f.read())
+    return sources
+
+
+def _tokens(source: str, line: int = 1) -> list[tuple]:
+    scanner = Scanner(source)
+    scanner.line = line
+    return [(token.type, token.lexeme, token.literal, token.line) for token in scanner.scan_tokens()]
+
+
+def test_multi_line_string_tokens():
+    tokens = Scanner(MULTI_LINE).scan_tokens()
+    literals = [token for token in tokens if token.type in (TokenType.STRING, TokenType.NUMBER)]
+    # single digits keep a plain lexeme
+    assert [type(token) for token in literals] == [SourceToken] * 4 + [Token, SourceToken]
+    assert [(token.lexeme, token.line) for token in literals] == [
+        ('"a\nb\nc"', 3),
+        ('"x\n\ny"', 7),
+        ("12.5", 7),
+        ('"one"', 8),
+        ("3", 8),
+        ('"z\n"', 10),
+    ]
+
+
+@pytest.mark.parametrize("source", _sources())
+def test_lexemes_are_the_source_text(source):
+    # each lexeme is the next piece of the source, and the token's line is
+    # the one its text ends on
+    position = 0
+    for type, lexeme, _, line in _tokens(source)[:-1]:
+        position = source.index(lexeme, position) + len(lexeme)
+        assert line == 1 + source.count("\n", 0, position), (type, lexeme)
+
+
+@pytest.mark.parametrize("source", _sources())
+def test_pieces_scanned_from_a_later_line(source):
+    # parallel_parse scans a script in pieces split at line ends, each
+    # starting at the line its piece does
+    lines = source.splitlines(keepends=True)
+    whole = _tokens(source)[:-1]
+    for cut in range(1, len(lines)):
+        head, tail = "".join(lines[:cut]), "".join(lines[cut:])
+        if head.count('"') % 2:
+            # the cut falls inside a string
+            continue
+        pieces = _tokens(head)[:-1] + _tokens(tail, cut + 1)[:-1]
+        assert pieces == whole, cut
+
+
+def test_literal_tokens_pickle_with_their_lexeme():
+    for token in Scanner(MULTI_LINE).scan_tokens():
+        copy = pickle.loads(pickle.dumps(token))
+        assert type(copy) is Token
+        assert (copy.type, copy.lexeme, copy.literal, copy.line) == (
+            token.type,
+            token.lexeme,
+            token.literal,
+            token.line,
+        )
+    assert token.type is TokenType.EOF
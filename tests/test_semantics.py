@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(tmp_path, source: str) -> tuple[str, str, int]:
+    # stdout, stderr and exit code of `pylox script.lox`
+    script = tmp_path / "script.lox"
+    script.write_text(source)
+    result = subprocess.run(
+        [sys.executable, "-m", "pylox.lox", str(script)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout, result.stderr, result.returncode
+
+
+def test_and_returns_left_operand(tmp_path):
+    source = "print nil and 1; print false and 1; print true and 1; print 1 and 2;"
+    assert _run(tmp_path, source) == ("nil\nfalse\n1\n2\n", "", 0)
+
+
+def test_booleans_print_as_lox_literals(tmp_path):
+    source = "print true; print false; print 1 < 2; print !nil;"
+    assert _run(tmp_path, source) == ("true\nfalse\ntrue\ntrue\n", "", 0)
+
+
+@pytest.mark.parametrize("source, message", [
+    ('print -"a";', "Operand must be a number."),
+    ("print -true;", "Operand must be a number."),
+    ('print "a" - 1;', "Operands must be numbers."),
+    ("print nil - 1;", "Operands must be numbers."),
+    ('print 1 - "a";', "Operands must be numbers."),
+])
+def test_minus_checks_operands(tmp_path, source, message):
+    assert _run(tmp_path, source) == ("", f"[line 1] {message}\n", 70)
+
+
+def test_division_by_zero_follows_ieee(tmp_path):
+    source = "print 1 / 0; print -1 / 0; print 0 / 0; print 1 / -0;"
+    assert _run(tmp_path, source) == ("inf\n-inf\nnan\n-inf\n", "", 0)
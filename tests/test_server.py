@@ -0,0 +1,68 @@
+import glob
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pylox.client import NO_SERVER, run_remote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ERRORS = [
+    "print 1 +;",
+    'var a = 1;\nprint a + "x";',
+    "fun f(n) { return n; }\nprint f(1, 2);",
+]
+
+
+def _pylox(*argv: str) -> tuple[str, str, int]:
+    result = subprocess.run(
+        [sys.executable, "-m", "pylox.lox", *argv],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout, result.stderr, result.returncode
+
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / "pylox.sock")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "pylox.lox", "serve", "--socket", socket_path],
+        cwd=ROOT,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(socket_path):
+            assert process.poll() is None and time.monotonic() < deadline, "server did not start"
+            time.sleep(0.05)
+        yield socket_path
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def test_server_runs_scripts_like_the_cli(server, tmp_path):
+    scripts = sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox")))
+    for k, source in enumerate(ERRORS):
+        path = tmp_path / f"error{k}.lox"
+        path.write_text(source)
+        scripts.append(str(path))
+
+    for script in scripts:
+        assert _pylox("run", "--server", "--socket", server, script) == _pylox(script), script
+
+
+def test_no_server(tmp_path, capsys):
+    script = tmp_path / "script.lox"
+    script.write_text("print 1;")
+    socket_path = str(tmp_path / "missing.sock")
+    assert run_remote(str(script), socket_path) == NO_SERVER
+    assert capsys.readouterr().err == (
+        f"No pylox server is listening on {socket_path} (start one with `pylox serve`).\n"
+    )
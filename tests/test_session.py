@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from pylox import error
+from pylox.interpreter import Interpreter
+from pylox.session import Session
+
+
+@pytest.fixture
+def stderr():
+    stream = io.StringIO()
+    error.reset(stream)
+    return stream
+
+
+def _session() -> Session:
+    return Session(Interpreter(stdout=io.StringIO()))
+
+
+def _print(session: Session, expression: str) -> str:
+    # what printing the expression in the session gives
+    output = session.interpreter.stdout = io.StringIO()
+    session.run(f"print {expression};")
+    return output.getvalue()
+
+
+def test_definitions_persist_across_runs(stderr):
+    session = _session()
+    assert session.run("var count = 1;")
+    assert session.run("fun bump() { count = count + 1; return count; }")
+    assert session.run("class C { init(n) { this.n = n; } }")
+    assert _print(session, "bump() + C(10).n") == "12\n"
+    assert _print(session, "count") == "2\n"
+    assert stderr.getvalue() == ""
+
+
+def test_errors_are_reported_per_run(stderr):
+    session = _session()
+    assert not session.run("print missing;")
+    assert not session.run("var = 1;")
+    assert session.run("var ok = 1;")
+    assert stderr.getvalue() == "[line 1] Undefined variable 'missing'.\n[line 1] Error  at =: Expect variable name.\n"
+
+
+def test_restore_rolls_back_globals(stderr):
+    session = _session()
+    session.run("var a = 1; fun f() { return a; }")
+    snapshot = session.snapshot()
+    session.run("a = 2; var b = 3; fun f() { return -a; }")
+    assert _print(session, "f() + b") == "1\n"
+
+    session.restore(snapshot)
+    assert _print(session, "f()") == "1\n"
+    assert not session.run("print b;")
+    # the snapshot is left as it was by the writes after restoring it
+    session.run("a = 5;")
+    session.restore(snapshot)
+    assert _print(session, "a") == "1\n"
+    assert stderr.getvalue() == "[line 1] Undefined variable 'b'.\n"
+
+
+def test_forks_are_isolated(stderr):
+    parent = _session()
+    parent.run("var count = 0; fun bump() { count = count + 1; return count; }")
+    fork = parent.fork()
+    fork.interpreter.stdout = io.StringIO()
+
+    # functions defined before the fork update the globals of the session
+    # calling them
+    assert _print(fork, "bump() + bump()") == "3\n"
+    assert _print(parent, "count") == "0\n"
+    assert _print(parent, "bump()") == "1\n"
+    assert _print(fork, "count") == "2\n"
+
+    fork.run("var only = 1;")
+    assert not parent.run("print only;")
+    parent.run("var mine = 2;")
+    assert not fork.run("print mine;")
+    assert stderr.getvalue() == "[line 1] Undefined variable 'only'.\n[line 1] Undefined variable 'mine'.\n"
@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules a plain tree-walk run of a script must not load
+HEAVY = ("pylox.transpiler", "pylox.optimizer", "numpy", "multiprocessing", "argparse")
+# milliseconds all imports of such a run may take, interpreter startup
+# included (about 40 when measured)
+IMPORT_BUDGET = 100
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)")
+
+
+def _imports() -> dict[str, int]:
+    # microseconds each module took to import, from -X importtime
+    env = dict(os.environ)
+    # the first run writes the .pyc files the next ones load
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "pylox.lox", os.path.join("samples", "var.lox")],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {match.group(2): int(match.group(1)) for match in _LINE.finditer(result.stderr)}
+
+
+def test_plain_run_skips_heavy_modules():
+    imported = _imports()
+    assert "pylox.interpreter" in imported
+    assert [name for name in imported if name in HEAVY or name.split(".")[0] in HEAVY] == []
+
+
+def test_plain_run_import_budget():
+    # the best of a few runs, as the first writes bytecode
+    total = min(sum(_imports().values()) for _ in range(3)) / 1000
+    assert total < IMPORT_BUDGET, f"imports took {total:.1f}ms"
+
+
+# runs a script with every pass requested, printing which passes' modules
+# got imported
+_PASSES = """
+import sys
+from pylox import lox
+from pylox.interpreter import Interpreter
+lox.run(sys.argv[1], Interpreter(), True, True)
+print(sorted(name for name in ("pylox.optimizer", "pylox.inliner") if name in sys.modules))
+"""
+
+
+def _passes_loaded(script: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", _PASSES, script], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+
+def test_straight_line_script_skips_the_passes():
+    # the keywords in strings, names and comments are not loops
+    script = 'var whiley = "for fun"; // class\nif (whiley) { print whiley; }'
+    assert _passes_loaded(script) == "for fun\n[]\n"
+
+
+def test_repeating_script_runs_the_passes():
+    for script in ("if (true) { fun f() {} }", "{ class A {} }", "for (;false;) {}"):
+        assert _passes_loaded(script) == "['pylox.inliner', 'pylox.optimizer']\n", script
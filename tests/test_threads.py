@@ -0,0 +1,120 @@
+import glob
+import io
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pylox import error, lox
+from pylox.interpreter import Interpreter
+from pylox.session import Session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scripts that loop long enough to overlap, each failing with an error that
+# names it
+WORKLOADS = [
+    f"""
+    fun work(n) {{
+        var total = 0;
+        for (var i = 0; i < n; i = i + 1) total = total + i * {k};
+        return total;
+    }}
+    print "script {k}";
+    print work(3000);
+    print missing{k};
+    """
+    for k in range(6)
+]
+
+
+def _scripts() -> list[str]:
+    scripts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox"))):
+        with open(path) as f:
+            scripts.append(f.read())
+    return (scripts + WORKLOADS)[:16]
+
+
+def _run(script: str) -> tuple[str, str]:
+    # what the script printed, and the errors it reported
+    stdout, stderr = io.StringIO(), io.StringIO()
+    error.reset(stderr)
+    lox.run(script, Interpreter(stdout=stdout))
+    return stdout.getvalue(), stderr.getvalue()
+
+
+def test_scripts_on_concurrent_threads():
+    scripts = _scripts()
+    assert len(scripts) == 16
+    expected = [_run(script) for script in scripts]
+
+    results = [None] * len(scripts)
+    start = threading.Barrier(len(scripts))
+
+    def worker(i: int) -> None:
+        start.wait()
+        # a few runs each, so the threads' runs interleave
+        for _ in range(3):
+            results[i] = _run(scripts[i])
+            if results[i] != expected[i]:
+                return
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(scripts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == expected
+    # every workload reported its own error, and only its own
+    for k in range(len(WORKLOADS)):
+        _, stderr = results[len(scripts) - len(WORKLOADS) + k]
+        assert stderr == f"[line 9] Undefined variable 'missing{k}'.\n"
+
+
+def test_pooled_thread_runs_after_failing_script(capsys):
+    # no error.reset between scripts: run() must not inherit the compile
+    # error the first script left on the pool's only thread
+    scripts = ["print 1 +;", "print 2;", "print 3;"]
+
+    def run(script: str) -> str:
+        stdout = io.StringIO()
+        lox.run(script, Interpreter(stdout=stdout))
+        return stdout.getvalue()
+
+    with ThreadPoolExecutor(1) as pool:
+        assert list(pool.map(run, scripts)) == ["", "2\n", "3\n"]
+    assert capsys.readouterr().err == "[line 1] Error  at ;: Expect expression.\n"
+
+
+def test_forked_sessions_share_functions_across_threads():
+    # the forks share f, and with it the pool of environments its calls
+    # take from; threads switching as often as possible interleave them
+    session = Session()
+    assert session.run("fun f(n) { if (n < 1) return 0; return f(n - 1) + 1; }")
+    forks = [session.fork() for _ in range(8)]
+    outputs = []
+    for fork in forks:
+        # keep f tree-walked, so every call uses the pool
+        fork.interpreter.tiering.call_threshold = math.inf
+        fork.interpreter.stdout = io.StringIO()
+        outputs.append(fork.interpreter.stdout)
+
+    def worker(fork: Session) -> None:
+        for _ in range(50):
+            fork.run("print f(30);")
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(fork,)) for fork in forks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert [output.getvalue() for output in outputs] == ["30\n" * 50] * len(forks)
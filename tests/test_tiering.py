@@ -0,0 +1,74 @@
+import io
+import math
+
+import pytest
+
+from pylox import error, lox
+from pylox.interpreter import Interpreter
+from pylox.tiering import Tiering
+
+SCRIPT = """
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+fun counter() { var c = 0; fun inc() { c = c + 1; return c; } return inc; }
+fun sum(n) { var t = 0; for (var i = 0; i < n; i = i + 1) t = t + i; return t; }
+class P { init(x) { this.x = x; } get() { return this.x; } }
+fun make(n) { return P(n).get(); }
+var inc;
+for (var i = 0; i < 3; i = i + 1) inc = counter();
+for (var i = 0; i < 5; i = i + 1) inc();
+print fib(12);
+print inc();
+print sum(50) + sum(50);
+for (var i = 0; i < 3; i = i + 1) print make(i);
+fun bad(n) {
+  if (n > 3) return n + "x";
+  return n;
+}
+for (var i = 0; i < 5; i = i + 1) print bad(i);
+"""
+
+
+def run(script: str, tiering: Tiering, inline: bool = False) -> tuple[str, str]:
+    stderr = io.StringIO()
+    error.reset(stderr)
+    interpreter = Interpreter(stdout=io.StringIO())
+    interpreter.tiering = tiering
+    lox.run(script, interpreter, inline)
+    return interpreter.stdout.getvalue(), stderr.getvalue()
+
+
+@pytest.mark.parametrize("inline", [False, True])
+def test_promoted_functions_run_as_tree_walked(inline):
+    expected = run(SCRIPT, Tiering(math.inf, math.inf), inline)
+    assert expected[1] == "[line 15] Operands must be two numbers or two strings.\n"
+    for calls, loops in ((1, 1), (2, 10), (math.inf, 10)):
+        assert run(SCRIPT, Tiering(calls, loops), inline) == expected, (calls, loops)
+
+
+def test_tier_log():
+    tiering = Tiering(2, 10)
+    run(SCRIPT, tiering)
+    log = {transition.name: transition for transition in tiering.log}
+    assert str(log["fib"]) == "[line 2] fib: tree -> python after 2 calls, 0 loop iterations"
+    assert str(log["counter"]) == (
+        "[line 3] counter: tree -> tree after 2 calls, 0 loop iterations (declares nested function 'inc')"
+    )
+    assert str(log["bad"]) == "[line 14] bad: tree -> python after 2 calls, 0 loop iterations"
+
+
+def test_loops_promote_on_the_next_call():
+    script = (
+        "fun sum(n) { var t = 0; for (var i = 0; i < n; i = i + 1) t = t + i; return t; }\n"
+        "print sum(50);\nprint sum(5);\nprint sum(50);"
+    )
+    tiering = Tiering(math.inf, 10)
+    assert run(script, tiering) == ("1225\n10\n1225\n", "")
+    assert [str(transition) for transition in tiering.log] == [
+        "[line 1] sum: tree -> python after 2 calls, 50 loop iterations"
+    ]
+
+
+def test_no_promotion_at_infinite_thresholds():
+    tiering = Tiering(math.inf, math.inf)
+    run(SCRIPT, tiering)
+    assert tiering.log == []
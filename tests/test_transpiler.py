@@ -0,0 +1,46 @@
+import glob
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ERRORS = [
+    "print 1 +;",
+    "var a = 1;\nprint a + \"x\";",
+    "fun f(n) { return n; }\nprint f(1, 2);",
+    "print 1;\nprint undefinedName;",
+    "print -\"a\";",
+    "var x = 1;\nx();",
+    "fun f(n) {\n  if (n > 3) return n * nil;\n  return f(n + 1);\n}\nprint f(0);",
+    "fun f(n) { return f(n + 1); }\nf(0);",
+    "var s = \"a\";\nwhile (true) { s = s + 1; }",
+    "print 1 / 0;\nprint -1 / 0;\nprint 0 / 0 == 0 / 0;\nprint true and 2;\nprint nil or false;",
+]
+
+
+def _scripts(tmp_path) -> list[str]:
+    scripts = sorted(glob.glob(os.path.join(ROOT, "samples", "*.lox")))
+    for k, source in enumerate(ERRORS):
+        path = tmp_path / f"error{k}.lox"
+        path.write_text(source)
+        scripts.append(str(path))
+    return scripts
+
+
+def _pylox(*argv: str) -> tuple[str, str, int]:
+    result = subprocess.run(
+        [sys.executable, "-m", "pylox.lox", *argv],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout, result.stderr, result.returncode
+
+
+@pytest.mark.parametrize("flags", [(), ("--no-optimize", "--no-inline")])
+def test_python_engine_matches_the_tree_walker(tmp_path, flags):
+    for script in _scripts(tmp_path):
+        assert _pylox("--engine", "python", *flags, script) == _pylox(*flags, script), script